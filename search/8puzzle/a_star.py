@@ -1,76 +1,177 @@
 """A*探索"""
-import heapq
-from functools import partial
-from time import time
-from typing import Callable
+from math import ceil
+from time import perf_counter
+from typing import Callable, Optional
 
 from graphviz import Digraph
 
-from base import Action, Seq, State
+from base import Action, ManhattanDistance, SearchResult, Seq, State, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import SearchMetrics, SearchObserver, report
+from common.priority_queue import HeapQueue, PriorityQueue
+from render import render_trace
+from search_trace import Trace
 
 
-def a_star(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int], show_all: bool = False) -> Digraph:
-    """A*探索
+def a_star_search(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int], graph_search: bool = False,
+                  trace: Optional[Trace] = None, budget: Optional[Budget] = None,
+                  queue_factory: Callable[[], PriorityQueue] = HeapQueue, weight: float = 1,
+                  metrics: Optional[SearchMetrics] = None,
+                  observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """A*探索の本体
+
+    `weight`が1より大きい場合は優先度をg+weight*hとする重み付きA*探索となり，
+    許容的なヒューリスティック関数なら解の経路コストは最適な経路コストの`weight`倍以下となる．
 
     Args:
         initial_state (State): 初期状態
         goal_seq (Seq): 目標状態の盤面
-        heuristic (Callable[[State], int]): ヒューリスティック関数
-        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+        heuristic (Callable[[State], int]): ヒューリスティック関数．
+            `delta(state, child)`を持つ場合（`ManhattanDistance`など）は子の値を親の値との差分で求める．
+        graph_search (bool, optional): 盤面ごとに最良のgのみを保持するグラフ探索とするか否か．
+            より小さいgで再び現れた盤面は再展開する. Defaults to False.
+        trace (Optional[Trace], optional): 与えられた場合は取り出した状態と展開した順番を記録する. Defaults to None.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        queue_factory (Callable[[], PriorityQueue], optional): 辺境に用いる優先度付きキューを作る関数．
+            `BucketQueue`はfごとのバケットで比較なしに出し入れする（重みが整数の場合のみ）. Defaults to HeapQueue.
+        weight (float, optional): ヒューリスティック関数の重み. Defaults to 1.
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は展開と生成ごとに呼ぶ観測者. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
 
     Returns:
-        Digraph: グラフ(graphviz)
+        tuple[State, int]: 目標状態と展開回数
     """
-    def f(state: State) -> int:
-        return state.depth+heuristic(state)
+    check_solvable(initial_state, goal_seq)
+    delta = getattr(heuristic, 'delta', None)  # 差分で評価する関数
 
-    start_time = time()
+    goal_board = pack_seq(goal_seq)  # 整数に詰めた目標状態の盤面
 
-    # 状態とfの値のタプルをキューに追加
-    q = [(f(initial_state), initial_state)]
-    heapq.heapify(q)
+    # 状態をfの値を優先度としてキューに追加
+    initial_state.h = heuristic(initial_state)
+    q = queue_factory()
+    q.push(initial_state.h if weight == 1 else weight*initial_state.h, initial_state, 0)
+    best_g: dict[int, int] = {initial_state.board: 0}  # グラフ探索で用いる盤面ごとの最良のg
+    best_state = initial_state  # 打ち切った場合に返すヒューリスティック関数の値が最小の状態
+    if metrics is not None:
+        metrics.start_counting()
 
     extension_count = 0  # 展開した回数
-    state_dict: dict[str, tuple(State, int)] = {}  # 可視化のために状態を記録する辞書
     while True:
-        _h, state = heapq.heappop(q)  # fが最小の状態を取り出す
-        state_dict[state.name] = (state, extension_count)
-        if state.seq == goal_seq:
+        _f, state = q.pop()  # fが最小の状態を取り出す
+        if graph_search and state.depth > best_g[state.board]:
+            # より良い経路で既に現れた盤面なので読み飛ばす
+            if metrics is not None:
+                metrics.duplicates += 1
+            continue
+        if trace is not None:
+            trace.add(state, extension_count)
+        if observer is not None:
+            observer.on_expand(state, extension_count)
+        if state.board == goal_board:
             # 目標状態に到達したのでループを抜ける
-            break
+            if trace is not None:
+                trace.goal_id = state.trace_id
+            return state, extension_count
+        if state.h < best_state.h:
+            best_state = state
+        if budget is not None:
+            reason = budget.exceeded(extension_count, len(q))
+            if reason is not None:
+                # 許容的なヒューリスティック関数ならキューのfの最小値は最適な経路コストの下界
+                raise SearchStopped(reason, extension_count, best_state,
+                                    state.depth+state.h if weight == 1 else None)
         # 子ノードをキューに追加する
         children = state.extend()
+        pushed = 0  # キューに追加した子の数
         for child in children:
-            heapq.heappush(q, (f(child), child))
+            if observer is not None:
+                observer.on_generate(child, state)
+            if graph_search:
+                if best_g.get(child.board, child.depth+1) <= child.depth:
+                    continue
+                best_g[child.board] = child.depth
+            child.h = heuristic(child) if delta is None else state.h+delta(state, child)
+            q.push(child.depth+child.h if weight == 1 else child.depth+weight*child.h,
+                   child, child.depth)
+            pushed += 1
+        if metrics is not None:
+            metrics.generations += len(children)
+            metrics.duplicates += len(children)-pushed
+            metrics.max_frontier = max(metrics.max_frontier, len(q))
         extension_count += 1
 
-    end_time = time()
-    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
-    print(f"展開回数:\t{extension_count}")
-    print(f"解の経路コスト:\t{state.depth}")
+
+def a_star_solve(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                 graph_search: bool = True, trace: bool = False, budget: Optional[Budget] = None,
+                 queue_factory: Callable[[], PriorityQueue] = HeapQueue, weight: float = 1,
+                 observer: Optional[SearchObserver[State]] = None) -> SearchResult:
+    """A*探索で解を求める（表示や可視化をしない）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): ヒューリスティック関数
+        graph_search (bool, optional): グラフ探索とするか否か. Defaults to True.
+        trace (bool, optional): 探索の過程を記録するか否か. Defaults to False.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        queue_factory (Callable[[], PriorityQueue], optional): 辺境に用いる優先度付きキューを作る関数.
+            Defaults to HeapQueue.
+        weight (float, optional): ヒューリスティック関数の重み．1より大きい場合は重み付きA*探索とし，
+            解の経路コストを重みで割った値を`lower_bound`とする. Defaults to 1.
+        observer (Optional[SearchObserver[State]], optional): 展開と生成ごとに呼ぶ観測者. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    metrics = SearchMetrics()
+    search_trace = Trace(len(goal_seq)) if trace else None
+    if budget is not None:
+        budget.start()
+    try:
+        with metrics.phase('search'):
+            state, extension_count = a_star_search(
+                initial_state, goal_seq, heuristic, graph_search, search_trace, budget, queue_factory, weight,
+                metrics, observer)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time, search_trace, metrics)
+    with metrics.phase('path'):
+        actions = tuple(state.actions())
+    return SearchResult(actions, state.depth, extension_count, perf_counter()-start_time,
+                        search_trace, lower_bound=None if weight == 1 else ceil(state.depth/weight),
+                        metrics=metrics.finish(extension_count))
+
+
+def a_star(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int], show_all: bool = False, graph_search: bool = False,
+           weight: float = 1) -> Digraph:
+    """A*探索
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): ヒューリスティック関数．
+            `delta(state, child)`を持つ場合（`ManhattanDistance`など）は子の値を親の値との差分で求める．
+        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+        graph_search (bool, optional): 盤面ごとに最良のgのみを保持するグラフ探索とするか否か．
+            より小さいgで再び現れた盤面は再展開する. Defaults to False.
+        weight (float, optional): ヒューリスティック関数の重み（1より大きい場合は重み付きA*探索）. Defaults to 1.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    result = a_star_solve(initial_state, goal_seq, heuristic,
+                          graph_search, trace=True, weight=weight)
+    if not result.solved:
+        raise ValueError('目標状態に到達できません')
+
+    report(result.elapsed, result.extension_count, result.cost)
 
     # グラフで可視化する
-    graph = Digraph(name="A*探索")
-    if show_all:
-        # 全てのノードを表示
-        for state, count in state_dict.values():
-            graph.node(state.name, label=state.label(count, f'f={f(state)}<BR/>g={state.depth}<BR/>h={heuristic(state)}'), shape='record',
-                       color=('blue' if state.seq == goal_seq else 'black'))
-            if state.parent is not None:
-                graph.edge(state.parent.name, state.name)
-    else:
-        # 目標状態から初期状態まで遡って表示
-        state_name = state.name
-        while True:
-            state, count = state_dict.get(state_name)
-            graph.node(state.name, label=state.label(
-                count, f'f={f(state)}<BR/>g={state.depth}<BR/>h={heuristic(state)}'), shape='record')
-            if state.parent is None:
-                # 初期状態に到達したのでループを抜ける
-                break
-            graph.edge(state.parent.name, state.name)
-            state_name = state.parent.name
-    return graph
+    return render_trace(result.trace, "A*探索" if weight == 1 else f"重み付きA*探索(w={weight})", show_all,
+                        lambda state: f'f={state.depth+state.h}<BR/>g={state.depth}<BR/>h={state.h}')
 
 
 def heuristic1(state: State, goal_seq: Seq) -> int:
@@ -86,6 +187,5 @@ def heuristic2(state: State, goal_seq: Seq) -> int:
 if __name__ == '__main__':
     initial_state = State((2, 8, 3, 1, 6, 4, 7, 0, 5), 0, Action.NONE, None)
     goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
-    graph = a_star(initial_state, goal_seq, partial(
-        heuristic2, goal_seq=goal_seq), True)
+    graph = a_star(initial_state, goal_seq, ManhattanDistance(goal_seq), True)
     graph.view()
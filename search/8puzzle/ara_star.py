@@ -0,0 +1,180 @@
+"""ARA*探索（Anytime Repairing A*）"""
+import heapq
+import sys
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+
+from base import Action, ManhattanDistance, SearchResult, Seq, State, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import report
+
+
+def ara_star_search(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                    weight: float = 3.0, weight_step: float = 0.5,
+                    budget: Optional[Budget] = None) -> Iterator[tuple[State, int, int]]:
+    """ARA*探索の本体
+
+    重み付きA*探索で最初の解を求めたのち，重みを`weight_step`ずつ下げて探索を繰り返す．
+    閉じた（展開済みの）盤面のgが改善された場合は次の繰り返しまで保留し（INCONS），
+    キューと保留した盤面を引き継ぐことで前回までの探索を再利用する．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): 許容的なヒューリスティック関数．
+            `delta(state, child)`を持つ場合（`ManhattanDistance`など）は子の値を親の値との差分で求める．
+        weight (float, optional): 最初の重み. Defaults to 3.0.
+        weight_step (float, optional): 繰り返しごとに重みを下げる幅. Defaults to 0.5.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と，最初の解が見つかる前に予算を超えた場合
+
+    Yields:
+        Iterator[tuple[State, int, int]]: 解の目標状態，証明された最適な経路コストの下界とそれまでの展開回数．
+            解か下界が改善されたときのみ返す．
+    """
+    check_solvable(initial_state, goal_seq)
+    delta = getattr(heuristic, 'delta', None)  # 差分で評価する関数
+    goal_board = pack_seq(goal_seq)  # 整数に詰めた目標状態の盤面
+
+    initial_state.h = heuristic(initial_state)
+    best_states: dict[int, State] = {initial_state.board: initial_state}  # 盤面ごとに最良のgで現れた状態
+    open_boards: set[int] = {initial_state.board}  # キューにある盤面
+    closed: set[int] = set()  # 今回の繰り返しで展開した盤面
+    incons: set[int] = set()  # 展開済みでgが改善された盤面
+
+    def priority(state: State) -> float:
+        return state.depth+weight*state.h
+
+    def lower_bound_of(boards: set[int], solution: State) -> int:
+        """キューと保留した盤面のg+hの最小値（最適な経路コストの下界）"""
+        return min(min((best_states[board].depth+best_states[board].h for board in boards),
+                       default=solution.depth), solution.depth)
+
+    q = [(priority(initial_state), initial_state)]
+    extension_count = 0  # 展開した回数
+    solution: Optional[State] = None  # 最良の解の目標状態
+    reported = None  # 最後に返した(経路コスト, 下界)
+
+    while True:
+        # 今の重みで解を改善する
+        while q:
+            goal_cost = solution.depth if solution is not None else sys.maxsize
+            if goal_cost <= q[0][0]:
+                break
+            _pr, state = heapq.heappop(q)
+            if best_states[state.board] is not state or state.board in closed:
+                # より良い経路で既に現れた盤面か展開済みの盤面なので読み飛ばす
+                continue
+            open_boards.discard(state.board)
+            closed.add(state.board)
+            if budget is not None:
+                reason = budget.exceeded(extension_count, len(q))
+                if reason is not None:
+                    if solution is None:
+                        raise SearchStopped(reason, extension_count)
+                    # 取り出したが展開していない盤面も下界に含め，この繰り返しで見つけた解を返してから終わる
+                    lower_bound = lower_bound_of(open_boards | incons | {state.board}, solution)
+                    if reported != (solution.depth, lower_bound):
+                        yield solution, lower_bound, extension_count
+                    return
+            extension_count += 1
+            for child in state.extend():
+                best = best_states.get(child.board)
+                if best is not None and best.depth <= child.depth:
+                    continue
+                child.h = heuristic(child) if delta is None else state.h + \
+                    delta(state, child)
+                best_states[child.board] = child
+                if child.board == goal_board:
+                    solution = child
+                if child.board in closed:
+                    incons.add(child.board)
+                else:
+                    open_boards.add(child.board)
+                    heapq.heappush(q, (priority(child), child))
+
+        if solution is None:
+            raise SearchStopped('unsolvable', extension_count)
+        lower_bound = lower_bound_of(open_boards | incons, solution)
+        if reported != (solution.depth, lower_bound):
+            reported = (solution.depth, lower_bound)
+            yield solution, lower_bound, extension_count
+        if weight <= 1 or lower_bound == solution.depth:
+            # 最適解であることが証明された
+            return
+
+        # 重みを下げ，保留した盤面をキューに戻して優先度を付け直す
+        weight = max(1.0, weight-weight_step)
+        open_boards |= incons
+        incons = set()
+        closed = set()
+        q = [(priority(best_states[board]), best_states[board])
+             for board in open_boards]
+        heapq.heapify(q)
+
+
+def ara_star_solutions(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                       weight: float = 3.0, weight_step: float = 0.5,
+                       budget: Optional[Budget] = None) -> Iterator[SearchResult]:
+    """ARA*探索で改善していく解を順に求める
+
+    予算を超えた場合は，それまでに見つけた解を最後の結果として終了する．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): 許容的なヒューリスティック関数
+        weight (float, optional): 最初の重み. Defaults to 3.0.
+        weight_step (float, optional): 繰り返しごとに重みを下げる幅. Defaults to 0.5.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Yields:
+        Iterator[SearchResult]: 見つけた解ごとの探索の結果．`lower_bound`との比が解の最適性の保証になる．
+            最初の解が見つかる前に終了した場合は`solved`がFalseの結果のみを返す．
+    """
+    start_time = perf_counter()
+    if budget is not None:
+        budget.start()
+    try:
+        for state, lower_bound, extension_count in ara_star_search(
+                initial_state, goal_seq, heuristic, weight, weight_step, budget):
+            yield SearchResult(tuple(state.actions()), state.depth, extension_count,
+                               perf_counter()-start_time, lower_bound=lower_bound)
+    except SearchStopped as stopped:
+        yield stopped.result(perf_counter()-start_time)
+
+
+def ara_star_solve(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                   weight: float = 3.0, weight_step: float = 0.5, budget: Optional[Budget] = None,
+                   callback: Optional[Callable[[SearchResult], None]] = None) -> SearchResult:
+    """ARA*探索で予算の範囲で最良の解を求める
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): 許容的なヒューリスティック関数
+        weight (float, optional): 最初の重み. Defaults to 3.0.
+        weight_step (float, optional): 繰り返しごとに重みを下げる幅. Defaults to 0.5.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        callback (Optional[Callable[[SearchResult], None]], optional): 解が見つかるごとに呼ぶ関数. Defaults to None.
+
+    Returns:
+        SearchResult: 最後に見つけた解の探索の結果
+    """
+    result: Optional[SearchResult] = None
+    for result in ara_star_solutions(initial_state, goal_seq, heuristic, weight, weight_step, budget):
+        if callback is not None and result.solved:
+            callback(result)
+    # `ara_star_search`は解か停止の理由を必ず1つは返すので，結果がないことはない
+    assert result is not None
+    return result
+
+
+if __name__ == '__main__':
+    initial_state = State((8, 6, 7, 2, 5, 4, 3, 0, 1), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 4, 5, 6, 7, 8, 0)
+    for result in ara_star_solutions(initial_state, goal_seq, ManhattanDistance(goal_seq)):
+        report(result.elapsed, result.extension_count, result.cost)
+        print(f"下界:\t{result.lower_bound}（{result.cost/result.lower_bound:.3f}倍以内）")
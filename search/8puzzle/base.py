@@ -1,10 +1,23 @@
+import sys
+from dataclasses import dataclass
 from enum import Enum
-from typing import Literal, Optional
+from functools import lru_cache
+from math import isqrt
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-# 8パズル上の数字（0は空きマスを表す）
-Digit = Literal[0, 1, 2, 3, 4, 5, 6, 7, 8]
-# 8パズルを左上→右上→左下→右下の順に一列に並べたもの
-Seq = tuple[Digit, Digit, Digit, Digit, Digit, Digit, Digit, Digit, Digit]
+# 探索の各ディレクトリで共有するモジュール(search/common)を読み込めるようにする
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.metrics import SearchMetrics  # noqa: E402
+
+if TYPE_CHECKING:
+    from search_trace import Trace
+
+# パズル上の数字（0は空きマスを表す）．8パズルでは0から8．
+Digit = int
+# N×Nのパズル（8パズルではN=3）を左上→右上→左下→右下の順に一列に並べたもの
+Seq = tuple[Digit, ...]
 
 
 class Action(Enum):
@@ -16,53 +29,210 @@ class Action(Enum):
     LEFT = 4
 
 
+# 逆向きの行為
+REVERSE_ACTION = {
+    Action.NONE: None,
+    Action.UP: Action.DOWN,
+    Action.DOWN: Action.UP,
+    Action.RIGHT: Action.LEFT,
+    Action.LEFT: Action.RIGHT,
+}
+
+
+class Layout:
+    def __init__(self, n: int) -> None:
+        """N×Nのパズルの盤面の大きさごとの定数と移動表
+
+        盤面は1つの整数に詰めて表す．i番目のマスの数字を下位から`bits*i`ビット目に置く．
+
+        Args:
+            n (int): 1辺のマスの数
+        """
+        self.n = n
+        self.cells = n*n
+        self.bits = max(4, (self.cells-1).bit_length())  # 1マスあたりのビット数
+        self.mask = (1 << self.bits)-1
+        self.moves = self._make_move_table()  # 空きマスの位置ごとの移動表
+
+    def _make_move_table(self) -> tuple[tuple[tuple[int, int, int, Action, Action], ...], ...]:
+        """空きマスの位置ごとに，入れ替えるマスと盤面の更新に使う値の表を作る
+
+        各要素は(入れ替えるマス, そのマスのシフト量, 盤面に足す係数, 行為, 逆向きの行為)．
+        入れ替えるマスの数字をtとすると，子の盤面は`board + t*係数`で求まる．
+        """
+        n, bits = self.n, self.bits
+        table = []
+        for i0 in range(self.cells):
+            y, x = divmod(i0, n)  # 空きマスの位置（x: 左→右，y: 上→下）
+            pos_action_list: list[tuple[int, Action]] = []
+            if y != n-1:
+                # 空きマスを下のマスと入れ替える
+                pos_action_list.append((i0+n, Action.UP))
+            if y != 0:
+                # 空きマスを上のマスと入れ替える
+                pos_action_list.append((i0-n, Action.DOWN))
+            if x != 0:
+                # 空きマスを左のマスと入れ替える
+                pos_action_list.append((i0-1, Action.RIGHT))
+            if x != n-1:
+                # 空きマスを右のマスと入れ替える
+                pos_action_list.append((i0+1, Action.LEFT))
+            table.append(tuple((pos, bits*pos, (1 << (bits*i0))-(1 << (bits*pos)),
+                                action, REVERSE_ACTION[action])
+                               for pos, action in pos_action_list))
+        return tuple(table)
+
+
+@lru_cache
+def get_layout(cells: int) -> Layout:
+    """マスの数に対応する`Layout`"""
+    n = isqrt(cells)
+    if n*n != cells:
+        raise ValueError(f'盤面のマスの数が平方数ではありません: {cells}')
+    return Layout(n)
+
+
+def pack_seq(seq: Seq) -> int:
+    """盤面を1つの整数に詰める（i番目のマスを下位から`bits*i`ビット目に置く）"""
+    bits = get_layout(len(seq)).bits
+    board = 0
+    for i, s in enumerate(seq):
+        board |= s << (bits*i)
+    return board
+
+
+def unpack_board(board: int, cells: int = 9) -> Seq:
+    """整数に詰めた盤面を元の並びに戻す"""
+    layout = get_layout(cells)
+    return tuple((board >> (layout.bits*i)) & layout.mask for i in range(cells))
+
+
+def is_solvable(seq: Seq, goal_seq: Seq) -> bool:
+    """盤面から目標状態に到達できるか偶奇性で判定する
+
+    1回の移動は空きマスとタイルの互換で，空きマスの位置のマンハッタン距離の偶奇を変える．
+    よって目標状態への置換の偶奇と空きマスの移動距離の偶奇が一致するときに限り到達できる．
+    """
+    cells = len(seq)
+    n = isqrt(cells)
+    goal_pos = [0]*cells  # 数字ごとの目標状態での位置
+    for pos, d in enumerate(goal_seq):
+        goal_pos[d] = pos
+    # 各位置の数字を目標状態での位置へ送る置換の巡回の数を数える
+    visited = [False]*cells
+    cycles = 0
+    for i in range(cells):
+        if not visited[i]:
+            cycles += 1
+            while not visited[i]:
+                visited[i] = True
+                i = goal_pos[seq[i]]
+    blank_y, blank_x = divmod(seq.index(0), n)
+    goal_y, goal_x = divmod(goal_pos[0], n)
+    return (cells-cycles) % 2 == (abs(blank_y-goal_y)+abs(blank_x-goal_x)) % 2
+
+
 class State:
+    __slots__ = ('board', 'blank', 'layout', 'depth',
+                 'prev_act', 'parent', 'h', 'trace_id')
+
     def __init__(self, seq: Seq, depth: int, prev_act: Action, parent: Optional['State']) -> None:
         """状態
 
         Args:
-            seq (Seq): 8パズルを左上→右上→左下→右下の順に一列に並べたもの．空きマスは0で表す．
+            seq (Seq): パズルを左上→右上→左下→右下の順に一列に並べたもの．空きマスは0で表す．
             depth (int): ルートノードからの深さ
             prev_act (Action): 前回の行為．どう動かしてこの状態になったか．
             parent (State): 親ノード
         """
-        self.seq = seq
+        self.board = pack_seq(seq)  # 整数に詰めた盤面
+        self.blank = seq.index(0)  # 空きマスの位置
+        self.layout = get_layout(len(seq))  # 盤面の大きさ
         self.depth = depth
         self.prev_act = prev_act
         self.parent = parent
+        self.h: Optional[int] = None  # 探索中に記録するヒューリスティック関数の値
+        self.trace_id = -1  # 探索の過程の記録(`Trace`)でのノードの番号
+
+    @classmethod
+    def from_board(cls, board: int, blank: int, layout: Layout, depth: int, prev_act: Action,
+                   parent: Optional['State']) -> 'State':
+        """整数に詰めた盤面から状態を作る"""
+        state = cls.__new__(cls)
+        state.board = board
+        state.blank = blank
+        state.layout = layout
+        state.depth = depth
+        state.prev_act = prev_act
+        state.parent = parent
+        state.h = None
+        state.trace_id = -1
+        return state
+
+    @property
+    def seq(self) -> Seq:
+        """パズルを左上→右上→左下→右下の順に一列に並べたもの"""
+        return unpack_board(self.board, self.layout.cells)
 
     @property
     def name(self) -> str:
         """名前"""
-        return str(self.depth)+'\n'+''.join([str(s)+'\n' if i % 3 == 2 else str(s)
-                                             for i, s in enumerate(self.seq)])+self.prev_act.name
+        n = self.layout.n
+        sep = '' if n <= 3 else ','  # 2桁の数字があるときは区切る
+        return str(self.depth)+'\n'+'\n'.join([sep.join(map(str, self.seq[i:i+n]))
+                                               for i in range(0, n*n, n)])+'\n'+self.prev_act.name
 
     def extend(self) -> list['State']:
         """次の状態を展開する"""
-        i0 = self.seq.index(0)
-        y, x = divmod(i0, 3)  # 空きマスの位置（x: 左→右，y: 上→下）
-        pos_action_list: list[tuple[Digit, Action]] = []  # 入れ替えるマスと行為の組のリスト
-        if y != 2 and self.prev_act != Action.DOWN:
-            # 空きマスを下のマスと入れ替える
-            pos_action_list.append((i0+3, Action.UP))
-        if y != 0 and self.prev_act != Action.UP:
-            # 空きマスを上のマスと入れ替える
-            pos_action_list.append((i0-3, Action.DOWN))
-        if x != 0 and self.prev_act != Action.LEFT:
-            # 空きマスを左のマスと入れ替える
-            pos_action_list.append((i0-1, Action.RIGHT))
-        if x != 2 and self.prev_act != Action.RIGHT:
-            # 空きマスを右のマスと入れ替える
-            pos_action_list.append((i0+1, Action.LEFT))
-        return [State(tuple(self.seq[pos] if i == i0 else
-                            (0 if i == pos else self.seq[i]) for i in range(9)), self.depth+1, action, self)
-                for pos, action in pos_action_list]
+        board = self.board
+        layout = self.layout
+        mask = layout.mask
+        depth = self.depth+1
+        prev_act = self.prev_act
+        from_board = State.from_board
+        return [from_board(board+((board >> shift) & mask)*coef, pos, layout, depth, action, self)
+                for pos, shift, coef, action, reverse in layout.moves[self.blank]
+                if reverse is not prev_act]
+
+    def move(self, pos: int) -> int:
+        """位置`pos`の数字を空きマスに動かし，盤面をその場で書き換える
+
+        返り値の位置を渡して再び呼べば元に戻せる．状態を新しく作らない反復深化探索などで用いる．
+
+        Args:
+            pos (int): 空きマスと入れ替えるマス（空きマスに隣接していること）
+
+        Returns:
+            int: 動かす前の空きマスの位置
+        """
+        bits = self.layout.bits
+        blank = self.blank
+        d = (self.board >> (bits*pos)) & self.layout.mask
+        self.board += (d << (bits*blank))-(d << (bits*pos))
+        self.blank = pos
+        return blank
+
+    def path(self) -> list['State']:
+        """初期状態から現在の状態までの経路"""
+        path: list[State] = []
+        state = self
+        while state is not None:
+            path.append(state)
+            state = state.parent
+        path.reverse()
+        return path
+
+    def actions(self) -> list[Action]:
+        """初期状態から現在の状態までの行為の列"""
+        return [state.prev_act for state in self.path()[1:]]
 
     def label(self, count: Optional[int] = None, cost: Optional[str] = None) -> str:
         """graphvizでグラフを可視化するときのラベル"""
+        n = self.layout.n
+        seq = self.seq
         label = '{{'+'}|{'.join([
-            '|'.join([str(self.seq[i+3*j]) for i in range(3)])
-            for j in range(3)
+            '|'.join([str(seq[i+n*j]) for i in range(n)])
+            for j in range(n)
         ])+'}}'
         if count is None and cost is None:
             return label
@@ -75,20 +245,11 @@ class State:
 
     def heuristic1(self, goal_seq: Seq) -> int:
         """ヒューリスティック関数（ゴール位置にないタイルの数）"""
-        h = 8
-        for s, g in zip(self.seq, goal_seq):
-            if s != 0 and s == g:
-                h -= 1
-        return h
+        return misplaced_tiles(goal_seq)(self)
 
     def heuristic2(self, goal_seq: Seq) -> int:
         """ヒューリスティック関数（ゴール状態からのタイルの距離の和）"""
-        h = 0
-        for i in range(1, 9):
-            sy, sx = divmod(self.seq.index(i), 3)
-            gy, gx = divmod(goal_seq.index(i), 3)
-            h += abs(sx-gx)+abs(sy-gy)
-        return h
+        return manhattan_distance(goal_seq)(self)
 
     def __str__(self) -> str:
         return self.name
@@ -98,3 +259,105 @@ class State:
         if not isinstance(other, State):
             return NotImplemented
         return (self.depth, self.prev_act.value) < (other.depth, other.prev_act.value)
+
+
+@dataclass
+class SearchResult:
+    """探索の結果"""
+    actions: tuple[Action, ...]  # 初期状態から目標状態までの行為の列
+    cost: Optional[int]  # 解の経路コスト（解けなかった場合はNone）
+    extension_count: int  # 展開回数
+    elapsed: float  # 計算時間（秒）
+    trace: Optional['Trace'] = None  # 探索の過程の記録（記録した場合のみ）
+    solved: bool = True  # 解が見つかったか否か
+    # 解けなかった理由（'unsolvable', 'max_expansions', 'max_frontier', 'deadline', 'cancelled'）
+    reason: Optional[str] = None
+    best_actions: Optional[tuple[Action, ...]] = None  # 解けなかった場合にヒューリスティック関数の値が最小だった状態への行為の列
+    best_h: Optional[int] = None  # その状態のヒューリスティック関数の値
+    # 解けなかった場合と最適とは限らない解の場合に証明された最適な経路コストの下界
+    lower_bound: Optional[int] = None
+    metrics: Optional[SearchMetrics] = None  # 探索の計測値
+
+    def __post_init__(self) -> None:
+        if self.metrics is None:
+            # 数え上げない探索でも展開回数と計算時間は計測値として返す
+            self.metrics = SearchMetrics(phases={'search': self.elapsed}).finish(self.extension_count)
+
+
+class TableHeuristic:
+    def __init__(self, table: tuple[tuple[int, ...], ...]) -> None:
+        """タイルごとの位置のコストの和で表されるヒューリスティック関数
+
+        1回の移動で位置が変わるタイルは1つだけなので，子の値は親の値と差分から求められる．
+
+        Args:
+            table (tuple[tuple[int, ...], ...]): `table[数字][位置]`がその位置にある数字のコスト
+        """
+        self.table = table
+
+    def __call__(self, state: State) -> int:
+        """盤面全体から値を求める"""
+        board = state.board
+        layout = state.layout
+        bits, mask = layout.bits, layout.mask
+        table = self.table
+        h = 0
+        for pos in range(layout.cells):
+            h += table[board & mask][pos]
+            board >>= bits
+        return h
+
+    def delta(self, state: State, child: State) -> int:
+        """状態から子の状態への値の変化量"""
+        # 動いたタイルは子の空きマスの位置から親の空きマスの位置に移る
+        layout = state.layout
+        costs = self.table[(child.board >> (layout.bits*state.blank)) & layout.mask]
+        return costs[state.blank]-costs[child.blank]
+
+    def move_delta(self, d: Digit, src: int, dst: int) -> int:
+        """数字`d`を位置`src`から`dst`に動かしたときの値の変化量"""
+        costs = self.table[d]
+        return costs[dst]-costs[src]
+
+
+class MisplacedTiles(TableHeuristic):
+    def __init__(self, goal_seq: Seq) -> None:
+        """ヒューリスティック関数（ゴール位置にないタイルの数）
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+        """
+        super().__init__(tuple(tuple(0 if d == 0 or g == d else 1 for g in goal_seq)
+                               for d in range(len(goal_seq))))
+
+
+class ManhattanDistance(TableHeuristic):
+    def __init__(self, goal_seq: Seq) -> None:
+        """ヒューリスティック関数（ゴール状態からのタイルの距離の和）
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+        """
+        cells = len(goal_seq)
+        n = get_layout(cells).n
+
+        def distance(d: Digit, pos: int) -> int:
+            if d == 0:
+                return 0
+            sy, sx = divmod(pos, n)
+            gy, gx = divmod(goal_seq.index(d), n)
+            return abs(sx-gx)+abs(sy-gy)
+        super().__init__(tuple(tuple(distance(d, pos) for pos in range(cells))
+                               for d in range(cells)))
+
+
+@lru_cache
+def misplaced_tiles(goal_seq: Seq) -> MisplacedTiles:
+    """目標状態ごとに作った`MisplacedTiles`"""
+    return MisplacedTiles(goal_seq)
+
+
+@lru_cache
+def manhattan_distance(goal_seq: Seq) -> ManhattanDistance:
+    """目標状態ごとに作った`ManhattanDistance`"""
+    return ManhattanDistance(goal_seq)
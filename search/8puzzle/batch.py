@@ -0,0 +1,103 @@
+"""複数の問題の一括求解"""
+from multiprocessing import Pool
+from typing import Callable, Iterable, Iterator, Optional
+
+from a_star import a_star_solve
+from base import Action, ManhattanDistance, MisplacedTiles, SearchResult, Seq, State
+from budget import Budget
+from heuristics import LinearConflict, WalkingDistance
+from oracle import DistanceOracle
+from pattern_db import PatternDatabase
+
+# 名前で選べるヒューリスティック関数（目標状態の盤面から作る）
+HEURISTICS: dict[str, Callable[[Seq], Callable[[State], int]]] = {
+    'h1': MisplacedTiles,
+    'h2': ManhattanDistance,
+    'lc': LinearConflict,
+    'wd': WalkingDistance,
+    'pdb': PatternDatabase,
+    'oracle': DistanceOracle,
+}
+
+# ワーカーごとに作ったヒューリスティック関数（目標状態ごと）
+_heuristic_name: str = 'h2'
+_heuristics: dict[Seq, Callable[[State], int]] = {}
+# ワーカーごとの1問あたりの予算
+_budget: Optional[Budget] = None
+
+
+def _get_heuristic(goal_seq: Seq) -> Callable[[State], int]:
+    """目標状態に対するヒューリスティック関数．表はワーカーごとに一度だけ読み込む．"""
+    heuristic = _heuristics.get(goal_seq)
+    if heuristic is None:
+        heuristic = HEURISTICS[_heuristic_name](goal_seq)
+        _heuristics[goal_seq] = heuristic
+    return heuristic
+
+
+def _init_worker(heuristic_name: str, goal_seqs: tuple[Seq, ...], budget: Optional[Budget]) -> None:
+    """ワーカーの初期化．既知の目標状態の表を読み込んでおく．"""
+    global _heuristic_name, _budget
+    _heuristic_name = heuristic_name
+    _budget = budget
+    _heuristics.clear()
+    for goal_seq in goal_seqs:
+        _get_heuristic(goal_seq)
+
+
+def _solve(instance: tuple[int, Seq, Seq]) -> tuple[int, SearchResult]:
+    """ワーカーで1つの問題を解く"""
+    index, seq, goal_seq = instance
+    initial_state = State(seq, 0, Action.NONE, None)
+    return index, a_star_solve(initial_state, goal_seq, _get_heuristic(goal_seq), budget=_budget)
+
+
+def solve_batch(instances: Iterable[tuple[Seq, Seq]], heuristic: str = 'h2', processes: Optional[int] = None,
+                chunksize: int = 16, ordered: bool = True,
+                goal_seqs: Iterable[Seq] = (), budget: Optional[Budget] = None) -> Iterator[tuple[int, SearchResult]]:
+    """複数の問題をプロセスプールでA*探索（グラフ探索）により解く
+
+    Args:
+        instances (Iterable[tuple[Seq, Seq]]): (初期状態の盤面, 目標状態の盤面)の組
+        heuristic (str, optional): ヒューリスティック関数の名前（`HEURISTICS`のキー）. Defaults to 'h2'.
+        processes (Optional[int], optional): ワーカーの数. Defaults to None（CPUの数）.
+        chunksize (int, optional): ワーカーにまとめて渡す問題の数. Defaults to 16.
+        ordered (bool, optional): 入力の順に返すか否か．Falseの場合は解けた順に返す. Defaults to True.
+        goal_seqs (Iterable[Seq], optional): 既知の目標状態．表をワーカーの起動前に作り，起動時に読み込む. Defaults to ().
+        budget (Optional[Budget], optional): 1問あたりの予算．中断の要求には`multiprocessing.Event()`を用いた
+            `CancelToken`を渡す. Defaults to None.
+
+    Yields:
+        Iterator[tuple[int, SearchResult]]: 入力での番号と探索の結果
+    """
+    goal_seqs = tuple(goal_seqs)
+    for goal_seq in goal_seqs:
+        # 表を持つヒューリスティック関数は，ワーカーが同時に作らないようにここで作ってファイルに保存しておく
+        HEURISTICS[heuristic](goal_seq)
+    with Pool(processes, initializer=_init_worker, initargs=(heuristic, goal_seqs, budget)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(_solve, ((i, seq, goal_seq) for i, (seq, goal_seq) in enumerate(instances)),
+                        chunksize)
+
+
+if __name__ == '__main__':
+    import random
+    from time import perf_counter
+
+    goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
+    # 目標状態からランダムに動かして問題を作る
+    random.seed(0)
+    instances = []
+    for _ in range(1000):
+        state = State(goal_seq, 0, Action.NONE, None)
+        for _ in range(100):
+            state = random.choice(state.extend())
+        instances.append((state.seq, goal_seq))
+
+    start_time = perf_counter()
+    results = [result for _i, result in solve_batch(
+        instances, 'pdb', goal_seqs=[goal_seq])]
+    end_time = perf_counter()
+    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
+    print(f"展開回数:\t{sum(result.extension_count for result in results)}")
+    print(f"解の経路コスト:\t{sum(result.cost for result in results)}")
@@ -1,67 +1,133 @@
 """幅優先探索"""
 from collections import deque
-from time import time
+from time import perf_counter
+from typing import Optional
 
 from graphviz import Digraph
 
-from base import Action, Seq, State
+from base import Action, SearchResult, Seq, State, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import SearchMetrics, SearchObserver, report
+from render import render_trace
+from search_trace import Trace
 
 
-def bfs(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digraph:
-    """幅優先探索
+def bfs_search(initial_state: State, goal_seq: Seq, graph_search: bool = False,
+               trace: Optional[Trace] = None, budget: Optional[Budget] = None,
+               metrics: Optional[SearchMetrics] = None,
+               observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """幅優先探索の本体
 
     Args:
         initial_state (State): 初期状態
         goal_seq (Seq): 目標状態の盤面
-        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+        graph_search (bool, optional): 一度現れた盤面を再び展開しないグラフ探索とするか否か. Defaults to False.
+        trace (Optional[Trace], optional): 与えられた場合は取り出した状態と展開した順番を記録する. Defaults to None.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は展開と生成ごとに呼ぶ観測者. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
 
     Returns:
-        Digraph: グラフ(graphviz)
+        tuple[State, int]: 目標状態と展開回数
     """
-    start_time = time()
+    check_solvable(initial_state, goal_seq)
+    goal_board = pack_seq(goal_seq)  # 整数に詰めた目標状態の盤面
 
     q = deque([initial_state])  # キュー
+    board_set: set[int] = {initial_state.board}  # グラフ探索で用いる現れた盤面の集合
+    if metrics is not None:
+        metrics.start_counting()
 
     extension_count = 0  # 展開した回数
-    state_dict: dict[str, tuple(State, int)] = {}
     while True:
         state = q.popleft()  # キューの先頭から取り出す
-        state_dict[state.name] = (state, extension_count)
-        if state.seq == goal_seq:
+        if trace is not None:
+            trace.add(state, extension_count)
+        if observer is not None:
+            observer.on_expand(state, extension_count)
+        if state.board == goal_board:
             # 目標状態に到達したのでループを抜ける
-            break
+            if trace is not None:
+                trace.goal_id = state.trace_id
+            return state, extension_count
+        if budget is not None:
+            reason = budget.exceeded(extension_count, len(q))
+            if reason is not None:
+                # 取り出した状態より浅い状態は全て調べ終えている
+                raise SearchStopped(reason, extension_count, lower_bound=state.depth)
         # 子ノードをキューに追加する
         children = state.extend()
+        generated = len(children)
+        if observer is not None:
+            for child in children:
+                observer.on_generate(child, state)
+        if graph_search:
+            children = [child for child in children
+                        if child.board not in board_set]
+            board_set.update(child.board for child in children)
         q.extend(children)
+        if metrics is not None:
+            metrics.generations += generated
+            metrics.duplicates += generated-len(children)
+            metrics.max_frontier = max(metrics.max_frontier, len(q))
         extension_count += 1
 
-    end_time = time()
-    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
-    print(f"展開回数:\t{extension_count}")
-    print(f"解の経路コスト:\t{state.depth}")
+
+def bfs_solve(initial_state: State, goal_seq: Seq, graph_search: bool = False, trace: bool = False,
+              budget: Optional[Budget] = None, observer: Optional[SearchObserver[State]] = None) -> SearchResult:
+    """幅優先探索で解を求める（表示や可視化をしない）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        graph_search (bool, optional): グラフ探索とするか否か. Defaults to False.
+        trace (bool, optional): 探索の過程を記録するか否か. Defaults to False.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 展開と生成ごとに呼ぶ観測者. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    metrics = SearchMetrics()
+    search_trace = Trace(len(goal_seq)) if trace else None
+    if budget is not None:
+        budget.start()
+    try:
+        with metrics.phase('search'):
+            state, extension_count = bfs_search(
+                initial_state, goal_seq, graph_search, search_trace, budget, metrics, observer)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time, search_trace, metrics)
+    with metrics.phase('path'):
+        actions = tuple(state.actions())
+    return SearchResult(actions, state.depth, extension_count, perf_counter()-start_time,
+                        search_trace, metrics=metrics.finish(extension_count))
+
+
+def bfs(initial_state: State, goal_seq: Seq, show_all: bool = False, graph_search: bool = False) -> Digraph:
+    """幅優先探索
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+        graph_search (bool, optional): 一度現れた盤面を再び展開しないグラフ探索とするか否か. Defaults to False.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    result = bfs_solve(initial_state, goal_seq, graph_search, trace=True)
+    if not result.solved:
+        raise ValueError('目標状態に到達できません')
+
+    report(result.elapsed, result.extension_count, result.cost)
 
     # グラフで可視化する
-    graph = Digraph(name="幅優先探索")
-    if show_all:
-        # 全てのノードを表示
-        for state, extension_count in state_dict.values():
-            graph.node(state.name, label=state.label(extension_count), shape='record',
-                       color=('blue' if state.seq == goal_seq else 'black'))
-            if state.parent is not None:
-                graph.edge(state.parent.name, state.name)
-    else:
-        # 目標状態から初期状態まで遡って表示
-        state_name = state.name
-        while True:
-            state, extension_count = state_dict.get(state_name)
-            graph.node(state.name, label=state.label(
-                extension_count), shape='record')
-            if state.parent is None:
-                # 初期状態に到達したのでループを抜ける
-                break
-            graph.edge(state.parent.name, state.name)
-            state_name = state.parent.name
-    return graph
+    return render_trace(result.trace, "幅優先探索", show_all)
 
 
 if __name__ == '__main__':
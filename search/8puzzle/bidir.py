@@ -1,69 +1,98 @@
 """双方向探索"""
-from time import time
+import heapq
+import sys
+from time import perf_counter
+from typing import Optional
 
 from graphviz import Digraph
 
-from base import Action, Seq, State
+from base import REVERSE_ACTION, Action, SearchResult, Seq, State, manhattan_distance, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import report
+from render import render_bidir_trace
+from search_trace import Trace
 
 
-def bidir(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digraph:
-    """双方向探索
+def frontier_index(frontier_list: list[State]) -> dict[int, State]:
+    """盤面から辺境の状態への索引を作る．同じ盤面が複数ある場合は先に現れた状態を用いる．"""
+    index: dict[int, State] = {}
+    for state in frontier_list:
+        index.setdefault(state.board, state)
+    return index
+
+
+def bidir_actions(meet_start_state: State, meet_goal_state: State) -> list[Action]:
+    """出会った両側の状態から，初期状態から目標状態までの行為の列を求める"""
+    actions = meet_start_state.actions()
+    state = meet_goal_state
+    while state.parent is not None:
+        # 目標状態側の行為を逆向きにたどる
+        actions.append(REVERSE_ACTION[state.prev_act])
+        state = state.parent
+    return actions
+
+
+def bidir_search(initial_state: State, goal_seq: Seq, trace: Optional[Trace] = None,
+                 budget: Optional[Budget] = None) -> tuple[State, State, int]:
+    """双方向探索の本体
 
     Args:
         initial_state (State): 初期状態
         goal_seq (Seq): 目標状態の盤面
-        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+        trace (Optional[Trace], optional): 与えられた場合は現れた状態と展開した順番を記録する. Defaults to None.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
 
     Returns:
-        Digraph: グラフ(graphviz)
+        tuple[State, State, int]: 出会った初期状態側の状態，目標状態側の状態と展開回数
     """
-    if initial_state.seq == goal_seq:
-        # 初期状態と目標状態が同じ場合
-        graph = Digraph()
-        graph.node(initial_state.name,
-                   label=initial_state.label(), shape='record')
-        return graph
-
-    start_time = time()
-
     goal_state = State(goal_seq, 0, Action.NONE, None)  # 目標状態
+    if initial_state.board == goal_state.board:
+        # 初期状態と目標状態が同じ場合
+        return initial_state, goal_state, 0
+    check_solvable(initial_state, goal_seq)
 
     # 初期状態側・目標状態側から探索した辺境（端）
     start_frontier_list: list[State] = [initial_state]
     goal_frontier_list: list[State] = [goal_state]
+    # 出会ったかを定数時間で判定するための盤面から辺境の状態への索引
+    start_frontier_index = frontier_index(start_frontier_list)
+    goal_frontier_index = frontier_index(goal_frontier_list)
 
     extension_count = 0  # 展開した回数
-    # 可視化用に記録しておく辞書
-    start_state_dict: dict[str, tuple(State, int)] = {
-        initial_state.name: (initial_state, None)
-    }
-    goal_state_dict: dict[str, tuple(State, int)] = {
-        goal_state.name: (goal_state, None)
-    }
+    if trace is not None:
+        trace.add(initial_state, side=0)
+        trace.add(goal_state, side=1)
     meet = False  # 出会ったかどうかのフラグ
     while not meet:
         # 初期状態側から探索
         new_start_frontier_list: list[State] = []
         for start_frontier in start_frontier_list:
+            if budget is not None:
+                reason = budget.exceeded(extension_count,
+                                         len(start_frontier_list)+len(goal_frontier_list))
+                if reason is not None:
+                    raise SearchStopped(reason, extension_count)
             # 展開回数を更新
-            start_state_dict[start_frontier.name] = (
-                start_frontier, extension_count)
+            if trace is not None:
+                trace.add(start_frontier, extension_count, side=0)
             extension_count += 1
             # 展開
             start_frontier_children = start_frontier.extend()
+            if trace is not None:
+                for start_frontier_child in start_frontier_children:
+                    # 展開して出現したノードを記録
+                    trace.add(start_frontier_child, side=0)
+            # 出会ったのか索引で判定
             for start_frontier_child in start_frontier_children:
-                # 展開して出現したノードを記録
-                start_state_dict[start_frontier_child.name] = (
-                    start_frontier_child, None)
-            # 出会ったのか多対多で判定
-            for start_frontier_child in start_frontier_children:
-                for goal_frontier in goal_frontier_list:
-                    if start_frontier_child.seq == goal_frontier.seq:
-                        meet = True
-                        meet_start_frontier = start_frontier_child
-                        meet_goal_frontier = goal_frontier
-                        break
-                if meet:
+                goal_frontier = goal_frontier_index.get(
+                    start_frontier_child.board)
+                if goal_frontier is not None:
+                    meet = True
+                    meet_start_frontier = start_frontier_child
+                    meet_goal_frontier = goal_frontier
                     break
             if meet:
                 # 出会った場合は展開を終了
@@ -73,31 +102,36 @@ def bidir(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digrap
         if not meet:
             # まだ出会っていない場合は辺境の状態を更新
             start_frontier_list = new_start_frontier_list
+            start_frontier_index = frontier_index(start_frontier_list)
         else:
             break
 
         # 目標状態側から探索
         new_goal_frontier_list: list[State] = []
         for goal_frontier in goal_frontier_list:
+            if budget is not None:
+                reason = budget.exceeded(extension_count,
+                                         len(start_frontier_list)+len(goal_frontier_list))
+                if reason is not None:
+                    raise SearchStopped(reason, extension_count)
             # 展開回数を更新
-            goal_state_dict[goal_frontier.name] = (
-                goal_frontier, extension_count)
+            if trace is not None:
+                trace.add(goal_frontier, extension_count, side=1)
             extension_count += 1
             # 展開
             goal_frontier_children = goal_frontier.extend()
+            if trace is not None:
+                for goal_frontier_child in goal_frontier_children:
+                    # 展開して出現したノードを記録
+                    trace.add(goal_frontier_child, side=1)
+            # 出会ったのか索引で判定
             for goal_frontier_child in goal_frontier_children:
-                # 展開して出現したノードを記録
-                goal_state_dict[goal_frontier_child.name] = (
-                    goal_frontier_child, None)
-            # 出会ったのか多対多で判定
-            for goal_frontier_child in goal_frontier_children:
-                for start_frontier in start_frontier_list:
-                    if goal_frontier_child.seq == start_frontier.seq:
-                        meet = True
-                        meet_start_frontier = start_frontier
-                        meet_goal_frontier = goal_frontier_child
-                        break
-                if meet:
+                start_frontier = start_frontier_index.get(
+                    goal_frontier_child.board)
+                if start_frontier is not None:
+                    meet = True
+                    meet_start_frontier = start_frontier
+                    meet_goal_frontier = goal_frontier_child
                     break
             if meet:
                 # 出会った場合は展開を終了
@@ -107,56 +141,209 @@ def bidir(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digrap
         if not meet:
             # まだ出会っていない場合は辺境の状態を更新
             goal_frontier_list = new_goal_frontier_list
+            goal_frontier_index = frontier_index(goal_frontier_list)
+
+    if trace is not None:
+        trace.goal_id = meet_start_frontier.trace_id
+        trace.meet_id = meet_goal_frontier.trace_id
+    return meet_start_frontier, meet_goal_frontier, extension_count
+
+
+def bidir_solve(initial_state: State, goal_seq: Seq, trace: bool = False,
+                budget: Optional[Budget] = None) -> SearchResult:
+    """双方向探索で解を求める（表示や可視化をしない）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        trace (bool, optional): 探索の過程を記録するか否か. Defaults to False.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    search_trace = Trace(len(goal_seq)) if trace else None
+    if budget is not None:
+        budget.start()
+    try:
+        meet_start_state, meet_goal_state, extension_count = bidir_search(
+            initial_state, goal_seq, search_trace, budget)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time, search_trace)
+    return SearchResult(tuple(bidir_actions(meet_start_state, meet_goal_state)),
+                        meet_start_state.depth+meet_goal_state.depth, extension_count,
+                        perf_counter()-start_time, search_trace)
+
+
+def bidir(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digraph:
+    """双方向探索
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    if initial_state.board == pack_seq(goal_seq):
+        # 初期状態と目標状態が同じ場合
+        graph = Digraph()
+        graph.node(initial_state.name,
+                   label=initial_state.label(), shape='record')
+        return graph
 
-    end_time = time()
-    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
-    print(f"展開回数:\t{extension_count}")
-    print(f"解の経路コスト:\t{meet_start_frontier.depth+meet_goal_frontier.depth}")
+    result = bidir_solve(initial_state, goal_seq, trace=True)
+    if not result.solved:
+        raise ValueError('目標状態に到達できません')
+
+    report(result.elapsed, result.extension_count, result.cost)
 
     # グラフで可視化する
-    graph = Digraph(name="双方向探索")
-    if show_all:
-        # 全てのノードを表示
-        for state, count in start_state_dict.values():
-            if state.name != meet_start_frontier.name:
-                graph.node(state.name, label=state.label(
-                    count), shape='record', color='red')
-                if state.parent is not None:
-                    graph.edge(state.parent.name, state.name)
-        for state, count in goal_state_dict.values():
-            graph.node(state.name, label=state.label(
-                count), shape='record', color='blue')
-            if state.parent is not None:
-                graph.edge(state.name, state.parent.name)
-    else:
-        # 出会った状態から初期状態まで遡って表示
-        state_name = start_state_dict.get(
-            meet_start_frontier.name)[0].parent.name
-        while True:
-            state, count = start_state_dict.get(state_name)
-            graph.node(state.name, label=state.label(
-                count), shape='record', color='red')
-            if state.parent is None:
-                # 初期状態に到達したのでループを抜ける
-                break
-            graph.edge(state.parent.name, state.name)
-            state_name = state.parent.name
-        # 出会った状態から目標状態まで遡って表示
-        state_name = meet_goal_frontier.name
-        while True:
-            state, count = goal_state_dict.get(state_name)
-            graph.node(state.name, label=state.label(
-                count), shape='record', color='blue')
-            if state.parent is None:
-                # 目標状態に到達したのでループを抜ける
-                break
-            graph.edge(state.name, state.parent.name)
-            state_name = state.parent.name
-    graph.node(meet_goal_frontier.name, label=meet_goal_frontier.label(
-    ), shape='record', color='purple')
-    graph.edge(meet_start_frontier.parent.name, meet_goal_frontier.name)
+    return render_bidir_trace(result.trace, "双方向探索", show_all)
+
+
+def bidir_a_star_search(initial_state: State, goal_seq: Seq, trace: Optional[Trace] = None,
+                        budget: Optional[Budget] = None) -> tuple[State, State, int]:
+    """ヒューリスティック関数を用いた双方向探索（MM）の本体
+
+    初期状態側は目標状態への，目標状態側は初期状態へのマンハッタン距離の和(heuristic2)を用い，
+    優先度max(f, 2g)が小さい側から展開する．両側の探索は経路の中間で出会う．
+    見つかった最良の経路コストが両側の優先度の最小値以下になったとき最適解として終了する．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        trace (Optional[Trace], optional): 与えられた場合は現れた状態と展開した順番を記録する. Defaults to None.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
+
+    Returns:
+        tuple[State, State, int]: 出会った初期状態側の状態，目標状態側の状態と展開回数
+    """
+    check_solvable(initial_state, goal_seq)
+    goal_state = State(goal_seq, 0, Action.NONE, None)  # 目標状態
+    # 0: 初期状態側，1: 目標状態側
+    roots = (initial_state, goal_state)
+    # 各側から反対側の根へのヒューリスティック関数
+    heuristics = (manhattan_distance(goal_seq),
+                  manhattan_distance(initial_state.seq))
+    for side, (root, heuristic) in enumerate(zip(roots, heuristics)):
+        root.h = heuristic(root)
+        if trace is not None:
+            trace.add(root, side=side)
+
+    def priority(state: State) -> int:
+        return max(state.depth+state.h, 2*state.depth)
+
+    # 各側の状態と優先度のタプルのキュー
+    qs = [[(priority(root), root)] for root in roots]
+    # 各側で盤面ごとに最良のgで現れた状態
+    best_states: list[dict[int, State]] = [
+        {root.board: root} for root in roots]
+
+    meet_cost = sys.maxsize  # 見つかった最良の経路コスト
+    meet_states: tuple[State, State] = None  # 出会った(初期状態側, 目標状態側)の状態
+    if initial_state.board == goal_state.board:
+        meet_cost = 0
+        meet_states = roots
+    best_state = initial_state  # 打ち切った場合に返す初期状態側でヒューリスティック関数の値が最小の状態
+
+    extension_count = 0  # 展開した回数
+    while qs[0] and qs[1]:
+        min_priority = min(qs[0][0][0], qs[1][0][0])
+        if meet_cost <= min_priority:
+            # これ以上良い経路は存在しないので終了
+            break
+        if budget is not None:
+            reason = budget.exceeded(extension_count, len(qs[0])+len(qs[1]))
+            if reason is not None:
+                # 両側の優先度の最小値は最適な経路コストの下界
+                raise SearchStopped(reason, extension_count, best_state, min_priority)
+        side = 0 if qs[0][0][0] <= qs[1][0][0] else 1  # 優先度が小さい側を展開する
+        _pr, state = heapq.heappop(qs[side])
+        if best_states[side][state.board] is not state:
+            # より良い経路で既に現れた盤面なので読み飛ばす
+            continue
+        if side == 0 and state.h < best_state.h:
+            best_state = state
+        if trace is not None:
+            trace.add(state, extension_count, side=side)
+        extension_count += 1
+        for child in state.extend():
+            best = best_states[side].get(child.board)
+            if best is not None and best.depth <= child.depth:
+                continue
+            best_states[side][child.board] = child
+            child.h = state.h+heuristics[side].delta(state, child)
+            if trace is not None:
+                trace.add(child, side=side)
+            heapq.heappush(qs[side], (priority(child), child))
+            # 反対側で同じ盤面が現れているか索引で判定
+            other = best_states[1-side].get(child.board)
+            if other is not None and child.depth+other.depth < meet_cost:
+                meet_cost = child.depth+other.depth
+                meet_states = (child, other) if side == 0 else (other, child)
+
+    if meet_states is None:
+        raise SearchStopped('unsolvable', extension_count)
+
+    meet_start_state, meet_goal_state = meet_states
+    if trace is not None:
+        trace.goal_id = meet_start_state.trace_id
+        trace.meet_id = meet_goal_state.trace_id
+    return meet_start_state, meet_goal_state, extension_count
 
-    return graph
+
+def bidir_a_star_solve(initial_state: State, goal_seq: Seq, trace: bool = False,
+                       budget: Optional[Budget] = None) -> SearchResult:
+    """ヒューリスティック関数を用いた双方向探索（MM）で解を求める（表示や可視化をしない）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        trace (bool, optional): 探索の過程を記録するか否か. Defaults to False.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    search_trace = Trace(len(goal_seq)) if trace else None
+    if budget is not None:
+        budget.start()
+    try:
+        meet_start_state, meet_goal_state, extension_count = bidir_a_star_search(
+            initial_state, goal_seq, search_trace, budget)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time, search_trace)
+    return SearchResult(tuple(bidir_actions(meet_start_state, meet_goal_state)),
+                        meet_start_state.depth+meet_goal_state.depth, extension_count,
+                        perf_counter()-start_time, search_trace)
+
+
+def bidir_a_star(initial_state: State, goal_seq: Seq, show_all: bool = False) -> Digraph:
+    """ヒューリスティック関数を用いた双方向探索（MM）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        show_all (bool, optional): 展開された全てのノードを表示するか否か. Defaults to False.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    result = bidir_a_star_solve(initial_state, goal_seq, trace=True)
+    if not result.solved:
+        raise ValueError('目標状態に到達できません')
+
+    report(result.elapsed, result.extension_count, result.cost)
+
+    # グラフで可視化する
+    return render_bidir_trace(result.trace, "双方向A*探索", show_all)
 
 
 if __name__ == '__main__':
@@ -164,3 +351,5 @@ if __name__ == '__main__':
     goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
     graph = bidir(initial_state, goal_seq, True)
     graph.view()
+    graph = bidir_a_star(initial_state, goal_seq, True)
+    graph.view()
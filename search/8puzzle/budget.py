@@ -0,0 +1,120 @@
+"""探索の予算と中断"""
+import threading
+from time import monotonic
+from typing import Optional
+
+from base import SearchResult, Seq, State, is_solvable
+from common.metrics import SearchMetrics
+from search_trace import Trace
+
+
+class CancelToken:
+    def __init__(self, event: Optional[threading.Event] = None) -> None:
+        """探索の協調的な中断の要求
+
+        Args:
+            event (Optional[threading.Event], optional): 中断を表すイベント．
+                `multiprocessing.Event()`を渡せば別のプロセスの探索も中断できる. Defaults to None.
+        """
+        self.event = threading.Event() if event is None else event
+
+    def cancel(self) -> None:
+        """中断を要求する"""
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """中断が要求されたか否か"""
+        return self.event.is_set()
+
+
+class Budget:
+    def __init__(self, max_expansions: Optional[int] = None, time_limit: Optional[float] = None,
+                 deadline: Optional[float] = None, max_frontier: Optional[int] = None,
+                 cancel_token: Optional[CancelToken] = None, check_interval: int = 256) -> None:
+        """探索の予算
+
+        時刻と中断の要求は`check_interval`回の展開ごとに調べる．
+
+        Args:
+            max_expansions (Optional[int], optional): 展開回数の上限. Defaults to None.
+            time_limit (Optional[float], optional): 探索を始めてからの制限時間（秒）. Defaults to None.
+            deadline (Optional[float], optional): 締め切りの時刻（`time.monotonic()`の値）. Defaults to None.
+            max_frontier (Optional[int], optional): 辺境（キュー）の大きさの上限. Defaults to None.
+            cancel_token (Optional[CancelToken], optional): 中断の要求. Defaults to None.
+            check_interval (int, optional): 時刻と中断の要求を調べる展開回数の間隔. Defaults to 256.
+        """
+        self.max_expansions = max_expansions
+        self.time_limit = time_limit
+        self.deadline = deadline
+        self.max_frontier = max_frontier
+        self.cancel_token = cancel_token
+        self.check_interval = check_interval
+        self._deadline = deadline  # 制限時間も考慮した締め切り
+        self._next_check = 0  # 次に時刻と中断の要求を調べる展開回数
+
+    def start(self) -> None:
+        """探索の開始時に呼び，制限時間から締め切りを決める"""
+        self._deadline = self.deadline
+        self._next_check = 0
+        if self.time_limit is not None:
+            deadline = monotonic()+self.time_limit
+            self._deadline = deadline if self._deadline is None else min(
+                self._deadline, deadline)
+
+    def exceeded(self, extension_count: int, frontier_size: int) -> Optional[str]:
+        """予算を超えたか調べる
+
+        Args:
+            extension_count (int): これまでの展開回数
+            frontier_size (int): 辺境（キュー）の大きさ
+
+        Returns:
+            Optional[str]: 超えた場合はその理由（'max_expansions', 'max_frontier', 'deadline', 'cancelled'），
+                超えていなければNone
+        """
+        if self.max_expansions is not None and extension_count >= self.max_expansions:
+            return 'max_expansions'
+        if self.max_frontier is not None and frontier_size > self.max_frontier:
+            return 'max_frontier'
+        if extension_count >= self._next_check:
+            # 層ごとに調べる探索では展開回数がまとめて増えるので，剰余ではなく次に調べる回数と比べる
+            self._next_check = extension_count+self.check_interval
+            if self._deadline is not None and monotonic() >= self._deadline:
+                return 'deadline'
+            if self.cancel_token is not None and self.cancel_token.cancelled:
+                return 'cancelled'
+        return None
+
+
+class SearchStopped(Exception):
+    def __init__(self, reason: str, extension_count: int, best_state: Optional[State] = None,
+                 lower_bound: Optional[int] = None) -> None:
+        """解が見つかる前に探索を打ち切ったことを表す例外
+
+        Args:
+            reason (str): 打ち切った理由（'unsolvable'または`Budget.exceeded`の理由）
+            extension_count (int): 展開回数
+            best_state (Optional[State], optional): ヒューリスティック関数の値が最小だった状態. Defaults to None.
+            lower_bound (Optional[int], optional): 証明された最適な経路コストの下界. Defaults to None.
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.extension_count = extension_count
+        self.best_actions = None if best_state is None else tuple(best_state.actions())
+        self.best_h = None if best_state is None else best_state.h
+        self.lower_bound = lower_bound
+
+    def result(self, elapsed: float, trace: Optional[Trace] = None,
+               metrics: Optional[SearchMetrics] = None) -> SearchResult:
+        """解けなかったことを表す探索の結果を作る"""
+        return SearchResult((), None, self.extension_count, elapsed, trace, solved=False,
+                            reason=self.reason, best_actions=self.best_actions,
+                            best_h=self.best_h, lower_bound=self.lower_bound,
+                            metrics=None if metrics is None else metrics.finish(self.extension_count))
+
+
+def check_solvable(initial_state: State, goal_seq: Seq) -> None:
+    """目標状態に到達できない場合は探索を始めずに`SearchStopped`を送出する"""
+    if not is_solvable(initial_state.seq, goal_seq):
+        raise SearchStopped('unsolvable', 0, lower_bound=None)
@@ -0,0 +1,210 @@
+"""層をファイルに書き出す外部記憶の幅優先探索"""
+import heapq
+import mmap
+import tempfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, Optional
+
+from base import Action, Layout, SearchResult, Seq, State, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import report
+
+# メモリに保持する子の盤面の数の既定値（超えると整列して一時ファイルに書き出す）
+DEFAULT_BUFFER_SIZE = 1 << 20
+# ファイルを読み書きする単位（盤面の数）
+CHUNK_SIZE = 1 << 12
+
+
+def read_boards(path: Path) -> Iterator[int]:
+    """盤面のファイルを少しずつ読み込んで順に返す"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = array('Q')
+            data = f.read(chunk.itemsize*CHUNK_SIZE)
+            if not data:
+                return
+            chunk.frombytes(data)
+            yield from chunk
+
+
+def write_boards(path: Path, boards: Iterable[int]) -> int:
+    """盤面を8バイトずつのファイルに少しずつ書き出し，書き出した数を返す"""
+    count = 0
+    with open(path, 'wb') as f:
+        chunk = array('Q')
+        for board in boards:
+            chunk.append(board)
+            if len(chunk) >= CHUNK_SIZE:
+                chunk.tofile(f)
+                count += len(chunk)
+                chunk = array('Q')
+        chunk.tofile(f)
+        count += len(chunk)
+    return count
+
+
+def unique(boards: Iterable[int]) -> Iterator[int]:
+    """整列した盤面の列から重複を除く"""
+    prev = None
+    for board in boards:
+        if board != prev:
+            yield board
+            prev = board
+
+
+def difference(boards: Iterable[int], *excluded: Iterable[int]) -> Iterator[int]:
+    """整列した盤面の列から，整列した他の列のいずれかに含まれる盤面を除く"""
+    others = heapq.merge(*excluded)
+    other = next(others, None)
+    for board in boards:
+        while other is not None and other < board:
+            other = next(others, None)
+        if other != board:
+            yield board
+
+
+def find_blank(board: int, layout: Layout) -> int:
+    """整数に詰めた盤面の空きマスの位置"""
+    for i in range(layout.cells):
+        if (board >> (layout.bits*i)) & layout.mask == 0:
+            return i
+    raise ValueError('空きマスがありません')
+
+
+class LayerFile:
+    def __init__(self, path: Path) -> None:
+        """整列した盤面の層のファイルをメモリマップで読み込み，二分探索で盤面を探す"""
+        self.file = open(path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.boards = memoryview(self.mmap).cast('Q')
+
+    def __contains__(self, board: int) -> bool:
+        i = bisect_left(self.boards, board)
+        return i < len(self.boards) and self.boards[i] == board
+
+    def close(self) -> None:
+        self.boards.release()
+        self.mmap.close()
+        self.file.close()
+
+
+def _backtrack(layout: Layout, layer_paths: list[Path], board: int) -> list[Action]:
+    """最後の層の盤面から1つ前の層のファイルにある親を順にたどり，初期状態からの行為の列を求める"""
+    actions: list[Action] = []
+    blank = find_blank(board, layout)
+    for path in reversed(layer_paths[:-1]):
+        layer = LayerFile(path)
+        try:
+            for pos, shift, coef, _action, reverse in layout.moves[blank]:
+                parent = board+((board >> shift) & layout.mask)*coef
+                if parent in layer:
+                    # 親から見ると逆向きの行為で現在の盤面になる
+                    actions.append(reverse)
+                    board, blank = parent, pos
+                    break
+        finally:
+            layer.close()
+    actions.reverse()
+    return actions
+
+
+def external_bfs_search(initial_state: State, goal_seq: Seq, work_dir: Path,
+                        buffer_size: int = DEFAULT_BUFFER_SIZE,
+                        budget: Optional[Budget] = None) -> tuple[list[Action], int]:
+    """層をファイルに書き出す幅優先探索（グラフ探索）の本体
+
+    各層は整列した盤面のファイルとし，読みながら子を生成する．子は`buffer_size`個ごとに整列して一時ファイルに書き出し，
+    全ての一時ファイルを併合して重複を除き，さらに1つ前の層と同じ層の盤面を除いて次の層のファイルとする（遅延重複検出）．
+    解の経路は層のファイルを逆にたどって求める．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        work_dir (Path): 層のファイルを置くディレクトリ
+        buffer_size (int, optional): メモリに保持する子の盤面の数の上限. Defaults to DEFAULT_BUFFER_SIZE.
+        budget (Optional[Budget], optional): 探索の予算．辺境の大きさには層の大きさを用いる. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
+
+    Returns:
+        tuple[list[Action], int]: 初期状態から目標状態までの行為の列と展開回数（展開した盤面の数）
+    """
+    check_solvable(initial_state, goal_seq)
+    layout = initial_state.layout
+    if layout.cells*layout.bits > 64:
+        raise ValueError(f'{layout.cells}マスの盤面は64ビットに収まりません')
+    goal_board = pack_seq(goal_seq)
+    work_dir = Path(work_dir)
+
+    layer_paths = [work_dir/'layer0.bin']  # 深さごとの層のファイル
+    layer_size = write_boards(layer_paths[0], [initial_state.board])
+    extension_count = 0  # 展開した回数
+    while layer_size > 0:
+        depth = len(layer_paths)-1
+        run_paths: list[Path] = []  # 整列した子の一時ファイル
+        buffer = array('Q')
+        for board in read_boards(layer_paths[-1]):
+            if board == goal_board:
+                return _backtrack(layout, layer_paths, board), extension_count
+            if budget is not None:
+                reason = budget.exceeded(extension_count, layer_size)
+                if reason is not None:
+                    # この層より浅い盤面は全て調べ終えている
+                    raise SearchStopped(reason, extension_count, lower_bound=depth)
+            extension_count += 1
+            for _pos, shift, coef, _action, _reverse in layout.moves[find_blank(board, layout)]:
+                buffer.append(board+((board >> shift) & layout.mask)*coef)
+            if len(buffer) >= buffer_size:
+                run_paths.append(work_dir/f'run{len(run_paths)}.bin')
+                write_boards(run_paths[-1], unique(sorted(buffer)))
+                buffer = array('Q')
+        runs: list[Iterable[int]] = [read_boards(path) for path in run_paths]
+        runs.append(unique(sorted(buffer)))
+        del buffer
+        # 隣接する盤面は1つ前・同じ・1つ後の層にしかないので，前の層と同じ層の盤面を除けば次の層になる
+        previous = [read_boards(path) for path in layer_paths[-2:]]
+        layer_paths.append(work_dir/f'layer{depth+1}.bin')
+        layer_size = write_boards(layer_paths[-1],
+                                  difference(unique(heapq.merge(*runs)), *previous))
+        for path in run_paths:
+            path.unlink()
+    raise SearchStopped('unsolvable', extension_count)
+
+
+def external_bfs_solve(initial_state: State, goal_seq: Seq, work_dir: Optional[Path] = None,
+                       buffer_size: int = DEFAULT_BUFFER_SIZE, budget: Optional[Budget] = None) -> SearchResult:
+    """層をファイルに書き出す幅優先探索で解を求める
+
+    層のファイルは`work_dir`の中の一時ディレクトリに作り，終了時に削除する．探索の過程は記録しない．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        work_dir (Optional[Path], optional): 一時ディレクトリを作るディレクトリ. Defaults to None（システムの既定）.
+        buffer_size (int, optional): メモリに保持する子の盤面の数の上限. Defaults to DEFAULT_BUFFER_SIZE.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    if budget is not None:
+        budget.start()
+    with tempfile.TemporaryDirectory(prefix='external_bfs_', dir=work_dir) as tmp_dir:
+        try:
+            actions, extension_count = external_bfs_search(
+                initial_state, goal_seq, Path(tmp_dir), buffer_size, budget)
+        except SearchStopped as stopped:
+            return stopped.result(perf_counter()-start_time)
+    return SearchResult(tuple(actions), len(actions), extension_count, perf_counter()-start_time)
+
+
+if __name__ == '__main__':
+    initial_state = State((8, 6, 7, 2, 5, 4, 3, 0, 1), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 4, 5, 6, 7, 8, 0)
+    result = external_bfs_solve(initial_state, goal_seq, buffer_size=1 << 14)
+    report(result.elapsed, result.extension_count, result.cost)
@@ -0,0 +1,281 @@
+"""盤面のハッシュで分担する並列A*探索(HDA*)"""
+import os
+import sys
+from multiprocessing import Array, Event, Process, Queue, Value
+from queue import Empty
+from time import perf_counter
+from typing import Optional
+
+from base import Action, SearchResult, Seq, State, get_layout, pack_seq
+from batch import HEURISTICS
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import report
+from common.priority_queue import BucketQueue
+
+# 子を送るまでに展開する状態の数（送る子の束の大きさの目安）
+DEFAULT_BATCH_SIZE = 64
+# 終了を判定する間隔（秒）
+POLL_INTERVAL = 0.005
+
+# ワーカー間で送る状態 (盤面, 空きマスの位置, g, h, 行為の列を2ビットずつ詰めた整数)
+Node = tuple[int, int, int, int, int]
+
+
+def owner(board: int, processes: int) -> int:
+    """盤面を担当するワーカーの番号（乗算ハッシュの上位ビットで分ける）"""
+    return ((board*0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * processes >> 64
+
+
+def decode_actions(code: int, length: int) -> list[Action]:
+    """行為の列を2ビットずつ詰めた整数から行為の列に戻す"""
+    return [Action(((code >> (2*(length-1-i))) & 3)+1) for i in range(length)]
+
+
+def _worker(index: int, inboxes: list[Queue], heuristic_name: str, goal_seq: Seq, batch_size: int,
+            incumbent, results: Queue, sent, received, idle, expansions, frontiers, min_fs, stop) -> None:
+    """担当する盤面をA*探索で展開するワーカー
+
+    受け取った状態は盤面ごとの最良のgより小さい場合だけ自分のキューに追加する．
+    展開して生じた子は担当するワーカーごとに束ねて送り，fが暫定解のコスト以上の状態は捨てる．
+    """
+    for inbox in inboxes:
+        # 読まれずに残った束があってもワーカーを終了できるようにする
+        inbox.cancel_join_thread()
+    heuristic = HEURISTICS[heuristic_name](goal_seq)
+    delta = getattr(heuristic, 'delta', None)
+    layout = get_layout(len(goal_seq))
+    goal_board = pack_seq(goal_seq)
+    processes = len(inboxes)
+    inbox = inboxes[index]
+
+    q: BucketQueue[Node] = BucketQueue(deeper_first=True)
+    best_g: dict[int, int] = {}  # 担当する盤面ごとの最良のg
+    outboxes: list[list[Node]] = [[] for _ in range(processes)]
+    extension_count = 0
+
+    def receive(batch: list[Node]) -> None:
+        for node in batch:
+            board, _blank, g, h, _code = node
+            if g < best_g.get(board, sys.maxsize):
+                best_g[board] = g
+                q.push(g+h, node, g)
+
+    def send(owner_index: int) -> None:
+        batch = outboxes[owner_index]
+        # 受け取った数が送った数を超えないように先に数える
+        sent[index] += len(batch)
+        inboxes[owner_index].put(batch)
+        outboxes[owner_index] = []
+
+    while not stop.is_set():
+        # 届いた束を全て受け取る
+        while True:
+            try:
+                batch = inbox.get_nowait()
+            except Empty:
+                break
+            idle[index] = 0
+            receive(batch)
+            received[index] += len(batch)
+
+        # fが最小の状態から最大batch_size個を展開する
+        bound = incumbent.value  # 暫定解のコスト
+        for _ in range(batch_size):
+            if len(q) == 0:
+                break
+            f, (board, blank, g, h, code) = q.pop()
+            if f >= bound:
+                # 残りの状態も暫定解より良くならない
+                q = BucketQueue(deeper_first=True)
+                break
+            if g > best_g[board]:
+                # より良い経路で既に現れた盤面なので読み飛ばす
+                continue
+            idle[index] = 0
+            state = State.from_board(board, blank, layout, g,
+                                     Action((code & 3)+1) if g > 0 else Action.NONE, None)
+            state.h = h
+            extension_count += 1
+            for child in state.extend():
+                child_h = heuristic(child) if delta is None else h + \
+                    delta(state, child)
+                if child.depth+child_h >= bound:
+                    continue
+                child_code = code*4+child.prev_act.value-1
+                if child.board == goal_board:
+                    # 暫定解を更新する
+                    with incumbent.get_lock():
+                        if child.depth < incumbent.value:
+                            incumbent.value = child.depth
+                            results.put((child.depth, child_code))
+                    bound = min(bound, child.depth)
+                    continue
+                node = (child.board, child.blank,
+                        child.depth, child_h, child_code)
+                child_owner = owner(child.board, processes)
+                if child_owner == index:
+                    receive([node])
+                else:
+                    outboxes[child_owner].append(node)
+                    if len(outboxes[child_owner]) >= batch_size:
+                        send(child_owner)
+
+        for owner_index in range(processes):
+            if outboxes[owner_index]:
+                send(owner_index)
+        expansions[index] = extension_count
+        frontiers[index] = len(q)
+        min_fs[index] = q.min_priority() if len(q) > 0 else sys.maxsize
+
+        if len(q) == 0:
+            # 展開する状態がないので届くのを待つ
+            idle[index] = 1
+            try:
+                batch = inbox.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+            idle[index] = 0
+            receive(batch)
+            received[index] += len(batch)
+
+
+def hda_star_search(initial_state: State, goal_seq: Seq, heuristic: str = 'h2', processes: Optional[int] = None,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    budget: Optional[Budget] = None) -> tuple[list[Action], int]:
+    """HDA*探索の本体
+
+    盤面のハッシュで担当を決めた`processes`個のワーカーが各自のキューでA*探索を行い，子は担当のワーカーへ送る．
+    目標状態が現れると暫定解とし，全てのワーカーに暫定解のコスト未満のfの状態がなく，送った状態が全て受け取られたとき
+    （2回続けて同じ数を観測したとき）最適解として終了する．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (str, optional): ヒューリスティック関数の名前（`batch.HEURISTICS`のキー）. Defaults to 'h2'.
+        processes (Optional[int], optional): ワーカーの数. Defaults to None（CPUの数）.
+        batch_size (int, optional): 子を送るまでに展開する状態の数と送る束の大きさの上限. Defaults to 64.
+        budget (Optional[Budget], optional): 探索の予算．終了の判定ごとに全ワーカーの合計で調べる. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
+
+    Returns:
+        tuple[list[Action], int]: 初期状態から目標状態までの行為の列と展開回数（全ワーカーの合計）
+    """
+    check_solvable(initial_state, goal_seq)
+    if initial_state.board == pack_seq(goal_seq):
+        return [], 0
+    if processes is None:
+        processes = os.cpu_count() or 1
+    # 表を持つヒューリスティック関数は，ワーカーが同時に作らないようにここで作ってファイルに保存しておく
+    initial_state.h = HEURISTICS[heuristic](goal_seq)(initial_state)
+
+    inboxes = [Queue() for _ in range(processes)]
+    results: Queue = Queue()  # 暫定解 (コスト, 行為の列を詰めた整数)
+    incumbent = Value('q', sys.maxsize)  # 暫定解のコスト
+    # ワーカーごとの値（sentの最後は初期状態を送った親プロセスの分）
+    sent = Array('q', processes+1, lock=False)
+    received = Array('q', processes, lock=False)
+    idle = Array('b', processes, lock=False)
+    expansions = Array('q', processes, lock=False)
+    frontiers = Array('q', processes, lock=False)
+    min_fs = Array('q', processes, lock=False)
+    stop = Event()
+
+    workers = [Process(target=_worker, args=(i, inboxes, heuristic, goal_seq, batch_size, incumbent, results,
+                                             sent, received, idle, expansions, frontiers, min_fs, stop),
+                       daemon=True)
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    sent[processes] = 1
+    inboxes[owner(initial_state.board, processes)].put(
+        [(initial_state.board, initial_state.blank, 0, initial_state.h, 0)])
+
+    best: Optional[tuple[int, int]] = None  # 最良の暫定解
+    prev_counts = None  # 前回観測した(送った数, 受け取った数)
+    try:
+        while True:
+            try:
+                solution = results.get(timeout=POLL_INTERVAL)
+                if best is None or solution[0] < best[0]:
+                    best = solution
+                continue
+            except Empty:
+                pass
+            counts = (sum(sent), sum(received))
+            if all(idle) and counts[0] == counts[1]:
+                if counts == prev_counts:
+                    # 2回続けて全ワーカーが待機中で送受信の数も変わらないので終了
+                    break
+                prev_counts = counts
+            else:
+                prev_counts = None
+            if budget is not None:
+                extension_count = sum(expansions)
+                reason = budget.exceeded(extension_count, sum(frontiers))
+                if reason is not None:
+                    if all(idle) and sum(sent) == sum(received):
+                        # 辺境にもキューにも状態がないので，暫定解のコストが最適
+                        lower_bound = min(min(min_fs), incumbent.value)
+                        lower_bound = lower_bound if lower_bound < sys.maxsize else None
+                    else:
+                        # キューにある状態のfや古いmin_fsは信頼できないので，初期状態のhを下界とする
+                        lower_bound = initial_state.h
+                    stopped = SearchStopped(reason, extension_count, lower_bound=lower_bound)
+                    if best is not None:
+                        # 暫定解はヒューリスティック関数の値が0の状態
+                        stopped.best_actions = tuple(decode_actions(best[1], best[0]))
+                        stopped.best_h = 0
+                    raise stopped
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    while True:
+        # 終了前に送られた暫定解を受け取る
+        try:
+            solution = results.get_nowait()
+        except Empty:
+            break
+        if best is None or solution[0] < best[0]:
+            best = solution
+    if best is None:
+        raise SearchStopped('unsolvable', sum(expansions))
+    cost, code = best
+    return decode_actions(code, cost), sum(expansions)
+
+
+def hda_star_solve(initial_state: State, goal_seq: Seq, heuristic: str = 'h2', processes: Optional[int] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE, budget: Optional[Budget] = None) -> SearchResult:
+    """HDA*探索で解を求める
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (str, optional): ヒューリスティック関数の名前（`batch.HEURISTICS`のキー）. Defaults to 'h2'.
+        processes (Optional[int], optional): ワーカーの数. Defaults to None（CPUの数）.
+        batch_size (int, optional): 子を送るまでに展開する状態の数と送る束の大きさの上限. Defaults to 64.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    if budget is not None:
+        budget.start()
+    try:
+        actions, extension_count = hda_star_search(
+            initial_state, goal_seq, heuristic, processes, batch_size, budget)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time)
+    return SearchResult(tuple(actions), len(actions), extension_count, perf_counter()-start_time)
+
+
+if __name__ == '__main__':
+    initial_state = State((6, 15, 7, 4, 2, 0, 1, 3, 5, 14, 8, 11, 13, 10, 12, 9),
+                          0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 0)
+    result = hda_star_solve(initial_state, goal_seq)
+    report(result.elapsed, result.extension_count, result.cost)
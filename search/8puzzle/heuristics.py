@@ -0,0 +1,200 @@
+"""マンハッタン距離より強い許容的なヒューリスティック関数"""
+from collections import deque
+from functools import lru_cache
+
+from base import Digit, Seq, State, get_layout, manhattan_distance
+
+
+def _min_removals(goal_indices: list[int]) -> int:
+    """列の中の位置の並びを昇順にするために取り除く必要がある最小の数（長さから最長増加部分列の長さを引いたもの）"""
+    tails: list[int] = []  # 長さごとの増加部分列の末尾の最小値
+    for x in goal_indices:
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if tails[mid] < x:
+                lo = mid+1
+            else:
+                hi = mid
+        if lo == len(tails):
+            tails.append(x)
+        else:
+            tails[lo] = x
+    return len(goal_indices)-len(tails)
+
+
+class LinearConflict:
+    def __init__(self, goal_seq: Seq) -> None:
+        """ヒューリスティック関数（マンハッタン距離と線形衝突）
+
+        目標状態と同じ行（列）にあるタイルどうしの順序が逆転している場合，一方のタイルは行（列）から一度外れる必要があるので，
+        行（列）ごとに逆転を解消するために取り除くタイルの最小数の2倍をマンハッタン距離に加える．
+        行（列）の盤面の値から衝突の数への表は，現れた値ごとに一度だけ求めて保持する．
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+        """
+        self.manhattan = manhattan_distance(goal_seq)
+        self.layout = get_layout(len(goal_seq))
+        n = self.layout.n
+        # 行と列（行0..n-1，列n..2n-1）ごとのマスの位置
+        self.lines: list[tuple[int, ...]] = [tuple(range(r*n, r*n+n)) for r in range(n)] + \
+            [tuple(range(c, n*n, n)) for c in range(n)]
+        # 数字ごとの目標状態での(行の番号, 列の番号, 行の中の位置, 列の中の位置)
+        self.goal_lines: list[tuple[int, int, int, int]] = [(0, 0, 0, 0)]*len(goal_seq)
+        for pos, d in enumerate(goal_seq):
+            r, c = divmod(pos, n)
+            self.goal_lines[d] = (r, n+c, c, r)
+        self.tables: list[dict[int, int]] = [{} for _ in self.lines]  # 行（列）ごとの衝突の数の表
+
+    def _line_key(self, board: int, line: int) -> int:
+        """行（列）の数字を詰めた整数"""
+        bits, mask = self.layout.bits, self.layout.mask
+        key = 0
+        for k, pos in enumerate(self.lines[line]):
+            key |= ((board >> (bits*pos)) & mask) << (bits*k)
+        return key
+
+    def _conflicts(self, line: int, key: int) -> int:
+        """行（列）の衝突を解消するために取り除くタイルの最小数"""
+        bits, mask = self.layout.bits, self.layout.mask
+        n = self.layout.n
+        goal_indices = []
+        for _ in range(n):
+            d = key & mask
+            key >>= bits
+            if d == 0:
+                continue
+            goal_row, goal_col, index_in_row, index_in_col = self.goal_lines[d]
+            if line < n and goal_row == line:
+                goal_indices.append(index_in_row)
+            elif line >= n and goal_col == line:
+                goal_indices.append(index_in_col)
+        return _min_removals(goal_indices)
+
+    def line_conflicts(self, board: int, line: int) -> int:
+        """表を用いた行（列）の衝突の数"""
+        key = self._line_key(board, line)
+        table = self.tables[line]
+        conflicts = table.get(key)
+        if conflicts is None:
+            conflicts = self._conflicts(line, key)
+            table[key] = conflicts
+        return conflicts
+
+    def __call__(self, state: State) -> int:
+        """ヒューリスティック関数の値"""
+        board = state.board
+        return self.manhattan(state)+2*sum(self.line_conflicts(board, line) for line in range(len(self.lines)))
+
+    def delta(self, state: State, child: State) -> int:
+        """状態から子の状態への値の変化量（動いたタイルの行と列のみ調べ直す）"""
+        n = self.layout.n
+        lines = {state.blank//n, child.blank//n,
+                 n+state.blank % n, n+child.blank % n}
+        conflicts = sum(self.line_conflicts(child.board, line)-self.line_conflicts(state.board, line)
+                        for line in lines)
+        return self.manhattan.delta(state, child)+2*conflicts
+
+
+def build_walking_table(goal_lines: list[int], n: int) -> dict[tuple[int, ...], int]:
+    """ウォーキングディスタンスの表を目標状態からの幅優先探索で作る
+
+    行ごとに「目標状態でどの行にあるタイルが何枚あるか」の表（n×n）を状態とし，空きマスと隣の行のタイルの交換を移動とする．
+
+    Args:
+        goal_lines (list[int]): 数字ごとの目標状態での行の番号（列の表の場合は列の番号）
+        n (int): 盤面の一辺の長さ
+
+    Returns:
+        dict[tuple[int, ...], int]: 行ごとの枚数の表を平らにしたものから移動回数への表
+    """
+    blank_line = goal_lines[0]
+    counts = [0]*(n*n)
+    for d, line in enumerate(goal_lines):
+        if d != 0:
+            counts[line*n+line] += 1
+    start = tuple(counts)
+    table = {start: 0}
+    q = deque([(start, blank_line)])
+    while q:
+        counts, blank = q.popleft()
+        distance = table[counts]
+        for line in (blank-1, blank+1):
+            if not 0 <= line < n:
+                continue
+            for g in range(n):
+                if counts[line*n+g] == 0:
+                    continue
+                # 隣の行の目標状態で行gにあるタイルを空きマスの行に動かす
+                child = list(counts)
+                child[line*n+g] -= 1
+                child[blank*n+g] += 1
+                child = tuple(child)
+                if child not in table:
+                    table[child] = distance+1
+                    q.append((child, line))
+    return table
+
+
+class WalkingDistance:
+    def __init__(self, goal_seq: Seq) -> None:
+        """ヒューリスティック関数（ウォーキングディスタンス）
+
+        縦の移動だけでタイルを目標状態の行に揃える最小の回数と，横の移動だけで列に揃える最小の回数の和．
+        行と列ごとのタイルの枚数の表からの移動回数は，作成時の幅優先探索で全て求めておく．
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+        """
+        self.layout = get_layout(len(goal_seq))
+        n = self.layout.n
+        goal_rows: list[int] = [0]*len(goal_seq)  # 数字ごとの目標状態での行
+        goal_cols: list[int] = [0]*len(goal_seq)  # 数字ごとの目標状態での列
+        for pos, d in enumerate(goal_seq):
+            goal_rows[d], goal_cols[d] = divmod(pos, n)
+        self.goal_rows = goal_rows
+        self.goal_cols = goal_cols
+        self.row_table = build_walking_table(goal_rows, n)
+        self.col_table = build_walking_table(goal_cols, n)
+
+    def __call__(self, state: State) -> int:
+        """ヒューリスティック関数の値"""
+        n = self.layout.n
+        bits, mask = self.layout.bits, self.layout.mask
+        board = state.board
+        row_counts = [0]*(n*n)
+        col_counts = [0]*(n*n)
+        for pos in range(self.layout.cells):
+            d: Digit = board & mask
+            board >>= bits
+            if d != 0:
+                r, c = divmod(pos, n)
+                row_counts[r*n+self.goal_rows[d]] += 1
+                col_counts[c*n+self.goal_cols[d]] += 1
+        return self.row_table[tuple(row_counts)]+self.col_table[tuple(col_counts)]
+
+
+@lru_cache
+def linear_conflict(goal_seq: Seq) -> LinearConflict:
+    """目標状態ごとに作った`LinearConflict`"""
+    return LinearConflict(goal_seq)
+
+
+@lru_cache
+def walking_distance(goal_seq: Seq) -> WalkingDistance:
+    """目標状態ごとに作った`WalkingDistance`"""
+    return WalkingDistance(goal_seq)
+
+
+if __name__ == '__main__':
+    from a_star import a_star_solve
+    from base import Action, ManhattanDistance
+    from common.metrics import report
+
+    initial_state = State((8, 6, 7, 2, 5, 4, 3, 0, 1), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 4, 5, 6, 7, 8, 0)
+    for heuristic in (ManhattanDistance(goal_seq), LinearConflict(goal_seq), WalkingDistance(goal_seq)):
+        result = a_star_solve(State(initial_state.seq, 0, Action.NONE, None), goal_seq, heuristic)
+        print(type(heuristic).__name__)
+        report(result.elapsed, result.extension_count, result.cost)
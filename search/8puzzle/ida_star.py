@@ -0,0 +1,201 @@
+"""IDA*探索"""
+import sys
+from time import perf_counter
+from typing import Callable, Optional
+
+from graphviz import Digraph
+
+from base import Action, ManhattanDistance, SearchResult, Seq, State, TableHeuristic, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import SearchMetrics, SearchObserver, report
+from render import render_trace
+from search_trace import Trace
+
+# 解が見つかったことを表す探索の返り値
+FOUND = -1
+
+
+def ida_star_search(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                    budget: Optional[Budget] = None, metrics: Optional[SearchMetrics] = None,
+                    observer: Optional[SearchObserver[State]] = None) -> tuple[list[Action], int]:
+    """IDA*探索（反復深化A*探索）の本体
+
+    fの上限以下の範囲で深さ優先探索を行い，見つからなければ上限を超えたfの最小値を新たな上限として繰り返す．
+    1つの盤面をその場で動かしては戻すため，用いるメモリは解の深さに比例する分のみである．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): ヒューリスティック関数．
+            `TableHeuristic`の場合は動かした数字の差分で評価する．
+        budget (Optional[Budget], optional): 探索の予算．辺境の大きさには探索中の深さを用いる. Defaults to None.
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数を記録する．
+            直前の行為を打ち消す移動を重複とし，辺境の大きさの代わりに探索中の深さの最大値を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は展開ごとに呼ぶ観測者．
+            子の状態を作らないので`on_generate`は呼ばず，`on_expand`にはその場で動かす状態を渡す. Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
+
+    Returns:
+        tuple[list[Action], int]: 初期状態から目標状態までの行為の列と展開回数
+    """
+    check_solvable(initial_state, goal_seq)
+    goal_board = pack_seq(goal_seq)  # 整数に詰めた目標状態の盤面
+    # 探索中にその場で動かす盤面（初期状態は書き換えない）
+    state = State.from_board(initial_state.board, initial_state.blank, initial_state.layout,
+                             0, Action.NONE, None)
+    moves = state.layout.moves
+    mask = state.layout.mask
+    move_delta = heuristic.move_delta if isinstance(
+        heuristic, TableHeuristic) else None
+
+    actions: list[Action] = []  # 初期状態からの行為の列
+    extension_count = 0  # 展開した回数
+    # 打ち切った場合に返すヒューリスティック関数の値が最小の状態への行為の列とその値
+    best_actions: tuple[Action, ...] = ()
+    best_h = heuristic(state)
+    if metrics is not None:
+        metrics.start_counting()
+
+    def search(g: int, h: int, bound: int, prev_act: Action) -> int:
+        """上限`bound`以下の深さ優先探索
+
+        Returns:
+            int: 解が見つかればFOUND，見つからなければ上限を超えたfの最小値
+        """
+        nonlocal extension_count, best_actions, best_h
+        f = g+h
+        if f > bound:
+            return f
+        if state.board == goal_board:
+            return FOUND
+        if h < best_h:
+            best_actions, best_h = tuple(actions), h
+        if budget is not None:
+            reason = budget.exceeded(extension_count, len(actions))
+            if reason is not None:
+                # 現在の上限未満のfで解が見つからなかったことは証明済み
+                stopped = SearchStopped(reason, extension_count, lower_bound=bound)
+                stopped.best_actions, stopped.best_h = best_actions, best_h
+                raise stopped
+        if observer is not None:
+            observer.on_expand(state, extension_count)
+        extension_count += 1
+        if metrics is not None:
+            metrics.generations += len(moves[state.blank])
+            metrics.max_frontier = max(metrics.max_frontier, len(actions))
+        min_f = sys.maxsize
+        blank = state.blank
+        for pos, shift, _coef, action, reverse in moves[blank]:
+            if reverse is prev_act:
+                # 直前の行為を打ち消す移動はしない
+                if metrics is not None:
+                    metrics.duplicates += 1
+                continue
+            if move_delta is not None:
+                child_h = h+move_delta((state.board >> shift) & mask, pos, blank)
+                state.move(pos)
+            else:
+                state.move(pos)
+                child_h = heuristic(state)
+            actions.append(action)
+            t = search(g+1, child_h, bound, action)
+            if t == FOUND:
+                return FOUND
+            actions.pop()
+            state.move(blank)  # 元に戻す
+            min_f = min(min_f, t)
+        return min_f
+
+    h = heuristic(state)
+    bound = h  # fの上限
+    while True:
+        t = search(0, h, bound, Action.NONE)
+        if t == FOUND:
+            break
+        bound = t
+
+    return actions, extension_count
+
+
+def ida_star_solve(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int],
+                   trace: bool = False, budget: Optional[Budget] = None,
+                   observer: Optional[SearchObserver[State]] = None) -> SearchResult:
+    """IDA*探索で解を求める（表示や可視化をしない）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): ヒューリスティック関数
+        trace (bool, optional): 解の経路を記録するか否か．探索木は保持しないので展開した全てのノードは記録できない.
+            Defaults to False.
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 展開ごとに呼ぶ観測者. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    metrics = SearchMetrics()
+    if budget is not None:
+        budget.start()
+    try:
+        with metrics.phase('search'):
+            actions, extension_count = ida_star_search(
+                initial_state, goal_seq, heuristic, budget, metrics, observer)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time, metrics=metrics)
+    elapsed = perf_counter()-start_time
+
+    search_trace = None
+    if trace:
+        # 初期状態から解の経路をたどって記録する
+        search_trace = Trace(len(goal_seq))
+        state = State(initial_state.seq, 0, Action.NONE, None)
+        for action in [None]+actions:
+            if action is not None:
+                state = next(child for child in state.extend()
+                             if child.prev_act is action)
+            state.h = heuristic(state)
+            search_trace.add(state)
+        search_trace.goal_id = state.trace_id
+    return SearchResult(tuple(actions), len(actions), extension_count, elapsed, search_trace,
+                        metrics=metrics.finish(extension_count))
+
+
+def ida_star(initial_state: State, goal_seq: Seq, heuristic: Callable[[State], int]) -> Digraph:
+    """IDA*探索（反復深化A*探索）
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        heuristic (Callable[[State], int]): ヒューリスティック関数．
+            `TableHeuristic`の場合は動かした数字の差分で評価する．
+
+    Returns:
+        Digraph: 解の経路のグラフ(graphviz)
+    """
+    result = ida_star_solve(initial_state, goal_seq, heuristic, trace=True)
+    if not result.solved:
+        raise ValueError('目標状態に到達できません')
+
+    report(result.elapsed, result.extension_count, result.cost)
+
+    # 解の経路を表示
+    return render_trace(result.trace, "IDA*探索", False,
+                        lambda state: f'f={state.depth+state.h}<BR/>g={state.depth}<BR/>h={state.h}')
+
+
+if __name__ == '__main__':
+    initial_state = State((2, 8, 3, 1, 6, 4, 7, 0, 5), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
+    graph = ida_star(initial_state, goal_seq, ManhattanDistance(goal_seq))
+    graph.view()
+
+    # 15パズル
+    initial_state = State((6, 15, 7, 4, 2, 0, 1, 3, 5, 14, 8, 11, 13, 10, 12, 9),
+                          0, Action.NONE, None)
+    goal_seq = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 0)
+    graph = ida_star(initial_state, goal_seq, ManhattanDistance(goal_seq))
+    graph.view()
@@ -0,0 +1,132 @@
+"""全状態の距離表による最適解の問い合わせ"""
+from math import factorial
+from pathlib import Path
+from typing import Optional
+
+from base import Action, Seq, State, get_layout, pack_seq, unpack_board
+from table import TABLE_DIR, load_table
+
+# 表に記録されていない（到達できない）ことを表す値
+UNREACHABLE = 0xFF
+
+
+def rank_seq(seq: Seq) -> int:
+    """盤面（順列）の順位（Myrvold-Ruskey）．0から`len(seq)!-1`までの値をとる．"""
+    n = len(seq)
+    pi = list(seq)
+    inv = [0]*n  # 逆置換
+    for i, s in enumerate(pi):
+        inv[s] = i
+    rank = 0
+    radix = 1
+    for k in range(n, 1, -1):
+        s = pi[k-1]
+        j = inv[k-1]
+        pi[k-1], pi[j] = pi[j], pi[k-1]
+        inv[s], inv[k-1] = inv[k-1], inv[s]
+        rank += s*radix
+        radix *= k
+    return rank
+
+
+def unrank_seq(rank: int, n: int = 9) -> Seq:
+    """順位から盤面（順列）に戻す（`rank_seq`の逆）"""
+    pi = list(range(n))
+    for k in range(n, 1, -1):
+        rank, s = divmod(rank, k)
+        pi[k-1], pi[s] = pi[s], pi[k-1]
+    return tuple(pi)
+
+
+def build_distance_table(goal_seq: Seq) -> bytes:
+    """目標状態からの逆向きの幅優先探索で，全ての盤面の目標状態までの距離の表を作る
+
+    Args:
+        goal_seq (Seq): 目標状態の盤面
+
+    Returns:
+        bytes: 盤面の順位で引く距離の表．到達できない盤面はUNREACHABLE．
+    """
+    cells = len(goal_seq)
+    layout = get_layout(cells)
+    mask = layout.mask
+    dist = bytearray([UNREACHABLE])*factorial(cells)
+    goal_board = pack_seq(goal_seq)
+    visited: set[int] = {goal_board}
+    layer = [(goal_board, goal_seq.index(0))]  # 現在の深さの(盤面, 空きマスの位置)
+    depth = 0
+    while layer:
+        next_layer = []
+        for board, blank in layer:
+            dist[rank_seq(unpack_board(board, cells))] = depth
+            for pos, shift, coef, _action, _reverse in layout.moves[blank]:
+                child = board+((board >> shift) & mask)*coef
+                if child not in visited:
+                    visited.add(child)
+                    next_layer.append((child, pos))
+        layer = next_layer
+        depth += 1
+    return bytes(dist)
+
+
+class DistanceOracle:
+    def __init__(self, goal_seq: Seq, table_dir: Path = TABLE_DIR) -> None:
+        """全ての盤面の目標状態までの距離を引ける表
+
+        表は目標状態ごとにファイルに保存し，既にあれば作らずにメモリマップで読み込む．
+        8パズルの盤面は9!通りなので表は362,880バイトとなる．
+        ヒューリスティック関数として呼び出すと真の距離（完全なヒューリスティック関数）を返す．
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+            table_dir (Path, optional): 表を保存するディレクトリ. Defaults to TABLE_DIR.
+        """
+        if len(goal_seq) > 9:
+            raise ValueError('全状態の距離表は8パズルのみに対応しています')
+        self.goal_seq = goal_seq
+        goal_key = '-'.join(map(str, goal_seq))
+        self.table = load_table(Path(table_dir)/f'oracle_{goal_key}.bin',
+                                lambda: build_distance_table(goal_seq))
+
+    def distance(self, seq: Seq) -> Optional[int]:
+        """盤面から目標状態までの最短距離．到達できない場合はNone．"""
+        d = self.table[rank_seq(seq)]
+        return None if d == UNREACHABLE else d
+
+    def __call__(self, state: State) -> int:
+        """ヒューリスティック関数の値（真の距離）"""
+        return self.table[rank_seq(state.seq)]
+
+    def solve(self, initial_state: State) -> Optional[list[State]]:
+        """距離が1ずつ減る子をたどって最適解を求める
+
+        Args:
+            initial_state (State): 初期状態
+
+        Returns:
+            Optional[list[State]]: 初期状態から目標状態までの経路．到達できない場合はNone．
+        """
+        d = self.distance(initial_state.seq)
+        if d is None:
+            return None
+        path = [initial_state]
+        state = initial_state
+        while d > 0:
+            d -= 1
+            state = next(child for child in state.extend()
+                         if self.table[rank_seq(child.seq)] == d)
+            path.append(state)
+        return path
+
+
+if __name__ == '__main__':
+    from time import time
+
+    initial_state = State((2, 8, 3, 1, 6, 4, 7, 0, 5), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
+    oracle = DistanceOracle(goal_seq)
+    start_time = time()
+    path = oracle.solve(initial_state)
+    end_time = time()
+    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
+    print(f"解の経路コスト:\t{len(path)-1}")
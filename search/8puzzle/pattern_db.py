@@ -0,0 +1,132 @@
+"""パターンデータベース"""
+from collections import deque
+from math import isqrt
+from pathlib import Path
+from typing import Optional
+
+from base import Action, Digit, Seq, State
+from table import TABLE_DIR, load_table
+
+# 表に記録されていない（到達できない）ことを表す値
+UNREACHABLE = 0xFF
+
+
+def default_patterns(goal_seq: Seq) -> list[tuple[Digit, ...]]:
+    """既定のパターン．目標状態で並ぶ順に数字を4個（15パズル以上では5個）ずつに分ける．"""
+    size = 4 if len(goal_seq) <= 9 else 5
+    digits = [d for d in goal_seq if d != 0]
+    return [tuple(digits[i:i+size]) for i in range(0, len(digits), size)]
+
+
+def build_pattern_table(goal_seq: Seq, pattern: tuple[Digit, ...]) -> bytes:
+    """パターンの表を目標状態からの逆向きの幅優先探索で作る
+
+    パターンに含まれる数字の位置のみを区別した抽象状態の上で，パターンの数字の移動のみをコスト1として数える．
+    そのため，互いに素なパターンの表の値の和は許容的なヒューリスティック関数になる．
+
+    Args:
+        goal_seq (Seq): 目標状態の盤面
+        pattern (tuple[Digit, ...]): パターンに含まれる数字
+
+    Returns:
+        bytes: 表．パターンの数字の位置を`cells`進数の各桁とした値で引く．
+    """
+    cells = len(goal_seq)
+    n = isqrt(cells)
+    # マスごとの隣接するマス
+    neighbors = [[c for c, ok in ((pos-n, pos >= n), (pos+n, pos < cells-n),
+                                  (pos-1, pos % n != 0), (pos+1, pos % n != n-1)) if ok]
+                 for pos in range(cells)]
+    weights = [cells**k for k in range(len(pattern))]  # パターンの数字ごとの桁の重み
+    size = cells**len(pattern)
+
+    # 抽象状態(パターンの数字の位置, 空きマスの位置)を`index*cells+blank`で表し，0-1幅優先探索をする
+    dist = bytearray([UNREACHABLE])*(size*cells)
+    start = sum(w*goal_seq.index(d) for d, w in zip(pattern, weights)) * \
+        cells+goal_seq.index(0)
+    dist[start] = 0
+    q = deque([start])
+    while q:
+        node = q.popleft()
+        index, blank = divmod(node, cells)
+        cost = dist[node]
+        # パターンの数字がある位置と，その数字の桁の重み
+        occupied: dict[int, int] = {}
+        rest = index
+        for w in weights:
+            rest, pos = divmod(rest, cells)
+            occupied[pos] = w
+        for pos in neighbors[blank]:
+            w = occupied.get(pos)
+            if w is None:
+                # パターンに含まれない数字との入れ替えはコスト0
+                child = index*cells+pos
+                if dist[child] > cost:
+                    dist[child] = cost
+                    q.appendleft(child)
+            else:
+                # パターンの数字を空きマスに動かす
+                child = (index+w*(blank-pos))*cells+pos
+                if dist[child] > cost+1:
+                    dist[child] = cost+1
+                    q.append(child)
+
+    # 空きマスの位置について最小値をとる
+    return bytes(min(dist[index*cells:(index+1)*cells]) for index in range(size))
+
+
+def pattern_table_path(goal_seq: Seq, pattern: tuple[Digit, ...], table_dir: Path = TABLE_DIR) -> Path:
+    """目標状態とパターンから決まる表のファイル"""
+    goal_key = '-'.join(map(str, goal_seq))
+    pattern_key = '-'.join(map(str, pattern))
+    return Path(table_dir)/f'pdb_{goal_key}_{pattern_key}.bin'
+
+
+class PatternDatabase:
+    def __init__(self, goal_seq: Seq, patterns: Optional[list[tuple[Digit, ...]]] = None,
+                 table_dir: Path = TABLE_DIR) -> None:
+        """互いに素なパターンデータベースの和によるヒューリスティック関数
+
+        表は目標状態とパターンごとにファイルに保存し，既にあれば作らずにメモリマップで読み込む．
+
+        Args:
+            goal_seq (Seq): 目標状態の盤面
+            patterns (Optional[list[tuple[Digit, ...]]], optional): 互いに素なパターンのリスト.
+                Defaults to None（`default_patterns(goal_seq)`）.
+            table_dir (Path, optional): 表を保存するディレクトリ. Defaults to TABLE_DIR.
+        """
+        if patterns is None:
+            patterns = default_patterns(goal_seq)
+        self.cells = len(goal_seq)
+        self.tables = [load_table(pattern_table_path(goal_seq, pattern, table_dir),
+                                  lambda pattern=pattern: build_pattern_table(goal_seq, pattern))
+                       for pattern in patterns]
+        # 数字ごとの(パターンの番号, 桁の重み)．パターンに含まれない数字はNone．
+        self.digit_weights: list[Optional[tuple[int, int]]] = [
+            None]*self.cells
+        for i, pattern in enumerate(patterns):
+            for k, d in enumerate(pattern):
+                self.digit_weights[d] = (i, self.cells**k)
+
+    def __call__(self, state: State) -> int:
+        """ヒューリスティック関数の値"""
+        indices = [0]*len(self.tables)
+        digit_weights = self.digit_weights
+        board = state.board
+        bits, mask = state.layout.bits, state.layout.mask
+        for pos in range(self.cells):
+            weight = digit_weights[board & mask]
+            if weight is not None:
+                indices[weight[0]] += weight[1]*pos
+            board >>= bits
+        return sum(table[index] for table, index in zip(self.tables, indices))
+
+
+if __name__ == '__main__':
+    from a_star import a_star
+    from base import ManhattanDistance
+
+    initial_state = State((2, 8, 3, 1, 6, 4, 7, 0, 5), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
+    a_star(initial_state, goal_seq, ManhattanDistance(goal_seq))
+    a_star(initial_state, goal_seq, PatternDatabase(goal_seq))
@@ -0,0 +1,132 @@
+"""探索の過程の記録の可視化"""
+from typing import TYPE_CHECKING, Callable, Optional
+
+from base import State
+from search_trace import Trace
+
+if TYPE_CHECKING:
+    from graphviz import Digraph
+
+
+class _TraceView:
+    def __init__(self, trace: Trace, cost_format: Optional[Callable[[State], str]]) -> None:
+        """記録したノードの名前とラベルを必要になったときに求めて保持する"""
+        self.trace = trace
+        self.cost_format = cost_format
+        self.names: dict[int, str] = {}
+
+    def name(self, node_id: int) -> str:
+        name = self.names.get(node_id)
+        if name is None:
+            name = self.trace.state(node_id).name
+            self.names[node_id] = name
+        return name
+
+    def label(self, node_id: int) -> str:
+        state = self.trace.state(node_id)
+        cost = None if self.cost_format is None else self.cost_format(state)
+        return state.label(self.trace.order(node_id), cost)
+
+    def latest(self, side: int = 0) -> dict[str, int]:
+        """名前ごとに最後に記録したノードの番号（名前が同じ状態は1つのノードとして表示する）"""
+        trace = self.trace
+        nodes: dict[str, int] = {}
+        for node_id in range(len(trace)):
+            if trace.sides[node_id] == side:
+                nodes[self.name(node_id)] = node_id
+        return nodes
+
+
+def render_trace(trace: Trace, name: str, show_all: bool = False,
+                 cost_format: Optional[Callable[[State], str]] = None) -> 'Digraph':
+    """探索の過程の記録をグラフで可視化する
+
+    Args:
+        trace (Trace): 探索の過程の記録
+        name (str): グラフの名前
+        show_all (bool, optional): 展開された全てのノードを表示するか否か．
+            Falseの場合は目標状態から初期状態まで遡って表示する. Defaults to False.
+        cost_format (Optional[Callable[[State], str]], optional): ノードに添えるコストの文字列. Defaults to None.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    from graphviz import Digraph  # 可視化するときのみ読み込む
+
+    view = _TraceView(trace, cost_format)
+    graph = Digraph(name=name)
+    if show_all:
+        # 全てのノードを表示
+        goal_board = trace.boards[trace.goal_id]
+        for node_name, node_id in view.latest().items():
+            graph.node(node_name, label=view.label(node_id), shape='record',
+                       color=('blue' if trace.boards[node_id] == goal_board else 'black'))
+            parent_id = trace.parents[node_id]
+            if parent_id >= 0:
+                graph.edge(view.name(parent_id), node_name)
+    else:
+        # 目標状態から初期状態まで遡って表示
+        for node_id in reversed(trace.path(trace.goal_id)):
+            graph.node(view.name(node_id), label=view.label(node_id), shape='record')
+            parent_id = trace.parents[node_id]
+            if parent_id >= 0:
+                graph.edge(view.name(parent_id), view.name(node_id))
+    return graph
+
+
+def render_bidir_trace(trace: Trace, name: str, show_all: bool = False) -> 'Digraph':
+    """双方向探索の過程の記録をグラフで可視化する
+
+    初期状態側のノードを赤，目標状態側のノードを青，出会ったノードを紫で表示する．
+
+    Args:
+        trace (Trace): 探索の過程の記録．`goal_id`と`meet_id`に出会った両側のノードを持つ．
+        name (str): グラフの名前
+        show_all (bool, optional): 展開された全てのノードを表示するか否か．
+            Falseの場合は出会った状態から初期状態・目標状態まで遡って表示する. Defaults to False.
+
+    Returns:
+        Digraph: グラフ(graphviz)
+    """
+    from graphviz import Digraph  # 可視化するときのみ読み込む
+
+    view = _TraceView(trace, None)
+    meet_start_id, meet_goal_id = trace.goal_id, trace.meet_id
+    graph = Digraph(name=name)
+    if show_all:
+        # 全てのノードを表示
+        meet_start_name = view.name(meet_start_id)
+        for node_name, node_id in view.latest(0).items():
+            if node_name != meet_start_name:
+                graph.node(node_name, label=view.label(node_id), shape='record', color='red')
+                parent_id = trace.parents[node_id]
+                if parent_id >= 0:
+                    graph.edge(view.name(parent_id), node_name)
+        for node_name, node_id in view.latest(1).items():
+            graph.node(node_name, label=view.label(node_id), shape='record', color='blue')
+            parent_id = trace.parents[node_id]
+            if parent_id >= 0:
+                graph.edge(node_name, view.name(parent_id))
+    else:
+        # 出会った状態から初期状態まで遡って表示
+        node_id = trace.parents[meet_start_id]
+        while node_id >= 0:
+            graph.node(view.name(node_id), label=view.label(node_id), shape='record', color='red')
+            parent_id = trace.parents[node_id]
+            if parent_id >= 0:
+                graph.edge(view.name(parent_id), view.name(node_id))
+            node_id = parent_id
+        # 出会った状態から目標状態まで遡って表示
+        node_id = meet_goal_id
+        while node_id >= 0:
+            graph.node(view.name(node_id), label=view.label(node_id), shape='record', color='blue')
+            parent_id = trace.parents[node_id]
+            if parent_id >= 0:
+                graph.edge(view.name(node_id), view.name(parent_id))
+            node_id = parent_id
+    graph.node(view.name(meet_goal_id), label=trace.state(meet_goal_id).label(),
+               shape='record', color='purple')
+    meet_parent_id = trace.parents[meet_start_id]
+    if meet_parent_id >= 0:
+        graph.edge(view.name(meet_parent_id), view.name(meet_goal_id))
+    return graph
@@ -0,0 +1,76 @@
+"""探索の過程の記録"""
+from array import array
+from typing import Optional
+
+from base import Action, State, get_layout, unpack_board
+
+
+class Trace:
+    def __init__(self, cells: int = 9) -> None:
+        """探索の過程の記録
+
+        ノードごとの盤面・親ノードの番号・展開した順番・g・h・行為・探索した側を配列に記録する．
+        状態のオブジェクトや名前の文字列は保持しないので，可視化しない場合よりもわずかなメモリしか増えない．
+
+        Args:
+            cells (int, optional): 盤面のマスの数. Defaults to 9.
+        """
+        self.cells = cells
+        # 64ビットに収まらない盤面（5×5以上）はリストに記録する
+        self.boards: array | list[int] = array('Q') \
+            if get_layout(cells).bits*cells <= 64 else []
+        self.parents = array('i')  # 親ノードの番号（ルートノードは-1）
+        self.orders = array('i')  # 展開した順番（展開していない場合は-1）
+        self.gs = array('i')
+        self.hs = array('i')  # ヒューリスティック関数の値（求めていない場合は-1）
+        self.actions = array('b')  # 前回の行為の値
+        self.sides = array('b')  # 探索した側（双方向探索で0: 初期状態側，1: 目標状態側）
+        self.goal_id = -1  # 目標状態（双方向探索では出会った初期状態側）のノードの番号
+        self.meet_id = -1  # 双方向探索で出会った目標状態側のノードの番号
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def add(self, state: State, order: int = -1, side: int = 0) -> int:
+        """状態を記録し，ノードの番号を`state.trace_id`に設定する
+
+        親ノードは先に記録されていなければならない．
+        同じ状態を再び記録すると（展開した順番の更新など）新しいノードとなり，以降の子はそのノードを親とする．
+
+        Returns:
+            int: ノードの番号
+        """
+        node_id = len(self.parents)
+        self.boards.append(state.board)
+        self.parents.append(-1 if state.parent is None else state.parent.trace_id)
+        self.orders.append(order)
+        self.gs.append(state.depth)
+        self.hs.append(-1 if state.h is None else state.h)
+        self.actions.append(state.prev_act.value)
+        self.sides.append(side)
+        state.trace_id = node_id
+        return node_id
+
+    def state(self, node_id: int) -> State:
+        """記録したノードを状態として取り出す（親ノードは持たない）"""
+        board = self.boards[node_id]
+        seq = unpack_board(board, self.cells)
+        state = State.from_board(board, seq.index(0), get_layout(self.cells),
+                                 self.gs[node_id], Action(self.actions[node_id]), None)
+        h = self.hs[node_id]
+        state.h = None if h < 0 else h
+        return state
+
+    def order(self, node_id: int) -> Optional[int]:
+        """展開した順番（展開していない場合はNone）"""
+        order = self.orders[node_id]
+        return None if order < 0 else order
+
+    def path(self, node_id: int) -> list[int]:
+        """ルートノードから`node_id`までのノードの番号"""
+        path: list[int] = []
+        while node_id >= 0:
+            path.append(node_id)
+            node_id = self.parents[node_id]
+        path.reverse()
+        return path
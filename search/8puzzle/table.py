@@ -0,0 +1,32 @@
+"""ファイルに保存する表"""
+import mmap
+import os
+from pathlib import Path
+from typing import Callable
+
+# 表を保存する既定のディレクトリ
+TABLE_DIR = Path(__file__).resolve().parent/'tables'
+
+
+def load_table(path: Path, build: Callable[[], bytes]) -> mmap.mmap:
+    """表をメモリマップで読み込む．ファイルがなければ作って保存する．
+
+    読み込んだ表は読み取り専用で，同じファイルを読み込んだ複数のプロセスの間でページが共有される．
+
+    Args:
+        path (Path): 表のファイル
+        build (Callable[[], bytes]): 表を作る関数
+
+    Returns:
+        mmap.mmap: 表
+    """
+    path = Path(path)
+    if not path.exists():
+        data = build()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 他のプロセスが書きかけのファイルを読まないように，一時ファイルに書いてから置き換える
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
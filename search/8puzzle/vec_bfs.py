@@ -0,0 +1,173 @@
+"""NumPyで層ごとにまとめて展開する幅優先探索"""
+from time import perf_counter
+from typing import Iterator, Optional
+
+import numpy as np
+
+from base import Action, Layout, SearchResult, Seq, State, pack_seq
+from budget import Budget, SearchStopped, check_solvable
+from common.metrics import report
+
+# 整数に詰めた盤面の配列の型
+BOARD_DTYPE = np.uint64
+
+
+def _check_layout(layout: Layout) -> None:
+    """盤面が64ビットに収まるか確かめる"""
+    if layout.cells*layout.bits > 64:
+        raise ValueError(f'{layout.cells}マスの盤面は64ビットに収まりません')
+
+
+def _contains(sorted_boards: np.ndarray, boards: np.ndarray) -> np.ndarray:
+    """盤面ごとに整列した配列`sorted_boards`に含まれるか否か"""
+    if len(sorted_boards) == 0:
+        return np.zeros(len(boards), bool)
+    index = np.searchsorted(sorted_boards, boards)
+    index[index == len(sorted_boards)] = 0
+    return sorted_boards[index] == boards
+
+
+def expand_layer(layout: Layout, boards: np.ndarray, blanks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """層の全ての盤面の子をまとめて求める（重複を含む）
+
+    空きマスの位置ごとに盤面を選び，移動の表の各移動を配列全体に適用する．
+
+    Args:
+        layout (Layout): 盤面の大きさごとの定数
+        boards (np.ndarray): 整数に詰めた盤面の配列
+        blanks (np.ndarray): 各盤面の空きマスの位置の配列
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 子の盤面の配列と空きマスの位置の配列
+    """
+    mask = BOARD_DTYPE(layout.mask)
+    child_boards: list[np.ndarray] = []
+    child_blanks: list[np.ndarray] = []
+    for blank, moves in enumerate(layout.moves):
+        parents = boards[blanks == blank]
+        if len(parents) == 0:
+            continue
+        for pos, shift, coef, _action, _reverse in moves:
+            tiles = (parents >> BOARD_DTYPE(shift)) & mask
+            # 負の係数は2の64乗を法とする加算として計算する
+            child_boards.append(parents+tiles*BOARD_DTYPE(coef % (1 << 64)))
+            child_blanks.append(np.full(len(parents), pos, np.uint8))
+    if not child_boards:
+        return np.empty(0, BOARD_DTYPE), np.empty(0, np.uint8)
+    return np.concatenate(child_boards), np.concatenate(child_blanks)
+
+
+def bfs_layers(initial_state: State) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """初期状態からの深さごとの層を順に求める
+
+    隣接する盤面は1つ前・同じ・1つ後の層にしかないので，子から前の層と同じ層の盤面を除けば次の層になる．
+
+    Args:
+        initial_state (State): 初期状態
+
+    Yields:
+        Iterator[tuple[np.ndarray, np.ndarray]]: 整列した盤面の配列と各盤面の空きマスの位置の配列
+    """
+    layout = initial_state.layout
+    _check_layout(layout)
+    prev_boards = np.empty(0, BOARD_DTYPE)  # 1つ前の層
+    boards = np.array([initial_state.board], BOARD_DTYPE)
+    blanks = np.array([initial_state.blank], np.uint8)
+    while len(boards) > 0:
+        yield boards, blanks
+        children, child_blanks = expand_layer(layout, boards, blanks)
+        # 重複を除いて整列する
+        children, index = np.unique(children, return_index=True)
+        child_blanks = child_blanks[index]
+        new = ~(_contains(prev_boards, children) | _contains(boards, children))
+        prev_boards, boards, blanks = boards, children[new], child_blanks[new]
+
+
+def _backtrack(layout: Layout, layers: list[np.ndarray], board: int, blank: int) -> list[Action]:
+    """最後の層の盤面から1つ前の層にある親を順にたどり，初期状態からの行為の列を求める"""
+    actions: list[Action] = []
+    for layer in reversed(layers[:-1]):
+        for pos, shift, coef, _action, reverse in layout.moves[blank]:
+            parent = board+((board >> shift) & layout.mask)*coef
+            if _contains(layer, np.array([parent], BOARD_DTYPE))[0]:
+                # 親から見ると逆向きの行為で現在の盤面になる
+                actions.append(reverse)
+                board, blank = parent, pos
+                break
+    actions.reverse()
+    return actions
+
+
+def vec_bfs_search(initial_state: State, goal_seq: Seq,
+                   budget: Optional[Budget] = None) -> tuple[list[Action], int]:
+    """層ごとにまとめて展開する幅優先探索（グラフ探索）の本体
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        budget (Optional[Budget], optional): 探索の予算．層ごとに調べ，辺境の大きさには層の大きさを用いる.
+            Defaults to None.
+
+    Raises:
+        SearchStopped: 目標状態に到達できない場合と予算を超えた場合
+
+    Returns:
+        tuple[list[Action], int]: 初期状態から目標状態までの行為の列と展開回数（展開した盤面の数）
+    """
+    check_solvable(initial_state, goal_seq)
+    goal_board = np.array([pack_seq(goal_seq)], BOARD_DTYPE)
+    goal_blank = goal_seq.index(0)
+
+    layers: list[np.ndarray] = []  # 初期状態からの深さごとの盤面
+    extension_count = 0  # 展開した回数
+    for boards, _blanks in bfs_layers(initial_state):
+        layers.append(boards)
+        if _contains(boards, goal_board)[0]:
+            return _backtrack(initial_state.layout, layers, int(goal_board[0]), goal_blank), extension_count
+        if budget is not None:
+            reason = budget.exceeded(extension_count, len(boards))
+            if reason is not None:
+                # この層より浅い盤面は全て調べ終えている
+                raise SearchStopped(reason, extension_count, lower_bound=len(layers)-1)
+        extension_count += len(boards)
+    raise SearchStopped('unsolvable', extension_count)
+
+
+def vec_bfs_solve(initial_state: State, goal_seq: Seq, budget: Optional[Budget] = None) -> SearchResult:
+    """層ごとにまとめて展開する幅優先探索で解を求める
+
+    探索木を保持しないので探索の過程は記録しない．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_seq (Seq): 目標状態の盤面
+        budget (Optional[Budget], optional): 探索の予算. Defaults to None.
+
+    Returns:
+        SearchResult: 探索の結果（到達できない場合と予算を超えた場合は`solved`がFalse）
+    """
+    start_time = perf_counter()
+    if budget is not None:
+        budget.start()
+    try:
+        actions, extension_count = vec_bfs_search(
+            initial_state, goal_seq, budget)
+    except SearchStopped as stopped:
+        return stopped.result(perf_counter()-start_time)
+    return SearchResult(tuple(actions), len(actions), extension_count, perf_counter()-start_time)
+
+
+if __name__ == '__main__':
+    initial_state = State((2, 8, 3, 1, 6, 4, 7, 0, 5), 0, Action.NONE, None)
+    goal_seq: Seq = (1, 2, 3, 8, 0, 4, 7, 6, 5)
+    result = vec_bfs_solve(initial_state, goal_seq)
+    report(result.elapsed, result.extension_count, result.cost)
+
+    # 目標状態から到達できる全ての盤面を列挙する
+    start_time = perf_counter()
+    layer_sizes = [len(boards) for boards, _blanks in bfs_layers(
+        State(goal_seq, 0, Action.NONE, None))]
+    end_time = perf_counter()
+    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
+    print(f"盤面の数:\t{sum(layer_sizes)}")
+    print(f"最大の深さ:\t{len(layer_sizes)-1}")
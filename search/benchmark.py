@@ -0,0 +1,371 @@
+"""探索アルゴリズムのベンチマーク
+
+8パズルは最適な経路コスト（深さ）ごとに，ロボットの経路計画は大きさの異なる生成した作業環境ごとに，
+シードから再現できる問題を作り，各ソルバーの計算時間・毎秒の展開回数・最大メモリ使用量・解の経路コストを記録する．
+
+8パズルとロボットの経路計画のモジュール（どちらも`base`）が衝突しないように，ソルバーごとに子プロセスで実行する．
+
+    python benchmark.py run -o result.json
+    python benchmark.py compare base.json result.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from pathlib import Path
+from statistics import mean
+from time import perf_counter, strftime
+from typing import Any, Callable, Optional
+
+from common.metrics import peak_memory_kb
+
+SEARCH_DIR = Path(__file__).resolve().parent
+
+# 8パズルの問題を作る最適な経路コスト（深さ）の既定値
+PUZZLE_DEPTHS = (4, 8, 12, 16, 20, 24, 28)
+# ロボットの経路計画の作業環境の一辺の長さの既定値
+MAP_SIZES = (10, 20, 40, 80)
+# 作業環境の障害物の割合
+OBSTACLE_RATIO = 0.2
+
+Record = dict[str, Any]
+
+
+def puzzle_solver_names() -> tuple[str, ...]:
+    """8パズルのソルバーの名前（子プロセスで読み込むモジュールを親プロセスでは読み込まない）"""
+    return ('bfs', 'vec_bfs', 'external_bfs', 'greedy', 'bidir', 'bidir_a_star', 'a_star_h2', 'a_star_h2_bucket',
+            'a_star_lc', 'a_star_wd', 'a_star_pdb', 'weighted_a_star_2', 'ara_star', 'ida_star_h2', 'ida_star_wd',
+            'hda_star')
+
+
+def path_solver_names() -> tuple[str, ...]:
+    """ロボットの経路計画のソルバーの名前"""
+    return ('bfs', 'a_star', 'a_star_bucket', 'lrta_star', 'lss_lrta_star_16', 'rtaa_star_16')
+
+
+def puzzle_solvers() -> dict[str, Callable]:
+    """8パズルのソルバー（初期状態，目標状態の盤面，予算から探索の結果を求める関数）"""
+    from functools import partial
+
+    from a_star import a_star_solve
+    from ara_star import ara_star_solve
+    from base import manhattan_distance
+    from bfs import bfs_solve
+    from bidir import bidir_a_star_solve, bidir_solve
+    from common.priority_queue import BucketQueue
+    from external_bfs import external_bfs_solve
+    from greedy import greedy_solve
+    from hda_star import hda_star_solve
+    from heuristics import linear_conflict, walking_distance
+    from ida_star import ida_star_solve
+    from pattern_db import PatternDatabase
+    from vec_bfs import vec_bfs_solve
+
+    def a_star_with(make_heuristic: Callable, **kwargs) -> Callable:
+        return lambda state, goal_seq, budget: a_star_solve(state, goal_seq, make_heuristic(goal_seq),
+                                                            budget=budget, **kwargs)
+
+    return {
+        'bfs': lambda state, goal_seq, budget: bfs_solve(state, goal_seq, True, budget=budget),
+        'vec_bfs': vec_bfs_solve,
+        'external_bfs': lambda state, goal_seq, budget: external_bfs_solve(state, goal_seq, budget=budget),
+        'greedy': lambda state, goal_seq, budget: greedy_solve(state, goal_seq, True, budget=budget),
+        'bidir': lambda state, goal_seq, budget: bidir_solve(state, goal_seq, budget=budget),
+        'bidir_a_star': lambda state, goal_seq, budget: bidir_a_star_solve(state, goal_seq, budget=budget),
+        'a_star_h2': a_star_with(manhattan_distance),
+        'a_star_h2_bucket': a_star_with(manhattan_distance, queue_factory=partial(BucketQueue, True)),
+        'a_star_lc': a_star_with(linear_conflict),
+        'a_star_wd': a_star_with(walking_distance),
+        'a_star_pdb': a_star_with(PatternDatabase),
+        'weighted_a_star_2': a_star_with(manhattan_distance, weight=2),
+        'ara_star': lambda state, goal_seq, budget: ara_star_solve(state, goal_seq, manhattan_distance(goal_seq),
+                                                                   budget=budget),
+        'ida_star_h2': lambda state, goal_seq, budget: ida_star_solve(state, goal_seq, manhattan_distance(goal_seq),
+                                                                      budget=budget),
+        'ida_star_wd': lambda state, goal_seq, budget: ida_star_solve(state, goal_seq, walking_distance(goal_seq),
+                                                                      budget=budget),
+        'hda_star': lambda state, goal_seq, budget: hda_star_solve(state, goal_seq, processes=2, budget=budget),
+    }
+
+
+def path_solvers() -> dict[str, Callable]:
+    """ロボットの経路計画のソルバー（初期状態，目標状態の位置と計測値から(目標状態, 展開回数)を求める関数）"""
+    from functools import partial
+
+    from a_star import a_star_search
+    from bfs import bfs_search
+    from common.priority_queue import BucketQueue
+    from lrta_star import lrta_star_search
+    from lss_lrta_star import lss_lrta_star_search, rtaa_star_search
+
+    return {
+        'bfs': bfs_search,
+        'a_star': lambda state, goal_pos, metrics: a_star_search(state, goal_pos, metrics=metrics),
+        'a_star_bucket': lambda state, goal_pos, metrics: a_star_search(state, goal_pos, partial(BucketQueue, True),
+                                                                        metrics),
+        'lrta_star': lambda state, goal_pos, metrics: lrta_star_search(state, goal_pos, {}, metrics),
+        'lss_lrta_star_16': lambda state, goal_pos, metrics: lss_lrta_star_search(state, goal_pos, {}, 16,
+                                                                                  metrics=metrics),
+        'rtaa_star_16': lambda state, goal_pos, metrics: rtaa_star_search(state, goal_pos, {}, 16, metrics=metrics),
+    }
+
+
+def make_puzzle_instances(seed: int, depths: tuple[int, ...], per_depth: int) -> list[Record]:
+    """目標状態からの距離ごとに盤面を無作為に選んで8パズルの問題を作る"""
+    import numpy as np
+
+    from base import Action, State, unpack_board
+    from vec_bfs import bfs_layers
+
+    goal_seq = (1, 2, 3, 4, 5, 6, 7, 8, 0)
+    rng = np.random.default_rng(seed)
+    instances = []
+    for depth, (boards, _blanks) in enumerate(bfs_layers(State(goal_seq, 0, Action.NONE, None))):
+        if depth not in depths:
+            continue
+        for board in rng.choice(boards, min(per_depth, len(boards)), replace=False):
+            instances.append({'seq': list(unpack_board(int(board))),
+                              'goal': list(goal_seq), 'group': f'depth={depth}'})
+    return instances
+
+
+def make_map(size: int, rng: random.Random) -> list[list[int]]:
+    """外周を障害物で囲み，内部に無作為に障害物を置いた作業環境を作る（0は障害物，1は自由領域）"""
+    return [[1 if 0 < i < size-1 and 0 < j < size-1 and rng.random() >= OBSTACLE_RATIO else 0
+             for j in range(size)] for i in range(size)]
+
+
+def make_path_instances(seed: int, sizes: tuple[int, ...], per_size: int) -> list[Record]:
+    """作業環境の大きさごとに，到達できる初期位置と目標位置の組を無作為に選んで問題を作る"""
+    from base import State, use_map
+
+    rng = random.Random(seed)
+    instances = []
+    for size in sizes:
+        grid = make_map(size, rng)
+        use_map(grid)
+        # 自由領域にある全てのロボットの位置
+        positions = [((i, j), (i, j+1)) for i in range(size) for j in range(size-1)
+                     if grid[i][j] and grid[i][j+1]] + \
+            [((i, j), (i+1, j)) for i in range(size-1) for j in range(size)
+             if grid[i][j] and grid[i+1][j]]
+        for _ in range(per_size):
+            # 初期位置から到達できる位置を幅優先の順に並べ，遠い方の4分の1から目標位置を選ぶ
+            reachable = []
+            while len(reachable) < 2:
+                start = rng.choice(positions)
+                reachable = [start]
+                visited = {start}
+                for pos in reachable:
+                    for child in State(pos, 0, None).extend():
+                        if child.pos not in visited:
+                            visited.add(child.pos)
+                            reachable.append(child.pos)
+            goal = rng.choice(reachable[len(reachable)*3//4:])
+            instances.append({'map': grid, 'start': [list(p) for p in start], 'goal': [list(p) for p in goal],
+                              'group': f'size={size}'})
+    return instances
+
+
+def run_puzzle(solver_name: str, args: argparse.Namespace) -> list[Record]:
+    """8パズルのソルバーを全ての問題で実行する"""
+    from base import Action, State
+    from budget import Budget
+
+    solver = puzzle_solvers()[solver_name]
+    records = []
+    for instance in make_puzzle_instances(args.seed, tuple(args.depths), args.per_group):
+        budget = Budget(time_limit=args.time_limit)
+        start_time = perf_counter()
+        result = solver(State(tuple(instance['seq']), 0, Action.NONE, None), tuple(instance['goal']), budget)
+        elapsed = perf_counter()-start_time
+        records.append({'instance': instance['seq'], 'group': instance['group'], 'solved': result.solved,
+                        'reason': result.reason, 'cost': result.cost, 'expansions': result.extension_count,
+                        'elapsed': elapsed, 'generations': result.metrics.generations,
+                        'max_frontier': result.metrics.max_frontier})
+    return records
+
+
+def run_path(solver_name: str, args: argparse.Namespace) -> list[Record]:
+    """ロボットの経路計画のソルバーを全ての問題で実行する"""
+    from base import State, config_graph, use_map
+    from common.metrics import SearchMetrics
+
+    solver = path_solvers()[solver_name]
+    random.seed(args.seed)  # LRTA*の行為の選択
+    records = []
+    for instance in make_path_instances(args.seed, tuple(args.sizes), args.per_group):
+        use_map(instance['map'])
+        config_graph()  # 配置のグラフは作業環境ごとに一度だけ作るので計測に含めない
+        start = tuple(tuple(p) for p in instance['start'])
+        goal = tuple(tuple(p) for p in instance['goal'])
+        metrics = SearchMetrics()
+        start_time = perf_counter()
+        state, extension_count = solver(State(start, 0, None), goal, metrics)
+        elapsed = perf_counter()-start_time
+        records.append({'instance': [instance['start'], instance['goal']], 'group': instance['group'],
+                        'solved': True, 'reason': None, 'cost': state.depth, 'expansions': extension_count,
+                        'elapsed': elapsed, 'generations': metrics.generations,
+                        'max_frontier': metrics.max_frontier})
+    return records
+
+
+def worker(args: argparse.Namespace) -> None:
+    """子プロセスで1つのソルバーを実行し，結果をJSONで標準出力に書く"""
+    suite_dir = SEARCH_DIR/('8puzzle' if args.suite == '8puzzle' else 'path')
+    sys.path.insert(0, str(suite_dir))
+    os.chdir(suite_dir)
+    run = run_puzzle if args.suite == '8puzzle' else run_path
+    baseline_kb = peak_memory_kb()
+    records = run(args.solver, args)
+    peak_kb = peak_memory_kb()
+    # 最大常駐メモリを求められない環境ではNoneとする
+    memory_kb = None if peak_kb is None or baseline_kb is None else peak_kb-baseline_kb
+    json.dump({'records': records, 'peak_memory_kb': memory_kb}, sys.stdout)
+
+
+def summarize(records: list[Record]) -> dict[str, Any]:
+    """問題のグループごとの集計"""
+    solved = [r for r in records if r['solved']]
+    elapsed = sum(r['elapsed'] for r in records)
+    expansions = sum(r['expansions'] for r in records)
+    return {
+        'instances': len(records),
+        'solved': len(solved),
+        'mean_elapsed': mean(r['elapsed'] for r in records) if records else 0,
+        'expansions': expansions,
+        'expansions_per_sec': expansions/elapsed if elapsed > 0 else 0,
+        'mean_cost': mean(r['cost'] for r in solved) if solved else None,
+    }
+
+
+def run(args: argparse.Namespace) -> None:
+    """全てのスイートとソルバーを子プロセスで実行して結果をファイルに書く"""
+    suites = {'8puzzle': list(puzzle_solver_names()), 'path': list(path_solver_names())}
+    output: dict[str, Any] = {
+        'meta': {'created': strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'seed': args.seed, 'per_group': args.per_group,
+                 'depths': args.depths, 'sizes': args.sizes, 'time_limit': args.time_limit},
+        'results': [],
+        'failures': [],  # 異常終了したソルバー
+    }
+    for suite in args.suites:
+        for solver in suites[suite]:
+            if args.solvers and solver not in args.solvers:
+                continue
+            command = [sys.executable, str(Path(__file__).resolve()), 'worker', suite, solver,
+                       '--seed', str(args.seed), '--per-group', str(args.per_group),
+                       '--time-limit', str(args.time_limit),
+                       '--depths', *map(str, args.depths), '--sizes', *map(str, args.sizes)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f'{suite}/{solver}: 失敗\n{completed.stderr}', file=sys.stderr)
+                output['failures'].append({'suite': suite, 'solver': solver, 'returncode': completed.returncode,
+                                           'stderr': completed.stderr})
+                continue
+            data = json.loads(completed.stdout)
+            groups: dict[str, list[Record]] = {}
+            for record in data['records']:
+                groups.setdefault(record['group'], []).append(record)
+            for group, records in groups.items():
+                summary = summarize(records)
+                output['results'].append({'suite': suite, 'solver': solver, 'group': group,
+                                          'peak_memory_kb': data['peak_memory_kb'], **summary,
+                                          'records': records})
+                print(f"{suite}/{solver}/{group}:\t{summary['solved']}/{summary['instances']}\t"
+                      f"{summary['mean_elapsed']*1e+3:.3f} ms\t{summary['expansions_per_sec']:.0f} 展開/s")
+    Path(args.output).write_text(json.dumps(output, ensure_ascii=False, indent=1))
+
+
+def compare(args: argparse.Namespace) -> int:
+    """2回の実行結果を比べて悪化を表示する
+
+    Returns:
+        int: 悪化があれば1，なければ0（終了コード）
+    """
+    def load(path: str) -> tuple[dict[tuple[str, str, str], Record], list[Record]]:
+        data = json.loads(Path(path).read_text())
+        return {(r['suite'], r['solver'], r['group']): r for r in data['results']}, data.get('failures', [])
+
+    (base, _base_failures), (new, new_failures) = load(args.base), load(args.new)
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        old_result, new_result = base[key], new[key]
+        problems = []
+        if new_result['solved'] < old_result['solved']:
+            problems.append(f"解けた数 {old_result['solved']} -> {new_result['solved']}")
+        if old_result['mean_cost'] is not None and new_result['mean_cost'] is not None and \
+                new_result['mean_cost'] > old_result['mean_cost']:
+            problems.append(f"経路コスト {old_result['mean_cost']:.2f} -> {new_result['mean_cost']:.2f}")
+        if new_result['mean_elapsed'] > old_result['mean_elapsed']*(1+args.threshold):
+            problems.append(f"計算時間 {old_result['mean_elapsed']*1e+3:.3f} ms -> "
+                            f"{new_result['mean_elapsed']*1e+3:.3f} ms")
+        if new_result['expansions'] > old_result['expansions']*(1+args.threshold):
+            problems.append(f"展開回数 {old_result['expansions']} -> {new_result['expansions']}")
+        if old_result['peak_memory_kb'] is not None and new_result['peak_memory_kb'] is not None and \
+                new_result['peak_memory_kb'] > old_result['peak_memory_kb']*(1+args.threshold)+1024:
+            problems.append(f"メモリ {old_result['peak_memory_kb']} KB -> {new_result['peak_memory_kb']} KB")
+        name = '/'.join(key)
+        if problems:
+            regressions += 1
+            print(f'悪化\t{name}\t'+'，'.join(problems))
+        elif args.verbose:
+            print(f'変化なし\t{name}')
+    # 異常終了や削除で結果がなくなったグループも悪化とする
+    missing = sorted(base.keys()-new.keys())
+    for key in missing:
+        regressions += 1
+        print(f"欠落\t{'/'.join(key)}")
+    # 前回の結果にないソルバーが異常終了した場合も悪化とする
+    missing_solvers = {(suite, solver) for suite, solver, _group in missing}
+    for failure in new_failures:
+        if (failure['suite'], failure['solver']) not in missing_solvers:
+            regressions += 1
+            print(f"失敗\t{failure['suite']}/{failure['solver']}")
+    print(f'悪化: {regressions}件')
+    return 1 if regressions > 0 else 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='探索アルゴリズムのベンチマーク')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_instance_arguments(p: argparse.ArgumentParser) -> None:
+        p.add_argument('--seed', type=int, default=0, help='問題を作る乱数のシード')
+        p.add_argument('--per-group', type=int, default=3, help='深さ・大きさごとの問題の数')
+        p.add_argument('--time-limit', type=float, default=10.0, help='1問あたりの制限時間（秒，8パズルのみ）')
+        p.add_argument('--depths', type=int, nargs='+', default=list(PUZZLE_DEPTHS), help='8パズルの問題の深さ')
+        p.add_argument('--sizes', type=int, nargs='+', default=list(MAP_SIZES), help='作業環境の一辺の長さ')
+
+    run_parser = subparsers.add_parser('run', help='ベンチマークを実行する')
+    add_instance_arguments(run_parser)
+    run_parser.add_argument('-o', '--output', default='benchmark.json', help='結果のファイル')
+    run_parser.add_argument('--suites', nargs='+', choices=('8puzzle', 'path'), default=['8puzzle', 'path'])
+    run_parser.add_argument('--solvers', nargs='+', help='実行するソルバーの名前（省略時は全て）')
+
+    worker_parser = subparsers.add_parser('worker', help='（内部用）1つのソルバーを実行する')
+    worker_parser.add_argument('suite', choices=('8puzzle', 'path'))
+    worker_parser.add_argument('solver')
+    add_instance_arguments(worker_parser)
+
+    compare_parser = subparsers.add_parser('compare', help='2回の結果を比べて悪化を表示する')
+    compare_parser.add_argument('base', help='基準の結果のファイル')
+    compare_parser.add_argument('new', help='比べる結果のファイル')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='悪化とみなす増加の割合')
+    compare_parser.add_argument('-v', '--verbose', action='store_true', help='変化のない項目も表示する')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'worker':
+        worker(args)
+    else:
+        return compare(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+"""8パズルと経路計画で共有するモジュール"""
@@ -0,0 +1,84 @@
+"""探索の計測値と観測者
+
+探索の本体（`*_search`）は`metrics`と`observer`を受け取り，与えられた場合のみ数え上げや呼び出しを行う．
+どちらもNoneの場合は1回の展開ごとにNoneとの比較が増えるだけで，記録や関数呼び出しは行わない．
+"""
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from time import perf_counter
+from typing import Any, Generic, Iterator, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # Windowsにはない
+    resource = None
+
+S = TypeVar('S')
+
+
+def peak_memory_kb() -> Optional[int]:
+    """このプロセスの最大常駐メモリ（KB）．求められない環境ではNone"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak//1024 if sys.platform == 'darwin' else peak
+
+
+@dataclass
+class SearchMetrics:
+    """探索の計測値
+
+    `generations`・`duplicates`・`max_frontier`は数え上げる探索のみが設定し，それ以外の探索ではNoneのままとする．
+    """
+    expansions: int = 0  # 展開回数
+    generations: Optional[int] = None  # 生成した子の数
+    duplicates: Optional[int] = None  # 既に現れた盤面（位置）として捨てた子と読み飛ばした状態の数
+    max_frontier: Optional[int] = None  # 辺境（キュー）の大きさの最大値
+    peak_memory_kb: Optional[int] = None  # 終了時のプロセスの最大常駐メモリ（KB）
+    phases: dict[str, float] = field(default_factory=dict)  # 段階ごとの計算時間（秒）
+
+    def start_counting(self) -> None:
+        """探索の本体の開始時に呼び，数え上げる値を0にする"""
+        self.generations = 0
+        self.duplicates = 0
+        self.max_frontier = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """`with`の中の計算時間を`phases[name]`に加える"""
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0)+perf_counter()-start_time
+
+    def finish(self, expansions: int) -> 'SearchMetrics':
+        """探索の終了時に呼び，展開回数と最大常駐メモリを記録する"""
+        self.expansions = expansions
+        self.peak_memory_kb = peak_memory_kb()
+        return self
+
+    def as_dict(self) -> dict[str, Any]:
+        """JSONなどに書き出せる辞書"""
+        return asdict(self)
+
+
+class SearchObserver(Generic[S]):
+    """探索の過程を受け取る観測者
+
+    必要なメソッドのみ上書きして用いる．探索は観測者が与えられた場合のみメソッドを呼ぶ．
+    """
+
+    def on_expand(self, state: S, order: int) -> None:
+        """状態を展開する（取り出す）ときに，状態と展開した順番を受け取る"""
+
+    def on_generate(self, child: S, parent: S) -> None:
+        """展開で子を生成したとき（重複として捨てる前）に，子と親を受け取る"""
+
+
+def report(elapsed: float, extension_count: int, cost: Optional[int]) -> None:
+    """計算時間・展開回数・解の経路コストを表示する（対話的に用いる関数のみが呼ぶ）"""
+    print(f"計算時間:\t{elapsed*1e+3:.3f} ms")
+    print(f"展開回数:\t{extension_count}")
+    print(f"解の経路コスト:\t{cost}")
@@ -0,0 +1,108 @@
+"""探索の辺境に用いる優先度付きキュー
+
+どちらも`push(priority, item, tie)`と`pop() -> (priority, item)`を持ち，探索アルゴリズムから差し替えて用いる．
+"""
+import heapq
+from typing import Generic, TypeVar, Union
+
+T = TypeVar('T')
+
+
+class HeapQueue(Generic[T]):
+    def __init__(self) -> None:
+        """二分ヒープ(heapq)による優先度付きキュー
+
+        優先度が等しい場合は要素どうしを比較する（`State.__lt__`）．
+        """
+        self._heap: list[tuple[int, T]] = []
+
+    def push(self, priority: int, item: T, tie: int = 0) -> None:
+        """要素を追加する（`tie`は用いない）"""
+        heapq.heappush(self._heap, (priority, item))
+
+    def pop(self) -> tuple[int, T]:
+        """優先度が最小の要素を取り出す"""
+        return heapq.heappop(self._heap)
+
+    def min_priority(self) -> int:
+        """優先度の最小値"""
+        return self._heap[0][0]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class BucketQueue(Generic[T]):
+    def __init__(self, deeper_first: bool = False) -> None:
+        """0以上の整数の優先度ごとのバケット（配列）による優先度付きキュー
+
+        追加も取り出しも償却定数時間で，要素どうしを比較しない．
+        同じ優先度の中では後に追加した要素から取り出す（LIFO）．
+
+        Args:
+            deeper_first (bool, optional): 同じ優先度の中では`tie`（A*探索のgなど）が大きい要素から取り出すか否か.
+                Defaults to False.
+        """
+        self.deeper_first = deeper_first
+        # 優先度ごとのバケット．`deeper_first`の場合は`tie`ごとのリストのリストで，末尾のリストは空でない．
+        self._buckets: list[list] = []
+        self._min = 0  # 空でないバケットの優先度の最小値の下界
+        self._size = 0
+
+    def push(self, priority: int, item: T, tie: int = 0) -> None:
+        """要素を追加する
+
+        Args:
+            priority (int): 優先度（0以上の整数）
+            item (T): 要素
+            tie (int, optional): `deeper_first`の場合に同じ優先度の中で大きい方を先に取り出す値（0以上の整数）.
+                Defaults to 0.
+        """
+        buckets = self._buckets
+        if priority >= len(buckets):
+            buckets.extend([] for _ in range(priority+1-len(buckets)))
+        bucket = buckets[priority]
+        if self.deeper_first:
+            if tie >= len(bucket):
+                bucket.extend([] for _ in range(tie+1-len(bucket)))
+            bucket[tie].append(item)
+        else:
+            bucket.append(item)
+        if priority < self._min:
+            self._min = priority
+        self._size += 1
+
+    def _min_bucket(self) -> int:
+        """空でないバケットの優先度の最小値を求める"""
+        if self._size == 0:
+            raise IndexError('pop from an empty BucketQueue')
+        buckets = self._buckets
+        priority = self._min
+        while not buckets[priority]:
+            priority += 1
+        self._min = priority
+        return priority
+
+    def pop(self) -> tuple[int, T]:
+        """優先度が最小の要素を取り出す"""
+        priority = self._min_bucket()
+        bucket = self._buckets[priority]
+        if self.deeper_first:
+            item = bucket[-1].pop()
+            while bucket and not bucket[-1]:
+                bucket.pop()
+        else:
+            item = bucket.pop()
+        self._size -= 1
+        return priority, item
+
+    def min_priority(self) -> int:
+        """優先度の最小値"""
+        return self._min_bucket()
+
+    def __len__(self) -> int:
+        return self._size
+
+
+# 探索アルゴリズムが受け付ける優先度付きキュー
+PriorityQueue = Union[HeapQueue, BucketQueue]
@@ -0,0 +1,235 @@
+"""探索の様子を1コマずつ動画に書き出すアニメーション
+
+`ArtistAnimation`のように全てのコマの描画要素を保持せず，1枚の図の変化したマスだけを描き直して
+コマごとに書き出し器（ffmpeg・ImageMagick）へ送るので，展開回数が多くてもメモリは増えない．
+matplotlibはこのモジュールを用いるときに初めて読み込む．
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import TYPE_CHECKING, Callable, Optional, Union
+
+import numpy as np
+
+import base
+from base import Pos, State, get_first_artist, pos_center
+from common.metrics import SearchObserver
+
+if TYPE_CHECKING:
+    from matplotlib import animation
+
+# 自由領域・障害物・展開したマスの色(RGB)
+FREE_COLOR = (1.0, 1.0, 1.0)
+OBSTACLE_COLOR = (0.0, 0.0, 0.0)
+VISITED_COLOR = (0.8, 0.95, 0.8)
+# 既定で数字を表示する作業環境の大きさの上限（マスの数）
+MAX_LABEL_CELLS = 32*32
+
+
+def default_writer(path: Path) -> str:
+    """拡張子から書き出し器を選ぶ（GIFでImageMagickがない場合はコマをメモリに溜めるPillowを用いる）"""
+    from matplotlib import animation
+
+    if path.suffix == '.gif':
+        return 'imagemagick' if animation.writers.is_available('imagemagick') else 'pillow'
+    return 'ffmpeg'
+
+
+class StreamingAnimation:
+    def __init__(self, path: Union[str, Path], initial_state: State, goal_pos: Pos, writer: Optional[str] = None,
+                 fps: int = 5, dpi: int = 100, labels: Optional[bool] = None, every: int = 1) -> None:
+        """探索の様子を1コマずつ書き出すアニメーション
+
+        `with`の中で用い，抜けるときに動画を閉じる．
+
+        Args:
+            path (Union[str, Path]): 書き出すファイルのパス
+            initial_state (State): 初期状態
+            goal_pos (Pos): 目標状態の位置
+            writer (Optional[str], optional): matplotlibの書き出し器の名前. Defaults to None（拡張子から選ぶ）.
+            fps (int, optional): 1秒あたりのコマ数. Defaults to 5.
+            dpi (int, optional): 解像度. Defaults to 100.
+            labels (Optional[bool], optional): マスに数字を表示するか否か.
+                Defaults to None（作業環境が`MAX_LABEL_CELLS`マス以下なら表示する）.
+            every (int, optional): 展開の様子を何回ごとにコマにするか（解の経路は全てコマにする）. Defaults to 1.
+        """
+        self.path = Path(path)
+        self.initial_state = initial_state
+        self.goal_pos = goal_pos
+        self.writer_name = writer if writer is not None else default_writer(self.path)
+        self.fps = fps
+        self.dpi = dpi
+        self.labels = base.MAP.size <= MAX_LABEL_CELLS if labels is None else labels
+        self.every = every
+        self.frame_count = 0  # 書き出したコマの数
+        self._step_count = 0  # 展開の様子を受け取った回数
+
+    def __enter__(self) -> 'StreamingAnimation':
+        from matplotlib import animation
+        from matplotlib.figure import Figure
+
+        # pyplotを用いずに図を作るので，画面のない環境でも動き，閉じ忘れた図も残らない
+        self.fig = Figure()
+        self.ax = self.fig.add_subplot()
+        free = np.asarray(base.MAP) == 1
+        self.background = np.where(free[..., None], FREE_COLOR, OBSTACLE_COLOR)  # 作業環境の画像
+        self.image = self.background.copy()  # 展開したマスを塗った画像
+        self.image_artist = self.ax.imshow(self.image, aspect='equal')
+        for pos, text, color in ((self.initial_state.pos, 'S', 'blue'), (self.goal_pos, 'G', 'red')):
+            for i, j in pos:
+                self.ax.text(j, i, text, c=color, ha='center', size='large', va='center')
+        self.extending_marker, = self.ax.plot([], [], 'sg')
+        self.current_marker, = self.ax.plot([], [], 'sy')
+        self.label_artists: dict[Pos, object] = {}  # 位置ごとの数字
+        self.writer = animation.writers[self.writer_name](fps=self.fps)
+        self.writer.setup(self.fig, str(self.path), self.dpi)
+        return self
+
+    def __exit__(self, exc_type: Optional[type], exc: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.writer.finish()
+
+    def _grab(self) -> None:
+        self.image_artist.set_data(self.image)
+        self.writer.grab_frame()
+        self.frame_count += 1
+
+    def label(self, pos: Pos, value: int) -> None:
+        """位置に数字を表示する（既にある場合は書き換える）"""
+        if not self.labels:
+            return
+        artist = self.label_artists.get(pos)
+        if artist is None:
+            x, y = pos_center(pos)
+            self.label_artists[pos] = self.ax.text(y, x, str(value), ha='center', va='center')
+        else:
+            artist.set_text(str(value))
+
+    def step(self, state: State, value: Optional[int] = None, current: bool = False) -> None:
+        """展開中（`current`がTrueなら現在位置）の状態を示すコマを加える
+
+        Args:
+            state (State): 状態
+            value (Optional[int], optional): 位置に表示する数字. Defaults to None.
+            current (bool, optional): 現在位置として黄色で示すか否か（Falseなら展開中として緑で示し，マスを塗る）.
+                Defaults to False.
+        """
+        (i1, j1), (i2, j2) = state.pos
+        if current:
+            self.current_marker.set_data([j1, j2], [i1, i2])
+        else:
+            self.extending_marker.set_data([j1, j2], [i1, i2])
+            self.image[i1, j1] = self.image[i2, j2] = VISITED_COLOR
+        if value is not None:
+            self.label(state.pos, value)
+        self._step_count += 1
+        if (self._step_count-1) % self.every == 0:
+            self._grab()
+
+    def show_path(self, goal_state: State) -> None:
+        """展開の様子を消し，初期状態から目標状態までの経路を1マスずつ示すコマを加える"""
+        self.image = self.background.copy()
+        self.extending_marker.set_data([], [])
+        for artist in self.label_artists.values():
+            artist.remove()
+        self.label_artists = {}
+        for i, state in enumerate(goal_state.path()):
+            (i1, j1), (i2, j2) = state.pos
+            self.current_marker.set_data([j1, j2], [i1, i2])
+            self.label(state.pos, i)
+            self._grab()
+
+
+class ExpansionRecorder(SearchObserver[State]):
+    def __init__(self, animation: StreamingAnimation, value: Optional[Callable[[State, int], int]] = None) -> None:
+        """展開した状態ごとにコマを加える観測者
+
+        Args:
+            animation (StreamingAnimation): 書き出すアニメーション
+            value (Optional[Callable[[State, int], int]], optional): 状態と展開した順番から表示する数字を求める関数.
+                Defaults to None（展開した順番）.
+        """
+        self.animation = animation
+        self.value = value
+
+    def on_expand(self, state: State, order: int) -> None:
+        self.animation.step(state, order if self.value is None else self.value(state, order))
+
+
+@dataclass(frozen=True)
+class Frame:
+    """再生するアニメーションの1コマ（前のコマからの変化）"""
+    marker: Optional[Pos] = None  # マーカーを置く位置（Noneならマーカーを動かさない）
+    current: bool = False  # マーカーを現在位置（黄）とするか展開中（緑）とするか
+    clear: bool = False  # 数字を全て消してから`labels`を表示するか否か
+    labels: tuple[tuple[Pos, int], ...] = ()  # 表示する（既にある場合は書き換える）数字
+
+
+def path_frames(goal_state: State) -> list[Frame]:
+    """展開の様子を消し，初期状態から目標状態までの経路を1マスずつ示すコマ"""
+    return [Frame(state.pos, True, i == 0, ((state.pos, i),)) for i, state in enumerate(goal_state.path())]
+
+
+def replay_animation(initial_state: State, goal_pos: Pos, frames: list[Frame],
+                     interval: int = 200) -> 'animation.FuncAnimation':
+    """記録したコマをpyplotの図で再生するアニメーション
+
+    `ArtistAnimation`のようにコマごとに全ての描画要素の列を持たず，前のコマからの変化のみを描き直す．
+    最初のコマや飛び越したコマを描くとき（繰り返しの再生など）は最初から描き直す．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        frames (list[Frame]): コマの列
+        interval (int, optional): コマの間隔（ミリ秒）. Defaults to 200.
+
+    Returns:
+        animation.FuncAnimation: 記録したコマのアニメーション
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib import animation
+
+    fig = plt.figure()
+    ax = fig.gca()
+    get_first_artist(initial_state, goal_pos)
+    extending_marker, = ax.plot([], [], 'sg')
+    current_marker, = ax.plot([], [], 'sy')
+    texts: dict[Pos, object] = {}  # 位置ごとの数字
+    shown = -1  # 最後に描いたコマの番号
+
+    def clear_labels() -> None:
+        for text in texts.values():
+            text.remove()
+        texts.clear()
+
+    def apply(frame: Frame) -> None:
+        if frame.clear:
+            clear_labels()
+        for pos, value in frame.labels:
+            text = texts.get(pos)
+            if text is None:
+                x, y = pos_center(pos)
+                texts[pos] = ax.text(y, x, str(value), ha='center', va='center')
+            else:
+                text.set_text(str(value))
+        if frame.marker is not None:
+            (i1, j1), (i2, j2) = frame.marker
+            shown_marker, hidden_marker = ((current_marker, extending_marker) if frame.current
+                                           else (extending_marker, current_marker))
+            shown_marker.set_data([j1, j2], [i1, i2])
+            hidden_marker.set_data([], [])
+
+    def update(index: int) -> list:
+        nonlocal shown
+        start = index
+        if index != shown+1:
+            clear_labels()
+            extending_marker.set_data([], [])
+            current_marker.set_data([], [])
+            start = 0
+        for frame in frames[start:index+1]:
+            apply(frame)
+        shown = index
+        return []
+
+    return animation.FuncAnimation(fig, update, frames=len(frames), interval=interval)
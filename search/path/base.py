@@ -1,9 +1,13 @@
-from typing import Optional
+import sys
+from pathlib import Path
+from typing import Optional, Sequence, Union
 
-import matplotlib.pyplot as plt
+import numpy as np
 
-# ロボットの位置 ((i1,j1), (i2,j2))
-Pos = tuple[tuple[int, int], tuple[int, int]]
+# 探索の各ディレクトリで共有するモジュール(search/common)を読み込めるようにする
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from grid import ConfigGraph, Pos, load_map  # noqa: E402
 
 
 def pos_center(pos: Pos) -> tuple[float, float]:
@@ -14,12 +18,15 @@ def pos_center(pos: Pos) -> tuple[float, float]:
 
 def get_count_artist(pos: Pos, count: int):
     """数字をmatplotlibで表示"""
+    # matplotlibは図示するときにのみ読み込む（探索の本体だけを用いる場合は読み込まない）
+    import matplotlib.pyplot as plt
+
     x, y = pos_center(pos)
     return [plt.text(y, x, str(count), ha='center', va='center')]
 
 
 # 作業環境（0は障害物，1は自由領域）
-MAP = (
+MAP = np.array((
     (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
     (0, 0, 1, 1, 1, 0, 1, 1, 1, 0),
     (0, 0, 1, 1, 1, 0, 1, 1, 1, 0),
@@ -32,7 +39,28 @@ MAP = (
     (0, 1, 1, 1, 1, 0, 0, 1, 1, 0),
     (0, 1, 1, 1, 1, 1, 1, 1, 1, 0),
     (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
-)
+), dtype=np.uint8)
+_graph: Optional[ConfigGraph] = None  # 作業環境の配置のグラフ（初めて用いるときに作る）
+
+
+def use_map(grid: Union[Sequence[Sequence[int]], np.ndarray, str, Path]) -> None:
+    """作業環境を置き換える
+
+    Args:
+        grid (Union[Sequence[Sequence[int]], np.ndarray, str, Path]): 作業環境（0は障害物，1は自由領域）か，
+            `load_map`で読み込むファイルのパス
+    """
+    global MAP, _graph
+    MAP = load_map(grid) if isinstance(grid, (str, Path)) else np.asarray(grid, dtype=np.uint8)
+    _graph = None
+
+
+def config_graph() -> ConfigGraph:
+    """現在の作業環境の配置のグラフ"""
+    global _graph
+    if _graph is None:
+        _graph = ConfigGraph(MAP)
+    return _graph
 
 
 class State:
@@ -44,81 +72,31 @@ class State:
             depth (int): ルートノードからの深さ
             parent (Optional[): 親ノード
         """
-        self.pos = pos
+        self.node = config_graph().node_id(pos)  # 配置の番号
+        self._pos: Optional[Pos] = pos
         self.depth = depth
         self.parent = parent
 
+    @classmethod
+    def from_node(cls, node: int, depth: int, parent: Optional['State']) -> 'State':
+        """配置の番号から状態を作る（位置は用いるときに求める）"""
+        state = cls.__new__(cls)
+        state.node = node
+        state._pos = None
+        state.depth = depth
+        state.parent = parent
+        return state
+
+    @property
+    def pos(self) -> Pos:
+        """位置"""
+        if self._pos is None:
+            self._pos = config_graph().pos(self.node)
+        return self._pos
+
     def extend(self) -> list['State']:
-        """移動可能な次の状態を展開する"""
-        pos_list: list[Pos] = []
-        if self.pos[0][0] == self.pos[1][0]:
-            # ロボットが横の場合
-            left_pos, right_pos = self.pos
-            # マップは障害物で囲われているのでロボットが外に出ることはない
-            if MAP[right_pos[0]][right_pos[1]+1] == 1:
-                # 右に移動
-                pos_list.append((right_pos, (right_pos[0], right_pos[1]+1)))
-            if MAP[left_pos[0]][left_pos[1]-1] == 1:
-                # 左に移動
-                pos_list.append(((left_pos[0], left_pos[1]-1), left_pos))
-            above_right_free = MAP[right_pos[0]-1][right_pos[1]] == 1
-            above_left_free = MAP[left_pos[0]-1][left_pos[1]] == 1
-            below_right_free = MAP[right_pos[0]+1][right_pos[1]] == 1
-            below_left_free = MAP[left_pos[0]+1][left_pos[1]] == 1
-            if above_right_free and above_left_free:
-                # 上に移動
-                pos_list.append(
-                    ((left_pos[0]-1, left_pos[1]), (right_pos[0]-1, right_pos[1])))
-            if below_right_free and below_left_free:
-                # 下に移動
-                pos_list.append(
-                    ((left_pos[0]+1, left_pos[1]), (right_pos[0]+1, right_pos[1])))
-            if above_right_free:
-                # 右上に移動
-                pos_list.append(((right_pos[0]-1, right_pos[1]), right_pos))
-            if above_left_free:
-                # 左上に移動
-                pos_list.append(((left_pos[0]-1, left_pos[1]), left_pos))
-            if below_right_free:
-                # 右下に移動
-                pos_list.append((right_pos, (right_pos[0]+1, right_pos[1])))
-            if below_left_free:
-                # 左下に移動
-                pos_list.append((left_pos, (left_pos[0]+1, left_pos[1])))
-        else:
-            # ロボットが縦の場合
-            above_pos, below_pos = self.pos
-            if MAP[above_pos[0]-1][above_pos[1]] == 1:
-                # 上に移動
-                pos_list.append(((above_pos[0]-1, above_pos[1]), above_pos))
-            if MAP[below_pos[0]+1][below_pos[1]] == 1:
-                # 下に移動
-                pos_list.append((below_pos, (below_pos[0]+1, below_pos[1])))
-            above_right_free = MAP[above_pos[0]][above_pos[1]+1] == 1
-            above_left_free = MAP[above_pos[0]][above_pos[1]-1] == 1
-            below_right_free = MAP[below_pos[0]][below_pos[1]+1] == 1
-            below_left_free = MAP[below_pos[0]][below_pos[1]-1] == 1
-            if above_right_free and below_right_free:
-                # 右に移動
-                pos_list.append(
-                    ((above_pos[0], above_pos[1]+1), (below_pos[0], below_pos[1]+1)))
-            if above_left_free and below_left_free:
-                # 左に移動
-                pos_list.append(
-                    ((above_pos[0], above_pos[1]-1), (below_pos[0], below_pos[1]-1)))
-            if above_right_free:
-                # 右上に移動
-                pos_list.append((above_pos, (above_pos[0], above_pos[1]+1)))
-            if above_left_free:
-                # 左上に移動
-                pos_list.append(((above_pos[0], above_pos[1]-1), above_pos))
-            if below_right_free:
-                # 右下に移動
-                pos_list.append((below_pos, (below_pos[0], below_pos[1]+1)))
-            if below_left_free:
-                # 左下に移動
-                pos_list.append(((below_pos[0], below_pos[1]-1), below_pos))
-        return [State(pos, self.depth+1, self) for pos in pos_list]
+        """移動可能な次の状態を展開する（配置のグラフの隣接頂点を切り出す）"""
+        return [State.from_node(node, self.depth+1, self) for node in config_graph().successors(self.node)]
 
     def heuristic(self, goal_pos: Pos) -> int:
         """ヒューリスティック関数（マンハッタン距離）"""
@@ -138,6 +116,8 @@ class State:
 
     def get_position_artist(self, fmt: str):
         """マーカーをmatplotlibで表示"""
+        import matplotlib.pyplot as plt
+
         return plt.plot(self.pos[0][1], self.pos[0][0], fmt) + plt.plot(self.pos[1][1], self.pos[1][0], fmt)
 
     def get_extending_position_artist(self):
@@ -157,6 +137,8 @@ class State:
 
 def get_first_artist(initial_state: State, goal_pos: Pos):
     """作業環境および初期位置と目標位置をmatplotlibで表示"""
+    import matplotlib.pyplot as plt
+
     return [
         plt.imshow(MAP, cmap='gray', aspect='equal'),
         plt.text(initial_state.pos[0][1],
@@ -1,78 +1,117 @@
 """幅優先探索"""
 from collections import deque
-from time import time
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional, Union
 
-import matplotlib.pyplot as plt
-from matplotlib import animation
+from animate import ExpansionRecorder, Frame, StreamingAnimation, path_frames, replay_animation
+from base import Pos, State, config_graph
+from common.metrics import SearchMetrics, SearchObserver, report
 
-from base import Pos, State, get_count_artist, get_first_artist
+if TYPE_CHECKING:
+    from matplotlib import animation
 
 
-def bfs(initial_state: State, goal_pos: Pos, disp: bool = True) -> animation.ArtistAnimation:
-    """幅優先探索
+def bfs_search(initial_state: State, goal_pos: Pos, metrics: Optional[SearchMetrics] = None,
+               observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """幅優先探索の本体（図示しない）
 
     Args:
         initial_state (State): 初期状態
         goal_pos (Pos): 目標状態の位置
-        disp (bool, optional): 図示するか否か. Defaults to True.
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は状態を取り出すごとと子を生成するごとに呼ぶ観測者.
+            Defaults to None.
 
     Returns:
-        animation.ArtistAnimation: 探索の様子と解の経路のアニメーション
+        tuple[State, int]: 目標状態と展開回数
     """
-
-    fig = plt.figure()
-    artists = [get_first_artist(initial_state, goal_pos)]
-    extension_artists = []
-
-    start_time = time()
-
+    graph = config_graph()
+    goal_node = graph.node_id(goal_pos)
     q = deque([initial_state])  # キュー
-    pos_set: set[Pos] = {initial_state.pos}  # 繰り返し状態を回避するための訪れた場所の集合
+    visited = bytearray(graph.size)  # 繰り返し状態を回避するための訪れた配置の印
+    visited[initial_state.node] = 1
+    if metrics is not None:
+        metrics.start_counting()
 
     extension_count = 0  # 展開した回数
     while True:
         state = q.popleft()  # キューの先頭から取り出す
-        if disp:
-            extension_artist = get_count_artist(state.pos, extension_count)
-            extension_artists.append(extension_artists[-1]+extension_artist
-                                    if len(extension_artists) > 0 else extension_artist)
-            artists.append(
-                artists[0] + state.get_extending_position_artist() + extension_artists[-1])
-
-        if state.pos == goal_pos:
+        if observer is not None:
+            observer.on_expand(state, extension_count)
+
+        if state.node == goal_node:
             # 目標状態に到達したのでループを抜ける
-            break
+            return state, extension_count
         # 子ノードをキューに追加する
-        children = [child for child in state.extend()
-                    if child.pos not in pos_set]
-        for child in children:
-            pos_set.add(child.pos)
+        successors = graph.successors(state.node)
+        if observer is not None:
+            for child in state.extend():
+                observer.on_generate(child, state)
+        children = []
+        for node in successors:
+            if not visited[node]:
+                visited[node] = 1
+                children.append(State.from_node(node, state.depth+1, state))
         q.extend(children)
+        if metrics is not None:
+            metrics.generations += len(successors)
+            metrics.duplicates += len(successors)-len(children)
+            metrics.max_frontier = max(metrics.max_frontier, len(q))
         extension_count += 1
 
-    end_time = time()
-    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
-    print(f"展開回数:\t{extension_count}")
-    print(f"解の経路コスト:\t{state.depth}")
+
+def bfs(initial_state: State, goal_pos: Pos, disp: bool = True) -> Optional['animation.FuncAnimation']:
+    """幅優先探索
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        disp (bool, optional): 図示するか否か（Falseならmatplotlibを用いない）. Defaults to True.
+
+    Returns:
+        Optional[animation.FuncAnimation]: 探索の様子と解の経路のアニメーション（図示しない場合はNone）
+    """
+    frames = [Frame()]  # 最初のコマは作業環境のみ
+
+    class ExtensionObserver(SearchObserver[State]):
+        def on_expand(self, state: State, order: int) -> None:
+            frames.append(Frame(state.pos, labels=((state.pos, order),)))
+
+    start_time = perf_counter()
+    state, extension_count = bfs_search(
+        initial_state, goal_pos, observer=ExtensionObserver() if disp else None)
+    end_time = perf_counter()
+    report(end_time-start_time, extension_count, state.depth)
+    if not disp:
+        return None
 
     # 目標状態から初期状態まで遡って表示
-    path = state.path()
-    order_artists = []
-    for i, state in enumerate(path):
-        order_artist = get_count_artist(state.pos, i)
-        order_artists.append(order_artists[-1]+order_artist
-                             if len(order_artists) > 0 else order_artist)
-        artists.append(
-            artists[0] + state.get_current_position_artist() + order_artists[-1])
+    return replay_animation(initial_state, goal_pos, frames+path_frames(state))
+
+
+def bfs_stream(initial_state: State, goal_pos: Pos, path: Union[str, Path], **kwargs) -> tuple[State, int]:
+    """幅優先探索の様子を1コマずつ動画に書き出す（全てのコマを保持しない）
 
-    return animation.ArtistAnimation(fig, artists)
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        path (Union[str, Path]): 書き出すファイルのパス
+        **kwargs: `animate.StreamingAnimation`に渡す引数（`fps`, `every`など）
+
+    Returns:
+        tuple[State, int]: 目標状態と展開回数
+    """
+    with StreamingAnimation(path, initial_state, goal_pos, **kwargs) as ani:
+        state, extension_count = bfs_search(initial_state, goal_pos, observer=ExpansionRecorder(ani))
+        ani.show_path(state)
+    return state, extension_count
 
 
 if __name__ == '__main__':
     initial_state = State(((1, 3), (2, 3)), 0, None)
     goal_pos: Pos = ((4, 7), (5, 7))
-    ani = bfs(initial_state, goal_pos)
     from os import path
     meth = path.splitext(path.basename(__file__))[0]
-    ani.save(f'{meth}.gif', writer="imagemagick")
-    ani.save(f'{meth}.mp4', writer="ffmpeg")
+    bfs_stream(initial_state, goal_pos, f'{meth}.gif')
+    bfs_stream(initial_state, goal_pos, f'{meth}.mp4')
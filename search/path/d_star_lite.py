@@ -0,0 +1,245 @@
+"""D* Lite（作業環境の変化に応じた差分の再計画）
+
+目標状態から逆向きに求めたg・rhsの値を問い合わせの間で保持し，マスが障害物になったり空いたりしたときは
+そのマスを含む配置とその隣接頂点の値のみを直してから，不整合な頂点のみを展開し直す．
+作業環境の変化で配置が増減するので，`grid.ConfigGraph`ではなく全ての向きと位置の格子に番号を付け，
+移動できるかはその時点の作業環境から求める（移動の順番は`ConfigGraph`と同じ）．
+移動は可逆なので，前の頂点は次の頂点と同じである．
+"""
+import heapq
+from time import perf_counter
+from typing import Iterable, Optional
+
+import numpy as np
+
+import base
+from base import Pos
+from common.metrics import SearchMetrics, report
+
+# 到達できない頂点のg・rhsの値
+INF = float('inf')
+
+
+class DStarLite:
+    def __init__(self, start_pos: Pos, goal_pos: Pos, grid: Optional[np.ndarray] = None) -> None:
+        """D* Liteによる経路計画器
+
+        Args:
+            start_pos (Pos): ロボットの現在の位置
+            goal_pos (Pos): 目標状態の位置
+            grid (Optional[np.ndarray], optional): 作業環境（コピーして保持する）. Defaults to None（`base.MAP`）.
+        """
+        self.grid = np.array(base.MAP if grid is None else grid, dtype=np.uint8)
+        self.height, self.width = self.grid.shape
+        self._cells = self.height*self.width  # 1つの向きの格子の頂点の数
+        self.start = self.node_id(start_pos)
+        self.goal = self.node_id(goal_pos)
+        self._last = self.start  # 最後にkmを更新したときのロボットの位置
+        self.km = 0  # ロボットが移動した分の優先度の補正
+        self.g: dict[int, float] = {}  # ない頂点はINF
+        self.rhs: dict[int, float] = {self.goal: 0}
+        self._queued: dict[int, tuple[float, float]] = {}  # キューにある頂点の最新の優先度
+        self._queue: list[tuple[tuple[float, float], int]] = []
+        self._push(self.goal)
+        self.expansions = 0  # 展開回数の合計
+
+    def node_id(self, pos: Pos) -> int:
+        """位置から格子の頂点の番号を求める（横向きは左，縦向きは上のマスの位置の番号）"""
+        (i1, j1), (i2, j2) = sorted(pos)
+        if i1 == i2 and j2 == j1+1 and 0 <= i1 < self.height and 0 <= j1 < self.width-1:
+            return i1*self.width+j1
+        if j1 == j2 and i2 == i1+1 and 0 <= i1 < self.height-1 and 0 <= j1 < self.width:
+            return self._cells+i1*self.width+j1
+        raise ValueError(f'作業環境の外の位置です: {pos}')
+
+    def pos(self, node: int) -> Pos:
+        """格子の頂点の番号から位置を求める"""
+        vertical = node >= self._cells
+        i, j = divmod(node-self._cells if vertical else node, self.width)
+        return ((i, j), (i+1, j)) if vertical else ((i, j), (i, j+1))
+
+    def _free(self, node: int) -> bool:
+        """ロボットを置けるか否か"""
+        (i1, j1), (i2, j2) = self.pos(node)
+        return self.grid[i1, j1] == 1 and self.grid[i2, j2] == 1
+
+    def _neighbors(self, node: int) -> list[int]:
+        """障害物を無視して移動先となりうる頂点（作業環境の内側のみ）"""
+        vertical = node >= self._cells
+        i, j = divmod(node-self._cells if vertical else node, self.width)
+        if vertical:
+            # 上・下・右・左・右上・左上・右下・左下
+            candidates = ((1, i-1, j), (1, i+1, j), (1, i, j+1), (1, i, j-1),
+                          (0, i, j), (0, i, j-1), (0, i+1, j), (0, i+1, j-1))
+        else:
+            # 右・左・上・下・右上・左上・右下・左下
+            candidates = ((0, i, j+1), (0, i, j-1), (0, i-1, j), (0, i+1, j),
+                          (1, i-1, j+1), (1, i-1, j), (1, i, j+1), (1, i, j))
+        nodes = []
+        for v, ci, cj in candidates:
+            if 0 <= ci < self.height-v and 0 <= cj < self.width-1+v:
+                nodes.append(v*self._cells+ci*self.width+cj)
+        return nodes
+
+    def successors(self, node: int) -> list[int]:
+        """現在の作業環境で移動できる頂点"""
+        if not self._free(node):
+            return []
+        return [n for n in self._neighbors(node) if self._free(n)]
+
+    def heuristic(self, node: int, other: int) -> int:
+        """2つの頂点のロボット中心のマンハッタン距離の小数点以下を切り捨てた値"""
+        (a1, b1), (a2, b2) = self.pos(node)
+        (c1, d1), (c2, d2) = self.pos(other)
+        return (abs(a1+a2-c1-c2)+abs(b1+b2-d1-d2))//2
+
+    def _key(self, node: int) -> tuple[float, float]:
+        m = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return m+self.heuristic(self.start, node)+self.km, m
+
+    def _push(self, node: int) -> None:
+        key = self._key(node)
+        self._queued[node] = key
+        heapq.heappush(self._queue, (key, node))
+
+    def _update_vertex(self, node: int) -> None:
+        if node != self.goal:
+            self.rhs[node] = min((1+self.g.get(n, INF) for n in self.successors(node)), default=INF)
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            self._push(node)
+        else:
+            # キューから除く（ヒープの要素は取り出すときに読み飛ばす）
+            self._queued.pop(node, None)
+
+    def _top(self) -> Optional[tuple[tuple[float, float], int]]:
+        """優先度が最小の有効な要素（古い要素は捨てる）"""
+        while self._queue:
+            key, node = self._queue[0]
+            if self._queued.get(node) == key:
+                return key, node
+            heapq.heappop(self._queue)
+        return None
+
+    def _compute_shortest_path(self, metrics: Optional[SearchMetrics]) -> int:
+        """ロボットの位置が整合するまで不整合な頂点を展開し，展開回数を返す"""
+        extension_count = 0
+        while True:
+            top = self._top()
+            if top is None:
+                break
+            start_key = self._key(self.start)
+            if top[0] >= start_key and self.rhs.get(self.start, INF) == self.g.get(self.start, INF):
+                break
+            key, node = heapq.heappop(self._queue)
+            new_key = self._key(node)
+            if key < new_key:
+                self._push(node)
+                continue
+            del self._queued[node]
+            extension_count += 1
+            predecessors = self.successors(node)
+            if metrics is not None:
+                metrics.generations += len(predecessors)
+            if self.g.get(node, INF) > self.rhs.get(node, INF):
+                self.g[node] = self.rhs[node]
+            else:
+                self.g.pop(node, None)
+                self._update_vertex(node)
+            for predecessor in predecessors:
+                self._update_vertex(predecessor)
+            if metrics is not None:
+                metrics.max_frontier = max(metrics.max_frontier, len(self._queued))
+        self.expansions += extension_count
+        return extension_count
+
+    def plan(self, metrics: Optional[SearchMetrics] = None) -> tuple[list[Pos], int]:
+        """ロボットの位置から目標状態までの最短経路を求める
+
+        前回の計画以降に変化した部分のみを展開し直す．
+
+        Args:
+            metrics (Optional[SearchMetrics], optional): 与えられた場合は展開で調べた隣接頂点の数などを記録する.
+                Defaults to None.
+
+        Raises:
+            ValueError: 目標状態に到達できない場合
+
+        Returns:
+            tuple[list[Pos], int]: ロボットの位置から目標状態までの位置の列と，この計画での展開回数
+        """
+        if metrics is not None:
+            metrics.start_counting()
+        extension_count = self._compute_shortest_path(metrics)
+        if self.g.get(self.start, INF) == INF:
+            raise ValueError('目標状態に到達できません')
+        # 移動先のg+1が最小の頂点をたどる
+        path = [self.pos(self.start)]
+        node = self.start
+        while node != self.goal:
+            node = min(self.successors(node), key=lambda n: self.g.get(n, INF))
+            path.append(self.pos(node))
+        return path, extension_count
+
+    def move_to(self, pos: Pos) -> None:
+        """ロボットが移動した（優先度の補正は作業環境が変化したときにまとめて行う）"""
+        self.start = self.node_id(pos)
+
+    def update_cells(self, changes: Iterable[tuple[tuple[int, int], int]]) -> None:
+        """マスの状態の変化を反映する
+
+        Args:
+            changes (Iterable[tuple[tuple[int, int], int]]): マスの位置と新しい値（0は障害物，1は自由領域）の組
+        """
+        affected: set[int] = set()
+        for (i, j), value in changes:
+            if self.grid[i, j] == value:
+                continue
+            self.grid[i, j] = value
+            # マスを含む配置（横向きは左右，縦向きは上下にずらした2つ）
+            for v, ci, cj in ((0, i, j), (0, i, j-1), (1, i, j), (1, i-1, j)):
+                if 0 <= ci < self.height-v and 0 <= cj < self.width-1+v:
+                    affected.add(v*self._cells+ci*self.width+cj)
+        if not affected:
+            return
+        self.km += self.heuristic(self._last, self.start)
+        self._last = self.start
+        # 変化した配置とその隣接頂点は移動先が変わるのでrhsを求め直す
+        for node in affected:
+            self._update_vertex(node)
+            for neighbor in self._neighbors(node):
+                self._update_vertex(neighbor)
+
+
+def d_star_lite_search(initial_pos: Pos, goal_pos: Pos,
+                       metrics: Optional[SearchMetrics] = None) -> tuple[list[Pos], int]:
+    """作業環境が変化しない場合のD* Lite（1回だけ計画する）"""
+    return DStarLite(initial_pos, goal_pos).plan(metrics)
+
+
+if __name__ == '__main__':
+    from a_star import a_star_search
+    from base import State
+
+    initial_pos: Pos = ((1, 3), (2, 3))
+    goal_pos: Pos = ((4, 7), (5, 7))
+    planner = DStarLite(initial_pos, goal_pos)
+    start_time = perf_counter()
+    path, extension_count = planner.plan()
+    print("初回の計画")
+    report(perf_counter()-start_time, extension_count, len(path)-1)
+
+    # 2マス進んでから，経路上のマスを塞ぐ
+    planner.move_to(path[2])
+    changes = [((10, 3), 0)]
+    planner.update_cells(changes)
+    start_time = perf_counter()
+    path, extension_count = planner.plan()
+    print("マスを塞いだ後の再計画")
+    report(perf_counter()-start_time, extension_count, len(path)-1)
+
+    # 比較のため，変化した作業環境でA*探索をやり直す
+    base.use_map(planner.grid)
+    start_time = perf_counter()
+    state, extension_count = a_star_search(State(path[0], 0, None), goal_pos)
+    print("A*探索のやり直し")
+    report(perf_counter()-start_time, extension_count, state.depth)
@@ -0,0 +1,200 @@
+"""目標位置ごとの距離場とそのキャッシュ"""
+import os
+from collections import OrderedDict
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from base import Pos, State, config_graph
+from common.metrics import SearchMetrics, SearchObserver, report
+from grid import ConfigGraph
+
+# 目標状態に到達できない配置の距離
+UNREACHABLE = -1
+# キャッシュに保持する距離場の合計の大きさの既定値（バイト）
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def distance_field(graph: ConfigGraph, goal_node: int) -> np.ndarray:
+    """目標状態の配置から逆向きの幅優先探索を行い，全ての配置から目標状態までの最小の移動回数を求める
+
+    1つの層の配置の逆向きの隣接頂点をまとめて配列で求めるので，Pythonの繰り返しは層の数だけである．
+
+    Args:
+        graph (ConfigGraph): 配置のグラフ
+        goal_node (int): 目標状態の配置の番号
+
+    Returns:
+        np.ndarray: 配置ごとの目標状態までの移動回数（到達できない配置は`UNREACHABLE`）
+    """
+    indptr, indices = graph.reverse()
+    field = np.full(graph.size, UNREACHABLE, dtype=np.int32)
+    field[goal_node] = 0
+    frontier = np.array([goal_node], dtype=np.int32)
+    distance = 0
+    while len(frontier) > 0:
+        distance += 1
+        # 層の各配置の隣接頂点の区間を連結した添字
+        starts = indptr[frontier]
+        lengths = indptr[frontier+1]-starts
+        offsets = np.repeat(starts-np.cumsum(lengths)+lengths, lengths) + \
+            np.arange(lengths.sum(), dtype=np.int32)
+        neighbors = indices[offsets]
+        frontier = np.unique(neighbors[field[neighbors] == UNREACHABLE])
+        field[frontier] = distance
+    return field
+
+
+class DistanceFieldCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, cache_dir: Optional[Union[str, Path]] = None) -> None:
+        """目標位置ごとの距離場を最近使われた順に保持するキャッシュ
+
+        距離場は作業環境と目標状態の配置の組ごとに一度だけ求め，合計の大きさが`max_bytes`を超えると
+        最も長く使われていない距離場から捨てる．`cache_dir`を与えた場合は求めた距離場をファイルにも保存し，
+        キャッシュにない場合は求め直す前にファイルから読み込む．
+
+        Args:
+            max_bytes (int, optional): 保持する距離場の合計の大きさの上限（バイト）. Defaults to DEFAULT_MAX_BYTES.
+            cache_dir (Optional[Union[str, Path]], optional): 距離場を保存するディレクトリ. Defaults to None（保存しない）.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self._fields: OrderedDict[tuple[str, int], np.ndarray] = OrderedDict()
+        self.nbytes = 0  # 保持している距離場の合計の大きさ
+        self.hits = 0  # キャッシュにあった回数
+        self.disk_hits = 0  # ファイルから読み込んだ回数
+        self.misses = 0  # 求めた回数
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def _path(self, key: tuple[str, int]) -> Path:
+        digest, goal_node = key
+        return self.cache_dir/f'{digest}-{goal_node}.npy'
+
+    def _load(self, key: tuple[str, int], graph: ConfigGraph) -> Optional[np.ndarray]:
+        """ファイルから距離場を読み込む（ない場合と大きさが合わない場合はNone）"""
+        if self.cache_dir is None:
+            return None
+        try:
+            field = np.load(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return field if field.shape == (graph.size,) else None
+
+    def _save(self, key: tuple[str, int], field: np.ndarray) -> None:
+        """距離場をファイルに保存する（書きかけのファイルを読まないよう一時ファイルから置き換える）"""
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, field)
+        os.replace(tmp_path, path)
+
+    def field(self, goal_pos: Pos, graph: Optional[ConfigGraph] = None) -> np.ndarray:
+        """目標位置の距離場
+
+        Args:
+            goal_pos (Pos): 目標状態の位置
+            graph (Optional[ConfigGraph], optional): 配置のグラフ. Defaults to None（現在の作業環境のグラフ）.
+
+        Returns:
+            np.ndarray: 配置ごとの目標状態までの移動回数（書き換えないこと）
+        """
+        if graph is None:
+            graph = config_graph()
+        key = (graph.digest, graph.node_id(goal_pos))
+        field = self._fields.get(key)
+        if field is not None:
+            self.hits += 1
+            self._fields.move_to_end(key)
+            return field
+        field = self._load(key, graph)
+        if field is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            field = distance_field(graph, key[1])
+            self._save(key, field)
+        field.flags.writeable = False
+        if field.nbytes <= self.max_bytes:
+            self._fields[key] = field
+            self.nbytes += field.nbytes
+            while self.nbytes > self.max_bytes:
+                _key, evicted = self._fields.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return field
+
+    def heuristic(self, goal_pos: Pos, graph: Optional[ConfigGraph] = None) -> Callable[[int, int], int]:
+        """距離場による完全なヒューリスティック関数（`a_star.a_star_search`の`heuristic`に渡す）"""
+        field = self.field(goal_pos, graph)
+        values = memoryview(field)
+        return lambda node, _goal_node: values[node]
+
+
+def gradient_search(initial_state: State, goal_pos: Pos, cache: DistanceFieldCache,
+                    metrics: Optional[SearchMetrics] = None,
+                    observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """距離場の勾配をたどって最短経路を求める
+
+    各配置から距離が1だけ小さい隣接頂点のうち最初のものへ移動する．展開回数は移動した回数となる．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        cache (DistanceFieldCache): 距離場のキャッシュ
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は調べた隣接頂点の数を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は移動するごとに呼ぶ観測者. Defaults to None.
+
+    Raises:
+        ValueError: 初期状態から目標状態に到達できない場合
+
+    Returns:
+        tuple[State, int]: 目標状態と展開回数
+    """
+    graph = config_graph()
+    values = memoryview(cache.field(goal_pos, graph))
+    if values[initial_state.node] == UNREACHABLE:
+        raise ValueError('目標状態に到達できません')
+    if metrics is not None:
+        metrics.start_counting()
+    extension_count = 0  # 展開した回数
+    state = initial_state
+    while values[state.node] > 0:
+        if observer is not None:
+            observer.on_expand(state, extension_count)
+        distance = values[state.node]
+        for node in graph.successors(state.node):
+            if metrics is not None:
+                metrics.generations += 1
+            if values[node] == distance-1:
+                state = State.from_node(node, state.depth+1, state)
+                break
+        extension_count += 1
+    if observer is not None:
+        observer.on_expand(state, extension_count)
+    return state, extension_count
+
+
+if __name__ == '__main__':
+    from a_star import a_star_search
+
+    initial_state = State(((1, 3), (2, 3)), 0, None)
+    goal_pos: Pos = ((4, 7), (5, 7))
+    cache = DistanceFieldCache()
+
+    def a_star_with_field() -> tuple[State, int]:
+        return a_star_search(State(initial_state.pos, 0, None), goal_pos, heuristic=cache.heuristic(goal_pos))
+
+    for title, search in (
+            ("A*探索（マンハッタン距離）", lambda: a_star_search(State(initial_state.pos, 0, None), goal_pos)),
+            ("A*探索（距離場）", a_star_with_field),
+            ("距離場の勾配", lambda: gradient_search(State(initial_state.pos, 0, None), goal_pos, cache))):
+        start_time = perf_counter()
+        state, extension_count = search()
+        print(title)
+        report(perf_counter()-start_time, extension_count, state.depth)
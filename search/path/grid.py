@@ -0,0 +1,180 @@
+"""作業環境の読み込みとロボットの配置のグラフ"""
+import hashlib
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+# ロボットの位置 ((i1,j1), (i2,j2))
+Pos = tuple[tuple[int, int], tuple[int, int]]
+
+
+def _read_pgm(path: Path) -> np.ndarray:
+    """PGM画像（P2またはP5）を読み込み，最大値の半分より明るい画素を自由領域とする"""
+    data = path.read_bytes()
+    tokens: list[bytes] = []  # マジックナンバー・幅・高さ・最大値
+    offset = 0
+    while len(tokens) < 4:
+        while data[offset:offset+1].isspace():
+            offset += 1
+        if data[offset:offset+1] == b'#':
+            # コメントは行末まで読み飛ばす
+            offset = data.index(b'\n', offset)
+            continue
+        start = offset
+        while not data[offset:offset+1].isspace():
+            offset += 1
+        tokens.append(data[start:offset])
+    magic = tokens[0]
+    width, height, maxval = (int(token) for token in tokens[1:])
+    if magic == b'P5':
+        # ヘッダの後の1文字の空白に続いて画素が並ぶ
+        dtype = np.dtype('>u2') if maxval > 255 else np.dtype('u1')
+        pixels = np.frombuffer(data, dtype, width*height, offset+1)
+    elif magic == b'P2':
+        pixels = np.array(data[offset:].split(), dtype=np.int64)[:width*height]
+    else:
+        raise ValueError(f'対応していないPGMの形式です: {magic.decode()}')
+    return (pixels.reshape(height, width) > maxval//2).astype(np.uint8)
+
+
+def _read_text(path: Path) -> np.ndarray:
+    """1行を1列として'1'か'.'を自由領域，'0'か'#'を障害物とするテキストを読み込む（空白とカンマは無視する）"""
+    rows = []
+    for line in path.read_text().splitlines():
+        row = [1 if c in '1.' else 0 for c in line if c in '01.#']
+        if row:
+            rows.append(row)
+    if len({len(row) for row in rows}) != 1:
+        raise ValueError(f'{path}の行の長さが揃っていません')
+    return np.array(rows, dtype=np.uint8)
+
+
+def load_map(path: Union[str, Path]) -> np.ndarray:
+    """作業環境をファイルから読み込む
+
+    拡張子が`.npy`ならNumPyの配列（0以外を自由領域），`.pgm`ならPGM画像（明るい画素を自由領域），
+    それ以外はテキストとして読む．
+
+    Args:
+        path (Union[str, Path]): ファイルのパス
+
+    Returns:
+        np.ndarray: 作業環境（0は障害物，1は自由領域）
+    """
+    path = Path(path)
+    if path.suffix == '.npy':
+        return (np.load(path) != 0).astype(np.uint8)
+    if path.suffix == '.pgm':
+        return _read_pgm(path)
+    return _read_text(path)
+
+
+def _lookup(index: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """配置の番号の表を引く（範囲外は-1）"""
+    height, width = index.shape
+    inside = (i >= 0) & (i < height) & (j >= 0) & (j < width)
+    nodes = np.full(i.shape, -1, dtype=np.int32)
+    nodes[inside] = index[i[inside], j[inside]]
+    return nodes
+
+
+class ConfigGraph:
+    def __init__(self, grid: np.ndarray) -> None:
+        """ロボットを置ける全ての位置（配置）を頂点とするグラフ
+
+        横向きの配置に0から，続けて縦向きの配置に番号を付け，移動できる配置をCSR形式
+        （`indptr[v]`から`indptr[v+1]`までの`indices`が`v`の隣接頂点）で持つ．
+        隣接頂点の順番は横向きでは右・左・上・下・右上・左上・右下・左下，
+        縦向きでは上・下・右・左・右上・左上・右下・左下への移動の順とする．
+        作業環境の外は障害物として扱うので，外周を障害物で囲う必要はない．
+
+        Args:
+            grid (np.ndarray): 作業環境（0は障害物，1は自由領域）
+        """
+        free = np.asarray(grid) == 1
+        height, width = free.shape
+        # 作業環境を識別する値（距離場のファイル名などに用いる）
+        self.digest = hashlib.sha1(np.packbits(free).tobytes() +
+                                   f'{height}x{width}'.encode()).hexdigest()[:16]
+        # 左（上）のマスの位置ごとの横（縦）向きの配置の番号（置けない場合は-1）
+        horizontal = np.zeros_like(free)
+        horizontal[:, :-1] = free[:, :-1] & free[:, 1:]
+        vertical = np.zeros_like(free)
+        vertical[:-1, :] = free[:-1, :] & free[1:, :]
+        hi, hj = np.nonzero(horizontal)
+        vi, vj = np.nonzero(vertical)
+        self.horizontal_count = len(hi)
+        self.size = len(hi)+len(vi)  # 頂点の数
+        self.h_index = np.full((height, width), -1, dtype=np.int32)
+        self.h_index[hi, hj] = np.arange(len(hi), dtype=np.int32)
+        self.v_index = np.full((height, width), -1, dtype=np.int32)
+        self.v_index[vi, vj] = np.arange(len(hi), self.size, dtype=np.int32)
+
+        h, v = self.h_index, self.v_index
+        targets = np.concatenate([
+            np.stack([_lookup(h, hi, hj+1), _lookup(h, hi, hj-1), _lookup(h, hi-1, hj), _lookup(h, hi+1, hj),
+                      _lookup(v, hi-1, hj+1), _lookup(v, hi-1, hj), _lookup(v, hi, hj+1), _lookup(v, hi, hj)],
+                     axis=1).reshape(-1, 8),
+            np.stack([_lookup(v, vi-1, vj), _lookup(v, vi+1, vj), _lookup(v, vi, vj+1), _lookup(v, vi, vj-1),
+                      _lookup(h, vi, vj), _lookup(h, vi, vj-1), _lookup(h, vi+1, vj), _lookup(h, vi+1, vj-1)],
+                     axis=1).reshape(-1, 8),
+        ])
+        valid = targets >= 0
+        self.indptr = np.zeros(self.size+1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=self.indptr[1:])
+        self.indices = targets[valid].astype(np.int32)  # 行ごとに並ぶので移動の順番が保たれる
+        # 頂点ごとの左（上）のマスの位置
+        self.rows = np.concatenate([hi, vi]).astype(np.int32)
+        self.cols = np.concatenate([hj, vj]).astype(np.int32)
+
+        # 探索の内側の繰り返しで1要素ずつ読むため，Pythonの整数を返すメモリビューも持つ
+        self._indptr = memoryview(self.indptr)
+        self._indices = memoryview(self.indices)
+        self._rows = memoryview(self.rows)
+        self._cols = memoryview(self.cols)
+        self._reverse: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+    def reverse(self) -> tuple[np.ndarray, np.ndarray]:
+        """辺を逆向きにしたグラフのCSR形式の配列(indptr, indices)（初めて用いるときに作る）"""
+        if self._reverse is None:
+            sources = np.repeat(np.arange(self.size, dtype=np.int32), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            indptr = np.zeros(self.size+1, dtype=np.int32)
+            np.cumsum(np.bincount(self.indices, minlength=self.size), out=indptr[1:])
+            self._reverse = indptr, sources[order]
+        return self._reverse
+
+    def node_id(self, pos: Pos) -> int:
+        """位置から配置の番号を求める"""
+        (i1, j1), (i2, j2) = sorted(pos)
+        height, width = self.h_index.shape
+        node = -1
+        if 0 <= i1 < height and 0 <= j1 < width:
+            if i1 == i2 and j2 == j1+1:
+                node = int(self.h_index[i1, j1])
+            elif j1 == j2 and i2 == i1+1:
+                node = int(self.v_index[i1, j1])
+        if node < 0:
+            raise ValueError(f'ロボットを置けない位置です: {pos}')
+        return node
+
+    def pos(self, node: int) -> Pos:
+        """配置の番号から位置を求める"""
+        i, j = self._rows[node], self._cols[node]
+        if node < self.horizontal_count:
+            return (i, j), (i, j+1)
+        return (i, j), (i+1, j)
+
+    def successors(self, node: int) -> memoryview:
+        """移動できる配置の番号（CSRの配列の切り出しで，コピーしない）"""
+        return self._indices[self._indptr[node]:self._indptr[node+1]]
+
+    def heuristic(self, node: int, goal_node: int) -> int:
+        """ヒューリスティック関数（ロボット中心のマンハッタン距離の小数点以下を切り捨てた値）"""
+        # 中心の座標の2倍は左（上）のマスの座標の2倍に向きの分を足したもの
+        di = 2*(self._rows[node]-self._rows[goal_node]) + \
+            (node >= self.horizontal_count)-(goal_node >= self.horizontal_count)
+        dj = 2*(self._cols[node]-self._cols[goal_node]) + \
+            (node < self.horizontal_count)-(goal_node < self.horizontal_count)
+        return (abs(di)+abs(dj))//2
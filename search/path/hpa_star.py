@@ -0,0 +1,276 @@
+"""HPA*探索（作業環境をクラスタに分けた抽象グラフによる階層的な経路計画）
+
+作業環境を`cluster_size`四方のクラスタに分け，配置は左（上）のマスを含むクラスタに属するものとする．
+隣り合うクラスタの間を移動する辺（出入口）を，両側のクラスタ内の連結成分の組ごとに1本ずつ選び，
+その端の配置を抽象グラフの頂点とする．同じクラスタの頂点の間にはクラスタ内の最短の移動回数を辺の重みとして持つ．
+問い合わせでは初期状態と目標状態をそれぞれのクラスタの頂点につないで抽象グラフをA*探索し，
+実際の経路は抽象的な経路の各区間をクラスタ内の幅優先探索で求めて必要になったときに返す．
+抽象グラフの頂点は配置の番号ではなく位置で持つので，作業環境が変化したときは
+変化したマスの近くのクラスタのみを求め直せばよい．
+"""
+import heapq
+from collections import deque
+from time import perf_counter
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+import base
+from base import Pos
+from common.metrics import SearchMetrics, report
+from grid import ConfigGraph
+
+# クラスタの一辺の長さの既定値（マス）
+DEFAULT_CLUSTER_SIZE = 16
+
+
+def _distance(pos1: Pos, pos2: Pos) -> int:
+    """2つの位置のロボット中心のマンハッタン距離の小数点以下を切り捨てた値"""
+    (a1, b1), (a2, b2) = pos1
+    (c1, d1), (c2, d2) = pos2
+    return (abs(a1+a2-c1-c2)+abs(b1+b2-d1-d2))//2
+
+
+class HierarchicalPlanner:
+    def __init__(self, cluster_size: int = DEFAULT_CLUSTER_SIZE, grid: Optional[np.ndarray] = None) -> None:
+        """HPA*探索による経路計画器（作成時に全てのクラスタの出入口とクラスタ内の移動回数を求める）
+
+        Args:
+            cluster_size (int, optional): クラスタの一辺の長さ（マス）. Defaults to DEFAULT_CLUSTER_SIZE.
+            grid (Optional[np.ndarray], optional): 作業環境（コピーして保持する）. Defaults to None（`base.MAP`）.
+        """
+        self.cluster_size = cluster_size
+        self.grid = np.array(base.MAP if grid is None else grid, dtype=np.uint8)
+        height, width = self.grid.shape
+        self.cluster_rows = -(-height//cluster_size)
+        self.cluster_cols = -(-width//cluster_size)
+        # 隣り合うクラスタの組(a, b)（a<b）ごとの出入口（aの配置, bの配置）
+        self._transitions: dict[tuple[int, int], list[tuple[Pos, Pos]]] = {}
+        self._inter: dict[Pos, set[Pos]] = {}  # 出入口でつながる別のクラスタの頂点
+        self._intra: dict[int, dict[Pos, dict[Pos, int]]] = {}  # クラスタごとの頂点とクラスタ内の移動回数
+        self._build_graph()
+        self._recompute(set(range(self.cluster_rows*self.cluster_cols)))
+
+    def _build_graph(self) -> None:
+        """配置のグラフと，クラスタごとの配置の番号の表を作る"""
+        self.graph = ConfigGraph(self.grid)
+        cluster = (self.graph.rows//self.cluster_size)*self.cluster_cols+self.graph.cols//self.cluster_size
+        self._cluster_array = cluster.astype(np.int32)
+        self._cluster = memoryview(self._cluster_array)
+        # クラスタごとの配置の番号（CSR形式）
+        self._members = np.argsort(cluster, kind='stable').astype(np.int32)
+        self._members_ptr = np.searchsorted(cluster[self._members],
+                                            np.arange(self.cluster_rows*self.cluster_cols+1)).astype(np.int32)
+
+    def cluster_of(self, pos: Pos) -> int:
+        """位置の配置が属するクラスタの番号"""
+        i, j = min(pos)
+        return (i//self.cluster_size)*self.cluster_cols+j//self.cluster_size
+
+    def _neighbor_clusters(self, c: int) -> list[int]:
+        """8近傍のクラスタ（回転の移動では斜めのクラスタに移ることがある）"""
+        ci, cj = divmod(c, self.cluster_cols)
+        return [ni*self.cluster_cols+nj for ni in range(ci-1, ci+2) for nj in range(cj-1, cj+2)
+                if (ni, nj) != (ci, cj) and 0 <= ni < self.cluster_rows and 0 <= nj < self.cluster_cols]
+
+    def _cluster_bfs(self, source: int, c: int) -> tuple[dict[int, int], dict[int, int]]:
+        """クラスタ内に限った幅優先探索で，移動回数と親の配置の番号を求める"""
+        graph, cluster = self.graph, self._cluster
+        distance = {source: 0}
+        parent = {source: -1}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for child in graph.successors(node):
+                if cluster[child] == c and child not in distance:
+                    distance[child] = distance[node]+1
+                    parent[child] = node
+                    queue.append(child)
+        return distance, parent
+
+    def _components(self, c: int) -> dict[int, int]:
+        """クラスタ内の連結成分の番号"""
+        labels: dict[int, int] = {}
+        for node in self._members[self._members_ptr[c]:self._members_ptr[c+1]].tolist():
+            if node not in labels:
+                distance, _parent = self._cluster_bfs(node, c)
+                labels.update(dict.fromkeys(distance, len(labels)))
+        return labels
+
+    def _find_transitions(self, a: int, b: int, components: dict[int, dict[int, int]]) -> list[tuple[Pos, Pos]]:
+        """クラスタaとbの間の出入口を，両側の連結成分の組ごとに中央の1本を選んで求める"""
+        graph, cluster = self.graph, self._cluster
+        groups: dict[tuple[int, int], list[tuple[int, int]]] = {}
+        for u in self._members[self._members_ptr[a]:self._members_ptr[a+1]].tolist():
+            for v in graph.successors(u):
+                if cluster[v] == b:
+                    groups.setdefault((components[a][u], components[b][v]), []).append((u, v))
+        transitions = []
+        for edges in groups.values():
+            u, v = edges[len(edges)//2]
+            transitions.append((graph.pos(u), graph.pos(v)))
+        return transitions
+
+    def _recompute(self, clusters: set[int]) -> None:
+        """クラスタとその周りの出入口，およびクラスタ内の移動回数を求め直す"""
+        pairs = {(min(a, n), max(a, n)) for a in clusters for n in self._neighbor_clusters(a)}
+        touched = {c for pair in pairs for c in pair} | clusters  # 頂点が変わりうるクラスタ
+        components = {c: self._components(c) for c in touched}
+        for a, b in pairs:
+            for pos_a, pos_b in self._transitions.pop((a, b), []):
+                self._inter[pos_a].discard(pos_b)
+                self._inter[pos_b].discard(pos_a)
+            transitions = self._find_transitions(a, b, components)
+            if transitions:
+                self._transitions[a, b] = transitions
+            for pos_a, pos_b in transitions:
+                self._inter.setdefault(pos_a, set()).add(pos_b)
+                self._inter.setdefault(pos_b, set()).add(pos_a)
+        for c in touched:
+            entrances = set()
+            for n in self._neighbor_clusters(c):
+                for pos_a, pos_b in self._transitions.get((min(c, n), max(c, n)), ()):
+                    entrances.add(pos_a if c < n else pos_b)
+            edges: dict[Pos, dict[Pos, int]] = {}
+            for pos in entrances:
+                distance, _parent = self._cluster_bfs(self.graph.node_id(pos), c)
+                edges[pos] = {other: distance[self.graph.node_id(other)] for other in entrances
+                              if other != pos and self.graph.node_id(other) in distance}
+            self._intra[c] = edges
+
+    def update_cells(self, changes: Iterable[tuple[tuple[int, int], int]]) -> None:
+        """マスの状態の変化を反映する（変化したマスを含む配置が属するクラスタとその周りのみを求め直す）
+
+        配置のグラフは配列の演算で作り直す．
+
+        Args:
+            changes (Iterable[tuple[tuple[int, int], int]]): マスの位置と新しい値（0は障害物，1は自由領域）の組
+        """
+        clusters: set[int] = set()
+        for (i, j), value in changes:
+            if self.grid[i, j] == value:
+                continue
+            self.grid[i, j] = value
+            # マスを含む配置の左（上）のマスは，そのマスか左か上のマス
+            for ci, cj in ((i, j), (i, j-1), (i-1, j)):
+                if ci >= 0 and cj >= 0:
+                    clusters.add((ci//self.cluster_size)*self.cluster_cols+cj//self.cluster_size)
+        if not clusters:
+            return
+        self._build_graph()
+        self._recompute(clusters)
+
+    def abstract_plan(self, start_pos: Pos, goal_pos: Pos,
+                      metrics: Optional[SearchMetrics] = None) -> tuple[list[Pos], int]:
+        """抽象グラフのA*探索で，初期状態から目標状態までに通る出入口の列を求める
+
+        Args:
+            start_pos (Pos): 初期状態の位置
+            goal_pos (Pos): 目標状態の位置
+            metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数を記録する. Defaults to None.
+
+        Raises:
+            ValueError: 目標状態に到達できない場合
+
+        Returns:
+            tuple[list[Pos], int]: 初期状態の位置から目標状態の位置までの抽象的な経路と展開回数
+        """
+        graph = self.graph
+        start, goal = graph.node_id(start_pos), graph.node_id(goal_pos)
+        start_pos, goal_pos = graph.pos(start), graph.pos(goal)
+        start_cluster, goal_cluster = self._cluster[start], self._cluster[goal]
+        # 初期状態・目標状態とそれぞれのクラスタの頂点をつなぐ一時的な辺
+        extra: dict[Pos, dict[Pos, int]] = {start_pos: {}}
+        distance, _parent = self._cluster_bfs(start, start_cluster)
+        for pos in self._intra[start_cluster]:
+            if graph.node_id(pos) in distance:
+                extra[start_pos][pos] = distance[graph.node_id(pos)]
+        if goal in distance:
+            extra[start_pos][goal_pos] = distance[goal]
+        distance, _parent = self._cluster_bfs(goal, goal_cluster)
+        for pos in self._intra[goal_cluster]:
+            if graph.node_id(pos) in distance:
+                extra.setdefault(pos, {})[goal_pos] = distance[graph.node_id(pos)]
+
+        if metrics is not None:
+            metrics.start_counting()
+        g = {start_pos: 0}
+        parent: dict[Pos, Optional[Pos]] = {start_pos: None}
+        closed: set[Pos] = set()
+        queue = [(_distance(start_pos, goal_pos), 0, start_pos)]
+        extension_count = 0  # 展開した回数
+        while queue:
+            _f, depth, pos = heapq.heappop(queue)
+            if pos in closed or depth != g[pos]:
+                continue
+            if pos == goal_pos:
+                path = []
+                while pos is not None:
+                    path.append(pos)
+                    pos = parent[pos]
+                path.reverse()
+                return path, extension_count
+            closed.add(pos)
+            extension_count += 1
+            neighbors = list(self._intra[self.cluster_of(pos)].get(pos, {}).items())
+            neighbors += [(other, 1) for other in self._inter.get(pos, ())]
+            neighbors += list(extra.get(pos, {}).items())
+            for other, cost in neighbors:
+                if other not in closed and depth+cost < g.get(other, depth+cost+1):
+                    g[other] = depth+cost
+                    parent[other] = pos
+                    heapq.heappush(queue, (depth+cost+_distance(other, goal_pos), depth+cost, other))
+            if metrics is not None:
+                metrics.generations += len(neighbors)
+                metrics.max_frontier = max(metrics.max_frontier, len(queue))
+        raise ValueError('目標状態に到達できません')
+
+    def refine(self, abstract_path: list[Pos]) -> Iterator[Pos]:
+        """抽象的な経路の各区間をクラスタ内の幅優先探索で実際の経路に直し，1つずつ返す（必要な区間のみ求める）"""
+        graph = self.graph
+        yield abstract_path[0]
+        for pos, next_pos in zip(abstract_path, abstract_path[1:]):
+            if next_pos in self._inter.get(pos, ()) and self.cluster_of(pos) != self.cluster_of(next_pos):
+                yield next_pos
+                continue
+            _distance, parent = self._cluster_bfs(graph.node_id(pos), self.cluster_of(pos))
+            route = []
+            node = graph.node_id(next_pos)
+            while parent[node] != -1:
+                route.append(graph.pos(node))
+                node = parent[node]
+            yield from reversed(route)
+
+    def plan(self, start_pos: Pos, goal_pos: Pos, metrics: Optional[SearchMetrics] = None) -> tuple[list[Pos], int]:
+        """初期状態から目標状態までの経路（抽象的な経路を全て実際の経路に直したもの）と抽象グラフの展開回数"""
+        abstract_path, extension_count = self.abstract_plan(start_pos, goal_pos, metrics)
+        return list(self.refine(abstract_path)), extension_count
+
+
+if __name__ == '__main__':
+    from a_star import a_star_search
+    from base import State, config_graph
+    from distance_field import UNREACHABLE, distance_field
+
+    # 無作為な256四方の作業環境で，最大の連結成分から初期状態と目標状態を選ぶ
+    rng = np.random.default_rng(0)
+    grid = (rng.random((256, 256)) < 0.85).astype(np.uint8)
+    base.use_map(grid)
+    graph = config_graph()
+    reachable = np.flatnonzero(distance_field(graph, graph.size//2) != UNREACHABLE)
+    queries = [(graph.pos(int(s)), graph.pos(int(t))) for s, t in rng.choice(reachable, (10, 2))]
+
+    start_time = perf_counter()
+    planner = HierarchicalPlanner(grid=grid)
+    print(f"前処理の計算時間:\t{(perf_counter()-start_time)*1e+3:.3f} ms")
+    for title, search in (
+            ("HPA*探索", lambda s, t: (lambda r: (len(r[0])-1, r[1]))(planner.plan(s, t))),
+            ("A*探索", lambda s, t: (lambda r: (r[0].depth, r[1]))(a_star_search(State(s, 0, None), t)))):
+        start_time = perf_counter()
+        results = [search(s, t) for s, t in queries]
+        print(f"{title}（{len(queries)}問の合計）")
+        report(perf_counter()-start_time, sum(e for _c, e in results), sum(c for c, _e in results))
+
+    start_time = perf_counter()
+    planner.update_cells([((128, j), 0) for j in range(100, 140)])
+    print(f"40マスを塞いだ後の求め直しの計算時間:\t{(perf_counter()-start_time)*1e+3:.3f} ms")
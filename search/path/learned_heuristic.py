@@ -0,0 +1,140 @@
+"""配置の番号で引く学習したヒューリスティック関数の値の保存"""
+import json
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+import numpy as np
+
+from base import Pos, config_graph
+from grid import ConfigGraph
+
+# 値を学習していない配置の値
+UNSET = -1
+
+
+class HeuristicStore(MutableMapping):
+    def __init__(self, graph: Optional[ConfigGraph] = None, values: Optional[np.ndarray] = None) -> None:
+        """配置の番号を添字とする配列で持つ学習したヒューリスティック関数の値
+
+        位置をキーとする辞書（LRTA*探索の`h_dict`）としても用いられる．
+        `open`で開いた場合はファイルをメモリマップし，書き換えた値はそのままファイルに反映される．
+
+        Args:
+            graph (Optional[ConfigGraph], optional): 配置のグラフ. Defaults to None（現在の作業環境のグラフ）.
+            values (Optional[np.ndarray], optional): 配置ごとの値（学習していない配置は`UNSET`）.
+                Defaults to None（全て`UNSET`）.
+        """
+        self.graph = config_graph() if graph is None else graph
+        if values is None:
+            values = np.full(self.graph.size, UNSET, dtype=np.int32)
+        if values.shape != (self.graph.size,):
+            raise ValueError(f'値の数{len(values)}が配置の数{self.graph.size}と異なります')
+        self.values = values
+        self._values = memoryview(values)  # 1要素ずつ読み書きするためのメモリビュー
+
+    @staticmethod
+    def _meta_path(path: Path) -> Path:
+        """作業環境を識別する値を書いたファイルのパス"""
+        return path.with_suffix('.json')
+
+    @classmethod
+    def open(cls, path: Union[str, Path], graph: Optional[ConfigGraph] = None) -> 'HeuristicStore':
+        """ファイルをメモリマップして開く（ない場合は全て`UNSET`の値で作る）
+
+        Raises:
+            ValueError: ファイルが別の作業環境のものである場合
+        """
+        path = Path(path)
+        graph = config_graph() if graph is None else graph
+        meta_path = cls._meta_path(path)
+        if path.exists():
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            if meta.get('digest') != graph.digest:
+                raise ValueError(f'{path}は別の作業環境で学習した値です')
+            values = np.load(path, mmap_mode='r+')
+        else:
+            values = np.lib.format.open_memmap(path, mode='w+', dtype=np.int32, shape=(graph.size,))
+            values[:] = UNSET
+            meta_path.write_text(json.dumps({'digest': graph.digest, 'size': graph.size}))
+        return cls(graph, values)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """値をファイルに保存する（`open`で開ける）"""
+        path = Path(path)
+        np.save(path, np.asarray(self.values))
+        self._meta_path(path).write_text(json.dumps({'digest': self.graph.digest, 'size': self.graph.size}))
+
+    def flush(self) -> None:
+        """メモリマップした値をファイルに書き出す"""
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
+
+    def get_node(self, node: int) -> Optional[int]:
+        """配置の番号の値（学習していない場合はNone）"""
+        h = self._values[node]
+        return None if h == UNSET else h
+
+    def set_node(self, node: int, h: int) -> None:
+        """配置の番号の値を設定する"""
+        self._values[node] = h
+
+    def __getitem__(self, pos: Pos) -> int:
+        h = self.get_node(self.graph.node_id(pos))
+        if h is None:
+            raise KeyError(pos)
+        return h
+
+    def __setitem__(self, pos: Pos, h: int) -> None:
+        self.set_node(self.graph.node_id(pos), h)
+
+    def __delitem__(self, pos: Pos) -> None:
+        node = self.graph.node_id(pos)
+        if self._values[node] == UNSET:
+            raise KeyError(pos)
+        self._values[node] = UNSET
+
+    def __iter__(self) -> Iterator[Pos]:
+        for node in np.flatnonzero(np.asarray(self.values) != UNSET):
+            yield self.graph.pos(int(node))
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(np.asarray(self.values) != UNSET))
+
+
+def node_accessors(h_dict: Union[dict[Pos, int], HeuristicStore],
+                   graph: ConfigGraph) -> tuple[Callable[[int], Optional[int]], Callable[[int, int], None]]:
+    """推定コストを配置の番号で読み書きする関数の組（学習していない配置の読み出しはNone）
+
+    `HeuristicStore`は配列を直接読み書きし，辞書は配置の番号を位置に直して読み書きする．
+    """
+    if isinstance(h_dict, HeuristicStore):
+        return h_dict.get_node, h_dict.set_node
+
+    def get_h(node: int) -> Optional[int]:
+        return h_dict.get(graph.pos(node))
+
+    def set_h(node: int, h: int) -> None:
+        h_dict[graph.pos(node)] = h
+    return get_h, set_h
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    from base import State
+    from lrta_star import lrta_star_converge
+
+    initial_state = State(((1, 3), (2, 3)), 0, None)
+    goal_pos: Pos = ((4, 7), (5, 7))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir)/'h.npy'
+        for run in range(2):
+            # 2回目は1回目に収束した値から始めるので，1回の試行で終わる
+            store = HeuristicStore.open(path)
+            trials, converged = lrta_star_converge(initial_state, goal_pos, store, seed=run)
+            store.flush()
+            print(f"{run+1}回目の実行:\t{len(trials)}回の試行で{'収束' if converged else '未収束'}"
+                  f"\t学習した配置の数:\t{len(store)}")
+            print(f"\t最初の試行の解の経路コスト:\t{trials[0][0]}\t最後の試行の解の経路コスト:\t{trials[-1][0]}")
+            del store
@@ -1,71 +1,223 @@
 """LRTA*探索"""
 import random
 import sys
-from time import time
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional, Union
 
-import matplotlib.pyplot as plt
-from matplotlib import animation
+from animate import Frame, StreamingAnimation, replay_animation
+from base import Pos, State, config_graph
+from common.metrics import SearchMetrics, SearchObserver, report
+from learned_heuristic import HeuristicStore, node_accessors
 
-from base import Pos, State, get_count_artist, get_first_artist
+if TYPE_CHECKING:
+    from matplotlib import animation
 
 
-def lrta_star(initial_state: State, goal_pos: Pos, h_dict: dict[Pos, int], disp: bool = True) -> tuple[animation.ArtistAnimation, dict[Pos, int]]:
-    """LRTA*探索
+def lrta_star_search(initial_state: State, goal_pos: Pos, h_dict: Union[dict[Pos, int], HeuristicStore],
+                     metrics: Optional[SearchMetrics] = None,
+                     observer: Optional[SearchObserver[State]] = None,
+                     rng: Optional[random.Random] = None) -> tuple[State, int]:
+    """LRTA*探索の本体（図示しない）
 
     Args:
         initial_state (State): 初期状態
         goal_pos (Pos): 目標状態の位置
-        h_dict (dict[Pos, int]): 推定コスト・評価値の辞書
-        disp (bool, optional): 図示するか否か. Defaults to True.
+        h_dict (Union[dict[Pos, int], HeuristicStore]): 推定コスト・評価値の辞書（探索中に更新する）．
+            `HeuristicStore`の場合は位置を介さずに配置の番号で読み書きする
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は評価した隣接状態の数を記録する．
+            辺境を持たないので`duplicates`と`max_frontier`は0のままとする. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は移動するごとに現在の状態を，
+            隣接状態を評価するごとにその状態を渡して呼ぶ観測者. Defaults to None.
+        rng (Optional[random.Random], optional): 移動先を選ぶ乱数生成器. Defaults to None（`random`モジュール）.
 
     Returns:
-        animation.ArtistAnimation: 探索の様子と解の経路のアニメーション
+        tuple[State, int]: 目標状態と展開回数
     """
-    fig = plt.figure()
-    artists = [get_first_artist(initial_state, goal_pos)]
-
-    start_time = time()
-
+    graph = config_graph()
+    goal_node = graph.node_id(goal_pos)
+    if metrics is not None:
+        metrics.start_counting()
+    get_h, set_h = node_accessors(h_dict, graph)
+    choice = random.choice if rng is None else rng.choice
     extension_count = 0  # 展開した回数
     current_state = initial_state
     while True:
-        if disp:
-            h_artists = []
-            for pos, h in h_dict.items():
-                h_artists.extend(get_count_artist(pos, h))
-            artists.append(
-                artists[0] + current_state.get_current_position_artist()+h_artists)
-
-        if current_state.pos == goal_pos:
+        if observer is not None:
+            observer.on_expand(current_state, extension_count)
+
+        if current_state.node == goal_node:
             # 目標状態に到達したのでループを抜ける
-            break
+            return current_state, extension_count
 
         # 隣接状態の評価・選択
         min_f = sys.maxsize
-        next_states: list[State] = []
-        for adjacent_state in current_state.extend():
-            if adjacent_state.pos in h_dict:
-                h = h_dict.get(adjacent_state.pos)
-            else:
-                h = adjacent_state.heuristic(goal_pos)
+        next_nodes: list[int] = []
+        adjacent_nodes = graph.successors(current_state.node)
+        if metrics is not None:
+            metrics.generations += len(adjacent_nodes)
+        if observer is not None:
+            for adjacent_state in current_state.extend():
+                observer.on_generate(adjacent_state, current_state)
+        for node in adjacent_nodes:
+            h = get_h(node)
+            if h is None:
+                h = graph.heuristic(node, goal_node)
             f = 1 + h
             if f <= min_f:
                 min_f = f
-                next_states.append(adjacent_state)
+                next_nodes.append(node)
 
         # 一貫性の保持
-        h_dict[current_state.pos] = min_f
+        set_h(current_state.node, min_f)
 
         # 行為の実現
-        current_state: State = random.choice(next_states)
+        current_state = State.from_node(choice(next_nodes), current_state.depth+1, current_state)
         extension_count += 1
 
-    end_time = time()
-    print(f"計算時間:\t{(end_time-start_time)*1e+3:.3f} ms")
-    print(f"展開回数:\t{extension_count}")
-    print(f"解の経路コスト:\t{current_state.depth}")
 
-    return animation.ArtistAnimation(fig, artists), h_dict
+def is_converged(initial_state: State, goal_pos: Pos, h_dict: Union[dict[Pos, int], HeuristicStore]) -> bool:
+    """推定コストが以降の試行で変化しないか否か
+
+    `lrta_star_search`が移動先の候補とする隣接状態（評価値が最小のものに限らない）をたどり，
+    初期状態から訪れうる全ての状態で更新後の推定コストが現在の値と等しいかを調べる．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        h_dict (Union[dict[Pos, int], HeuristicStore]): 推定コスト・評価値の辞書
+
+    Returns:
+        bool: 初期状態から訪れうる状態の推定コストがどれも更新で変化しなければTrue
+    """
+    graph = config_graph()
+    goal_node = graph.node_id(goal_pos)
+    get_h, _set_h = node_accessors(h_dict, graph)
+
+    def h(node: int) -> int:
+        value = get_h(node)
+        return graph.heuristic(node, goal_node) if value is None else value
+
+    visited = {initial_state.node}
+    stack = [initial_state.node]
+    while stack:
+        node = stack.pop()
+        if node == goal_node:
+            continue
+        # `lrta_star_search`と同じ隣接状態の評価・選択
+        min_f = sys.maxsize
+        next_nodes: list[int] = []
+        for adjacent_node in graph.successors(node):
+            f = 1 + h(adjacent_node)
+            if f <= min_f:
+                min_f = f
+                next_nodes.append(adjacent_node)
+        if h(node) != min_f:
+            return False
+        for adjacent_node in next_nodes:
+            if adjacent_node not in visited:
+                visited.add(adjacent_node)
+                stack.append(adjacent_node)
+    return True
+
+
+def lrta_star_converge(initial_state: State, goal_pos: Pos, h_dict: Union[dict[Pos, int], HeuristicStore],
+                       seed: Optional[int] = None, max_trials: int = 1000) -> tuple[list[tuple[int, int]], bool]:
+    """推定コストが収束するまでLRTA*探索の試行を繰り返す
+
+    推定コストは試行の間で引き継ぎ，試行ごとに`is_converged`で以降の試行で変化しないかを調べる．
+    移動先は評価値が最小でない隣接状態からも選ばれうるので，1回の試行で変化しなかったことでは判定しない．
+    移動先の選択には`seed`で初期化した乱数生成器を用いるので，同じ`seed`と推定コストからは同じ試行となる．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        h_dict (Union[dict[Pos, int], HeuristicStore]): 推定コスト・評価値の辞書（試行ごとに更新する）
+        seed (Optional[int], optional): 乱数の種. Defaults to None.
+        max_trials (int, optional): 試行の回数の上限. Defaults to 1000.
+
+    Returns:
+        tuple[list[tuple[int, int]], bool]: 試行ごとの解の経路コストと展開回数，収束したか否か
+    """
+    rng = random.Random(seed)
+    trials: list[tuple[int, int]] = []
+    for _ in range(max_trials):
+        state, extension_count = lrta_star_search(initial_state, goal_pos, h_dict, rng=rng)
+        trials.append((state.depth, extension_count))
+        if is_converged(initial_state, goal_pos, h_dict):
+            return trials, True
+    return trials, False
+
+
+def lrta_star(initial_state: State, goal_pos: Pos, h_dict: dict[Pos, int],
+              disp: bool = True) -> tuple[Optional['animation.FuncAnimation'], dict[Pos, int]]:
+    """LRTA*探索
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        h_dict (dict[Pos, int]): 推定コスト・評価値の辞書
+        disp (bool, optional): 図示するか否か（Falseならmatplotlibを用いない）. Defaults to True.
+
+    Returns:
+        tuple[Optional[animation.FuncAnimation], dict[Pos, int]]: 探索の様子のアニメーション
+            （図示しない場合はNone）と推定コスト・評価値の辞書
+    """
+    frames = [Frame()]  # 最初のコマは作業環境のみ
+
+    class StepObserver(SearchObserver[State]):
+        previous: Optional[State] = None  # 1つ前の状態
+
+        def on_expand(self, current_state: State, order: int) -> None:
+            if self.previous is None:
+                labels = tuple(h_dict.items())
+            else:
+                # 推定コストが更新されたのは1つ前の位置のみ
+                labels = ((self.previous.pos, h_dict[self.previous.pos]),)
+            self.previous = current_state
+            frames.append(Frame(current_state.pos, True, labels=labels))
+
+    start_time = perf_counter()
+    current_state, extension_count = lrta_star_search(
+        initial_state, goal_pos, h_dict, observer=StepObserver() if disp else None)
+    end_time = perf_counter()
+    report(end_time-start_time, extension_count, current_state.depth)
+    if not disp:
+        return None, h_dict
+
+    return replay_animation(initial_state, goal_pos, frames), h_dict
+
+
+def lrta_star_stream(initial_state: State, goal_pos: Pos, h_dict: dict[Pos, int], path: Union[str, Path],
+                     **kwargs) -> tuple[State, int]:
+    """LRTA*探索の様子を1コマずつ動画に書き出す（全てのコマを保持しない）
+
+    各コマでは推定コストが更新された1つ前の位置の数字のみを書き換える．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        h_dict (dict[Pos, int]): 推定コスト・評価値の辞書（探索中に更新する）
+        path (Union[str, Path]): 書き出すファイルのパス
+        **kwargs: `animate.StreamingAnimation`に渡す引数（`fps`, `every`など）
+
+    Returns:
+        tuple[State, int]: 目標状態と展開回数
+    """
+    with StreamingAnimation(path, initial_state, goal_pos, **kwargs) as ani:
+        for pos, h in h_dict.items():
+            ani.label(pos, h)
+
+        class StepRecorder(SearchObserver[State]):
+            previous: Optional[State] = None  # 1つ前の状態
+
+            def on_expand(self, current_state: State, order: int) -> None:
+                if self.previous is not None:
+                    ani.label(self.previous.pos, h_dict[self.previous.pos])
+                self.previous = current_state
+                ani.step(current_state, current=True)
+
+        return lrta_star_search(initial_state, goal_pos, h_dict, observer=StepRecorder())
 
 
 if __name__ == '__main__':
@@ -75,6 +227,5 @@ if __name__ == '__main__':
     meth = path.splitext(path.basename(__file__))[0]
     h_dict = {}
     for k in range(3):
-        ani, h_dict = lrta_star(initial_state, goal_pos, h_dict)
-        # ani.save(f'{meth}_{k}.gif', writer="imagemagick")
-        ani.save(f'{meth}_{k}.mp4', writer="ffmpeg")
+        # lrta_star_stream(initial_state, goal_pos, h_dict, f'{meth}_{k}.gif')
+        lrta_star_stream(initial_state, goal_pos, h_dict, f'{meth}_{k}.mp4')
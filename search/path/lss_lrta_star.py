@@ -0,0 +1,180 @@
+"""先読みする実時間探索（LSS-LRTA*探索・RTAA*探索）
+
+LRTA*探索は隣接状態のみを評価して1マス移動するが，ここでは移動の前に現在の状態から
+高々`lookahead`回展開する局所的なA*探索を行い，閉じた状態の推定コストを更新してから，
+辺境で評価値が最小の状態まで移動する．推定コストの更新は
+LSS-LRTA*探索では辺境からのダイクストラ法，RTAA*探索では辺境の評価値の最小値からgを引いた値とする．
+"""
+import heapq
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Optional, Union
+
+from base import Pos, State, config_graph
+from common.metrics import SearchMetrics, SearchObserver, report
+from learned_heuristic import HeuristicStore, node_accessors
+
+# 推定コストの更新の方法
+UPDATES = ('dijkstra', 'rtaa')
+
+
+def lss_lrta_star_search(initial_state: State, goal_pos: Pos, h_dict: Union[dict[Pos, int], HeuristicStore],
+                         lookahead: int = 16, time_budget: Optional[float] = None, update: str = 'dijkstra',
+                         metrics: Optional[SearchMetrics] = None,
+                         observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """LSS-LRTA*探索の本体（図示しない）
+
+    1回の移動の前の計画は`lookahead`回の展開か`time_budget`秒のうち先に達した方で打ち切る．
+    時間で打ち切った場合も1回は展開するので必ず移動でき，推定コストの更新は閉じた状態の数に比例するので，
+    1回の計画の時間は`time_budget`と1回の展開・更新の時間の和で抑えられる．
+
+    Args:
+        initial_state (State): 初期状態
+        goal_pos (Pos): 目標状態の位置
+        h_dict (Union[dict[Pos, int], HeuristicStore]): 推定コスト・評価値の辞書（探索中に更新する）
+        lookahead (int, optional): 1回の移動の前に展開する回数の上限（1ならLRTA*探索と同じ更新となる）. Defaults to 16.
+        time_budget (Optional[float], optional): 1回の移動の前に局所的な探索を行う時間の上限（秒）.
+            Defaults to None（時間では打ち切らない）.
+        update (str, optional): 推定コストの更新の方法（'dijkstra'ならLSS-LRTA*探索，'rtaa'ならRTAA*探索）.
+            Defaults to 'dijkstra'.
+        metrics (Optional[SearchMetrics], optional): 与えられた場合は生成した子などの数と，
+            局所的な探索('lookahead')・推定コストの更新('update')の計算時間を記録する. Defaults to None.
+        observer (Optional[SearchObserver[State]], optional): 与えられた場合は移動するごとに現在の状態を渡して呼ぶ観測者.
+            Defaults to None.
+
+    Raises:
+        ValueError: `lookahead`が1未満か`update`が不明な場合，または目標状態に到達できない場合
+
+    Returns:
+        tuple[State, int]: 目標状態（親をたどると移動した経路となる）と展開回数の合計
+    """
+    if lookahead < 1:
+        raise ValueError(f'lookaheadは1以上としてください: {lookahead}')
+    if update not in UPDATES:
+        raise ValueError(f'不明な更新の方法です: {update}')
+    graph = config_graph()
+    goal_node = graph.node_id(goal_pos)
+    get_h, set_h = node_accessors(h_dict, graph)
+    reverse_indptr, reverse_indices = (memoryview(array) for array in graph.reverse())
+    if metrics is not None:
+        metrics.start_counting()
+
+    def h(node: int) -> int:
+        value = get_h(node)
+        return graph.heuristic(node, goal_node) if value is None else value
+
+    def phase(name: str):
+        return nullcontext() if metrics is None else metrics.phase(name)
+
+    extension_count = 0  # 展開した回数
+    current_state = initial_state
+    if observer is not None:
+        observer.on_expand(current_state, extension_count)
+    while current_state.node != goal_node:
+        with phase('lookahead'):
+            # 局所的なA*探索（fが等しい場合はgが大きい状態を先に展開する）
+            deadline = None if time_budget is None else perf_counter()+time_budget
+            start = current_state.node
+            g = {start: 0}
+            parent = {start: -1}
+            open_heap = [(h(start), 0, start)]
+            closed: set[int] = set()
+            while open_heap:
+                _f, neg_g, node = open_heap[0]
+                if node in closed or -neg_g != g[node]:
+                    # 既に展開したか，より小さいgで追加し直した古い要素
+                    heapq.heappop(open_heap)
+                    continue
+                if node == goal_node or len(closed) >= lookahead or \
+                        (closed and deadline is not None and perf_counter() >= deadline):
+                    break
+                heapq.heappop(open_heap)
+                closed.add(node)
+                extension_count += 1
+                successors = graph.successors(node)
+                child_g = g[node]+1
+                pushed = 0  # 辺境に追加した子の数
+                for child in successors:
+                    if child not in closed and child_g < g.get(child, child_g+1):
+                        g[child] = child_g
+                        parent[child] = node
+                        heapq.heappush(open_heap, (child_g+h(child), -child_g, child))
+                        pushed += 1
+                if metrics is not None:
+                    metrics.generations += len(successors)
+                    metrics.duplicates += len(successors)-pushed
+                    metrics.max_frontier = max(metrics.max_frontier, len(open_heap))
+            if not open_heap:
+                raise ValueError('目標状態に到達できません')
+            best_f, _neg_g, best = open_heap[0]
+
+        with phase('update'):
+            if update == 'rtaa':
+                for node in closed:
+                    set_h(node, best_f-g[node])
+            else:
+                # 辺境の状態から逆向きに，閉じた状態の推定コストを隣接状態の推定コスト+1の最小値とする
+                new_h = dict.fromkeys(closed, -1)  # -1は未確定
+                queue = [(h(node), node) for node in g if node not in closed]
+                heapq.heapify(queue)
+                remaining = len(closed)  # 推定コストが確定していない閉じた状態の数
+                while queue and remaining > 0:
+                    h_value, node = heapq.heappop(queue)
+                    if node in closed:
+                        if new_h[node] != h_value:
+                            continue
+                        remaining -= 1
+                    for predecessor in reverse_indices[reverse_indptr[node]:reverse_indptr[node+1]]:
+                        value = new_h.get(predecessor)
+                        if value is not None and (value < 0 or value > h_value+1):
+                            new_h[predecessor] = h_value+1
+                            heapq.heappush(queue, (h_value+1, predecessor))
+                for node, value in new_h.items():
+                    set_h(node, value)
+
+        # 行為の実現（辺境で評価値が最小の状態まで移動する）
+        route = []
+        node = best
+        while node != start:
+            route.append(node)
+            node = parent[node]
+        for node in reversed(route):
+            current_state = State.from_node(node, current_state.depth+1, current_state)
+            if observer is not None:
+                observer.on_expand(current_state, extension_count)
+    return current_state, extension_count
+
+
+def rtaa_star_search(initial_state: State, goal_pos: Pos, h_dict: Union[dict[Pos, int], HeuristicStore],
+                     lookahead: int = 16, time_budget: Optional[float] = None,
+                     metrics: Optional[SearchMetrics] = None,
+                     observer: Optional[SearchObserver[State]] = None) -> tuple[State, int]:
+    """RTAA*探索の本体（図示しない）
+
+    推定コストの更新が閉じた状態の数に比例する時間で済む点を除き，`lss_lrta_star_search`と同じである．
+    """
+    return lss_lrta_star_search(initial_state, goal_pos, h_dict, lookahead, time_budget, 'rtaa',
+                                metrics, observer)
+
+
+if __name__ == '__main__':
+    initial_state = State(((1, 3), (2, 3)), 0, None)
+    goal_pos: Pos = ((4, 7), (5, 7))
+    for update in UPDATES:
+        for lookahead in (1, 4, 16, 64):
+            # 移動先の選択に乱数を用いないので，推定コストが1回の試行で変化しなければ以降の試行も同じとなる
+            h_dict: dict[Pos, int] = {}
+            total_cost = 0  # 収束するまでの移動回数の合計
+            for trial in range(1, 1001):
+                before = dict(h_dict)
+                start_time = perf_counter()
+                state, extension_count = lss_lrta_star_search(
+                    State(initial_state.pos, 0, None), goal_pos, h_dict, lookahead, update=update)
+                end_time = perf_counter()
+                if trial == 1:
+                    print(f"{update} lookahead={lookahead}（1回目）")
+                    report(end_time-start_time, extension_count, state.depth)
+                total_cost += state.depth
+                if before == h_dict:
+                    break
+            print(f"収束までの試行回数:\t{trial}\t移動回数の合計:\t{total_cost}")